@@ -1,16 +1,27 @@
-from flask import Flask, render_template, request, jsonify
-import fastf1 as f1
-import pandas as pd
+from flask import Flask, Response, render_template, request, jsonify, url_for
+import click
+import hmac
 import os
 from dotenv import load_dotenv
-from datetime import datetime, timedelta, timezone
-from database import db, RaceResult, TrackStats, PositionData, CacheStatus
-from utils import (get_latest_race, get_team_color, format_time, 
-                   get_fastest_lap_driver, calculate_points, 
-                   get_formatted_time_for_driver)
-from track_utils import get_track_stats
-from strategy_utils import save_tyre_strategy_to_db, get_tyre_strategy_from_db, extract_tyre_strategy, get_pitstop_data, get_pitstop_data_from_db, save_pitstop_data_to_db
-from collections import defaultdict
+from database import db, RaceResult, TrackStats, PositionData, CacheStatus, ResultsFragment
+from latest_race import latest_race_resolver
+from schedule_store import schedule_store
+from session_registry import session_registry, load_session
+from fixture_store import fixture_store
+from disk_cache import disk_cache
+from track_utils import set_telemetry_mode, telemetry_load_stats
+from race_bundle import SECTIONS, build_race_bundle, parse_sections, revalidator
+from http_cache import race_response, schedule_response
+from payload_store import payload_store
+from fill_locks import fill_locks
+from warmup import get_past_events, warm_season, prefetch_worker
+from jobs import job_queue
+from live import live_races, ReplayFeed
+from ingest import run_ingestion
+from circuit_geometry import circuit_geometry_store
+from migrate_arrays import ensure_packed_columns, migrate_json_arrays
+from metrics import metrics, CONTENT_TYPE
+from server_timing import server_timing, timed
 
 app = Flask(__name__)
 
@@ -20,247 +31,101 @@ load_dotenv()  # Загружает переменные из .env
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Бюджет памяти реестра загруженных сессий FastF1 (в мегабайтах)
+app.config['SESSION_CACHE_MAX_MB'] = float(os.environ.get('SESSION_CACHE_MAX_MB', 1024))
+session_registry.configure(app.config['SESSION_CACHE_MAX_MB'])
+
 # Инициализация базы данных
 db.init_app(app)
 
+# Сколько секунд запрос ждет, пока кэш той же гонки заполняет другой процесс
+app.config['FILL_LOCK_TIMEOUT'] = float(os.environ.get('FILL_LOCK_TIMEOUT', 30))
+# Соединения отдельного пула блокировок заполнения, он же предел одновременных заполнений в процессе
+app.config['FILL_LOCK_POOL_SIZE'] = int(os.environ.get('FILL_LOCK_POOL_SIZE', 4))
+fill_locks.configure(app.config['FILL_LOCK_TIMEOUT'], app.config['FILL_LOCK_POOL_SIZE'])
+
 # Создаем таблицы при первом запуске
 with app.app_context():
     db.create_all()
     print("База данных PostgreSQL подключена и таблицы созданы")
 
-# Функции работы с кэшем 
-
-def should_use_cache(data_type, year, event, expire_days=1):
-    """Проверяет, можно ли использовать кэшированные данные из БД"""
-    cache_status = CacheStatus.query.filter_by(
-        data_type=data_type,
-        year=year,
-        event=event,
-        is_valid=True
-    ).first()
-
-    if not cache_status:
-        return False
-
-    # Проверяем срок годности кэша
-    now = datetime.now(timezone.utc)
-    last_updated = cache_status.last_updated
-    
-    if last_updated.tzinfo is None:
-        last_updated = last_updated.replace(tzinfo=timezone.utc)
-    
-    time_diff = now - last_updated
-    return time_diff < timedelta(days=expire_days)
-
-def update_cache_status(data_type, year, event, is_valid=True):
-    """Обновляет статус кэша в таблице CacheStatus"""
-    cache_status = CacheStatus.query.filter_by(
-        data_type=data_type,
-        year=year,
-        event=event
-    ).first()
-    
-    if cache_status:
-        cache_status.last_updated = datetime.now(timezone.utc)
-        cache_status.is_valid = is_valid
-    else:
-        cache_status = CacheStatus(
-            data_type=data_type,
-            year=year,
-            event=event,
-            is_valid=is_valid
-        )
-        db.session.add(cache_status)
-    
-    try:
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        print(f"Ошибка обновления статуса кэша: {e}")
-
-def save_race_results_to_db(year, event, session):
-    """Сохраняет результаты гонки в таблицу RaceResult"""
-    try:
-        print(f"Сохраняем результаты {event} {year} в PostgreSQL...")
-        
-        # Удаляем старые результаты этой гонки
-        RaceResult.query.filter_by(year=year, event=event).delete()
-        
-        # Определяем пилота с быстрым кругом
-        fastest_driver = get_fastest_lap_driver(session)
-        
-        # Сохраняем каждого гонщика
-        for idx, row in session.results.iterrows():
-            position = row['Position'] if pd.notna(row['Position']) else None
-            driver_name = row['FullName'] if 'FullName' in row and pd.notna(row['FullName']) else 'Unknown'
-            driver_number = row['DriverNumber'] if 'DriverNumber' in row and pd.notna(row['DriverNumber']) else ''
-            team = row['TeamName'] if 'TeamName' in row and pd.notna(row['TeamName']) else 'Unknown'
-            time_value = row['Time'] if 'Time' in row else None
-            
-            # Получаем аббревиатуру пилота для проверки быстрого круга
-            driver_abbr = None
-            if 'Abbreviation' in row and pd.notna(row['Abbreviation']):
-                driver_abbr = row['Abbreviation']
-            
-            # Проверяем, есть ли у этого пилота быстрый круг
-            has_fastest_lap = False
-            if driver_abbr and fastest_driver and driver_abbr == fastest_driver:
-                has_fastest_lap = True
-            
-            # Рассчитываем очки
-            points = calculate_points(position, has_fastest_lap)
-            
-            # Форматируем время отставания
-            formatted_time = get_formatted_time_for_driver(session, position, time_value, driver_number)
-            
-            # Сохраняем в БД
-            race_result = RaceResult(
-                year=year,
-                event=event,
-                driver_name=driver_name,
-                driver_number=driver_number,
-                team=team,
-                position=position,
-                time=formatted_time,
-                points=points,
-                fastest_lap=has_fastest_lap,
-                status='Finished'
-            )
-            
-            db.session.add(race_result)
-        
-        # Обновляем статус кэша
-        update_cache_status('race_results', year, event, True)
-        db.session.commit()
-        print(f"Результаты {event} {year} сохранены в PostgreSQL")
-        
-    except Exception as e:
-        db.session.rollback()
-        print(f"Ошибка сохранения результатов в БД: {e}")
-        update_cache_status('race_results', year, event, False)
-
-def get_race_results_from_db(year, event):
-    """Получает результаты гонки из таблицы RaceResult и возвращает HTML"""
-    results = RaceResult.query.filter_by(year=year, event=event)\
-        .order_by(RaceResult.position).all()
-    
-    if not results:
-        return None
-    
-    # Преобразуем в список словарей для таблицы
-    results_data = [result.to_dict() for result in results]
-    
-    # Создаем таблицу
-    if results_data:
-        df = pd.DataFrame(results_data)
-        return df.to_html(index=False, classes='f1-table')
-    
-    return None
-
-def save_track_stats_to_db(year, event, track_data):
-    """Сохраняет статистику трассы в таблицу TrackStats"""
-    try:
-        print(f"Сохраняем статистику трассы {event} {year} в PostgreSQL...")
-        
-        # Удаляем старые данные
-        TrackStats.query.filter_by(year=year, event=event).delete()
-        
-        # Сохраняем новые данные
-        track_info = track_data.get('track_info', {})
-        
-        track_stats = TrackStats(
-            year=year,
-            event=event,
-            track_name=track_info.get('name', event),
-            country=track_info.get('country', 'Unknown'),
-            location=track_info.get('location', 'Unknown'),
-            circuit_length=track_data.get('circuit_length', 'Нет данных'),
-            turns_count=track_data.get('turns_count', 'Нет данных'),
-            coordinates=track_data.get('coordinates', [])
-        )
-        
-        db.session.add(track_stats)
-        update_cache_status('track_stats', year, event, True)
-        db.session.commit()
-        print(f"Статистика трассы {event} {year} сохранена в PostgreSQL")
-        
-    except Exception as e:
-        db.session.rollback()
-        print(f"Ошибка сохранения статистики трассы: {e}")
-        update_cache_status('track_stats', year, event, False)
-
-def get_track_stats_from_db(year, event):
-    """Получает статистику трассы из таблицы TrackStats"""
-    track_stats = TrackStats.query.filter_by(year=year, event=event).first()
-    
-    if track_stats:
-        return track_stats.to_dict()
-    
-    return None
-
-def save_position_data_to_db(year, event, position_data):
-    """Сохраняет данные для графика позиций"""
-    try:
-        print(f"Сохраняем данные графика {event} {year} в PostgreSQL...")
-        
-        # Удаляем старые данные
-        PositionData.query.filter_by(year=year, event=event).delete()
-        
-        # Сохраняем новые данные
-        for driver_data in position_data:
-            position_entry = PositionData(
-                year=year,
-                event=event,
-                driver_code=driver_data['name'],
-                positions=driver_data['positions'],
-                laps=driver_data['laps'],
-                team=driver_data.get('team', ''),
-                color=driver_data.get('color', '#CCCCCC')
-            )
-            db.session.add(position_entry)
-        
-        update_cache_status('position_data', year, event, True)
-        db.session.commit()
-        print(f"Данные графика {event} {year} сохранены в PostgreSQL")
-        
-    except Exception as e:
-        db.session.rollback()
-        print(f"Ошибка сохранения данных графика: {e}")
-        update_cache_status('position_data', year, event, False)
-
-def get_position_data_from_db(year, event):
-    """Получает данные для графика позиций из БД"""
-    position_data = PositionData.query.filter_by(year=year, event=event).all()
-    
-    if not position_data:
-        return None
-    
-    # Преобразуем в формат для Plotly
-    data = []
-    for entry in position_data:
-        data.append({
-            'name': entry.driver_code,
-            'positions': entry.positions,
-            'laps': entry.laps,
-            'team': entry.team,
-            'color': entry.color
-        })
-    # Восстанавливаем тип линии для каждой команды    
-    team_drivers = defaultdict(list)
-    
-    for driver in data:
-        team_drivers[driver['team']].append(driver)
-    
-    for team, drivers in team_drivers.items():
-        for i, driver in enumerate(drivers):
-            driver['dash'] = 'solid' if i == 0 else 'dash'
-            
-    return data
-
-
-# if not os.path.exists('cache'):
-#     os.makedirs('cache')
-# f1.Cache.enable_cache('cache')
+# Телеметрия для карты трассы: 'fastest_lap' (только опорный круг) или 'full'
+app.config['TRACK_TELEMETRY_MODE'] = os.environ.get('TRACK_TELEMETRY_MODE', 'fastest_lap')
+set_telemetry_mode(app.config['TRACK_TELEMETRY_MODE'])
+
+# Дисковый кэш FastF1 (пустой F1_CACHE_DIR отключает его)
+app.config['F1_CACHE_DIR'] = os.environ.get('F1_CACHE_DIR', 'cache')
+app.config['F1_CACHE_MAX_GB'] = float(os.environ.get('F1_CACHE_MAX_GB', 10))
+app.config['F1_CACHE_MUTABLE_TTL_HOURS'] = float(os.environ.get('F1_CACHE_MUTABLE_TTL_HOURS', 24))
+disk_cache.configure(app.config['F1_CACHE_DIR'],
+                     app.config['F1_CACHE_MAX_GB'],
+                     app.config['F1_CACHE_MUTABLE_TTL_HOURS'])
+
+# Источник данных: 'fastf1' - серверы FastF1, 'record' - то же с записью снимков,
+# 'replay' - только снимки из F1_FIXTURE_DIR, без сети
+app.config['F1_DATA_SOURCE'] = os.environ.get('F1_DATA_SOURCE', 'fastf1')
+app.config['F1_FIXTURE_DIR'] = os.environ.get('F1_FIXTURE_DIR', 'fixtures')
+# Доля записанного времени загрузки FastF1, которую имитирует replay (0 - без задержки, 1 - как при записи)
+app.config['F1_REPLAY_LATENCY'] = float(os.environ.get('F1_REPLAY_LATENCY', 0))
+fixture_store.configure(app.config['F1_FIXTURE_DIR'],
+                        app.config['F1_DATA_SOURCE'],
+                        app.config['F1_REPLAY_LATENCY'])
+
+# Фоновое обновление последней гонки для главной страницы
+app.config['LATEST_RACE_BACKGROUND'] = os.environ.get('LATEST_RACE_BACKGROUND', '1') != '0'
+latest_race_resolver.init_app(app, background=app.config['LATEST_RACE_BACKGROUND'])
+
+# Фоновый прогрев кэша после окончания каждой гонки
+app.config['PREFETCH_BACKGROUND'] = os.environ.get('PREFETCH_BACKGROUND', '1') != '0'
+prefetch_worker.init_app(app, background=app.config['PREFETCH_BACKGROUND'])
+
+# Фоновое обновление устаревших разделов (stale-while-revalidate)
+app.config['REVALIDATE_BACKGROUND'] = os.environ.get('REVALIDATE_BACKGROUND', '1') != '0'
+revalidator.init_app(app, background=app.config['REVALIDATE_BACKGROUND'])
+
+# Brotli-версия сохраненных ответов разделов досжимается в фоне, а не в запросе
+app.config['PAYLOAD_BROTLI_BACKGROUND'] = os.environ.get('PAYLOAD_BROTLI_BACKGROUND', '1') != '0'
+payload_store.init_app(app, background=app.config['PAYLOAD_BROTLI_BACKGROUND'])
+
+# Холодные заполнения кэша уходят в очередь задач, запрос сразу получает 202
+app.config['JOB_QUEUE_BACKGROUND'] = os.environ.get('JOB_QUEUE_BACKGROUND', '1') != '0'
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+job_queue.init_app(app, background=app.config['JOB_QUEUE_BACKGROUND'], workers=app.config['JOB_WORKERS'])
+
+# Живой режим гонки: круги из источника и изменения подписчикам по SSE
+# Ускорение проигрывания по умолчанию: 1 - темп реальной гонки, 0 - без пауз
+app.config['LIVE_REPLAY_SPEED'] = float(os.environ.get('LIVE_REPLAY_SPEED', 10))
+# Токен для /live/start и /live/stop (заголовок X-Live-Token); без токена управление живым режимом выключено
+app.config['LIVE_CONTROL_TOKEN'] = os.environ.get('LIVE_CONTROL_TOKEN', '')
+live_races.init_app(app)
+
+# Метрики Prometheus: длительность запросов и размеры кэшей в памяти процесса
+metrics.init_app(app)
+
+# Заголовок Server-Timing, выборочный лог этапов и ?profile=1
+app.config['SERVER_TIMING_LOG_SAMPLE'] = float(os.environ.get('SERVER_TIMING_LOG_SAMPLE', 0))
+# ?profile=1 доступен анонимным клиентам, поэтому по умолчанию выключен (в режиме отладки работает всегда)
+app.config['REQUEST_PROFILING'] = os.environ.get('REQUEST_PROFILING', '0') == '1'
+server_timing.init_app(app, log_sample_rate=app.config['SERVER_TIMING_LOG_SAMPLE'],
+                       profiling=app.config['REQUEST_PROFILING'])
+metrics.gauge('f1_session_registry_entries', 'Сессии FastF1 в реестре',
+              lambda: session_registry.stats()['entries'])
+metrics.gauge('f1_session_registry_memory_bytes', 'Память сессий FastF1 в реестре',
+              lambda: session_registry.stats()['memory_bytes'])
+metrics.gauge('f1_session_registry_max_memory_bytes', 'Бюджет памяти реестра сессий',
+              lambda: session_registry.stats()['max_memory_bytes'])
+metrics.gauge('f1_session_registry_in_flight', 'Сессии FastF1, которые загружаются прямо сейчас',
+              lambda: session_registry.stats()['in_flight'])
+metrics.gauge('f1_schedule_cache_events', 'Этапы в кэше расписаний в памяти',
+              lambda: schedule_store.stats()['events'])
+metrics.gauge('f1_circuit_geometry_cache_entries', 'Геометрии трасс в кэше в памяти',
+              lambda: circuit_geometry_store.stats()['geometries'])
+metrics.gauge('f1_revalidation_pending', 'Разделы в очереди фонового обновления',
+              lambda: revalidator.stats()['pending'])
+metrics.gauge('f1_live_subscribers', 'Подписчики SSE живых гонок',
+              lambda: sum(race['subscribers'] for race in live_races.stats()))
+metrics.gauge('f1_jobs', 'Задачи холодного заполнения кэша по состояниям',
+              lambda: {(state,): count for state, count in job_queue.stats().items()}, ('state',))
 
 YEARS = list(range(2018, 2027))
 
@@ -268,91 +133,19 @@ YEARS = list(range(2018, 2027))
 
 @app.route('/')
 def index():
-    year, event = get_latest_race()
+    year, event = latest_race_resolver.get()
 
-    # Пробуем взять результаты из БД
-    if should_use_cache('race_results', year, event):
-        table_html = get_race_results_from_db(year, event)
-        if table_html:
-            print(f"Главная страница: используем кэшированные результаты из БД ({event} {year})")
-        else:
-            table_html = '<p>Нет кэшированных данных</p>'
+    # Результаты берутся из БД или считаются из сессии и сохраняются
+    bundle = build_race_bundle(year, event, ['results'])
+    if 'results' in bundle:
+        table_html = bundle['results']
     else:
-        # Если нет в кэше или устарели, загружаем новые
-        try:
-            session = f1.get_session(year, event, 'R')
-            session.load(laps=True)
-            
-            results = session.results[['Position', 'FullName', 'DriverNumber', 'TeamName', 'Time']]
-            
-            # Определяем пилота с быстрым кругом
-            fastest_driver = get_fastest_lap_driver(session)
-            
-            # Добавляем колонку с очками
-            points_list = []
-            
-            for idx, row in results.iterrows():
-                position = row['Position']
-                driver_abbr = None
-                
-                try:
-                    driver_number = row['DriverNumber']
-                    driver_info = session.results[session.results['DriverNumber'] == driver_number]
-                    if not driver_info.empty:
-                        driver_abbr = driver_info.iloc[0]['Abbreviation']
-                except Exception:
-                    pass
-
-                has_fastest_lap = False
-                if driver_abbr and fastest_driver and driver_abbr == fastest_driver:
-                    has_fastest_lap = True
-                
-                points = calculate_points(position, has_fastest_lap)
-                points_list.append(points)
-            
-            results['Points'] = points_list
-            
-            results = results.rename(columns={
-                'Position': 'Позиция',
-                'FullName': 'Имя',
-                'DriverNumber': 'Номер',
-                'TeamName': 'Команда',
-                'Time': 'Время',
-                'Points': 'Очки'
-            })
-            
-            results['Позиция'] = results['Позиция'].apply(
-                lambda x: int(x) if pd.notna(x) else 'нет информации'
-            )
-            
-            # Форматируем время
-            formatted_times = []
-            for idx, row in results.iterrows():
-                position = row['Позиция']
-                time_value = row['Время']
-                driver_number = row['Номер']
-                
-                formatted_time = get_formatted_time_for_driver(session, position, time_value, driver_number)
-                formatted_times.append(formatted_time)
-            
-            results['Время'] = formatted_times
-            
-            table_html = results[['Позиция', 'Имя', 'Номер', 'Команда', 'Время', 'Очки']].to_html(
-                index=False, 
-                classes='f1-table'
-            )
-            
-            # Сохраняем в БД 
-            save_race_results_to_db(year, event, session)
-            
-        except Exception as e:
-            print(f"Ошибка загрузки данных: {e}")
-            table_html = f'<p>Не удалось загрузить данные для {event} {year}.</p>'
+        print(f"Ошибка загрузки данных: {bundle['errors'].get('results')}")
+        table_html = f'<p>Не удалось загрузить данные для {event} {year}.</p>'
 
     # Получаем список гонок для выпадающего меню
     try:
-        schedule = f1.get_event_schedule(year)
-        events = schedule[schedule['EventName'] != 'Test']['EventName'].tolist()
+        events = schedule_store.get_events(year)
     except Exception:
         events = [event]
 
@@ -367,181 +160,179 @@ def index():
 def get_events():
     year = int(request.args.get('year', 2024))
     try:
-        schedule = f1.get_event_schedule(year)
-        events = schedule[schedule['EventName'] != 'Test']['EventName'].tolist()
+        events = schedule_store.get_events(year)
     except Exception:
         events = []
-    return jsonify(events)
+    return schedule_response(year, jsonify(events))
 
-@app.route('/results', methods=['POST'])
-def results():
-    year = int(request.form['year'])
-    event = request.form['event']
+@timed('serialize')
+def to_json(data):
+    """jsonify с замером этапа сериализации для Server-Timing"""
+    return jsonify(data)
 
-    # Пробуем взять из БД
-    if should_use_cache('race_results', year, event):
-        table_html = get_race_results_from_db(year, event)
-        if table_html:
-            print(f"/results: используем кэшированные данные из БД ({event} {year})")
-            return table_html
+def race_args():
+    """Год и гонка из строки запроса (GET) или формы (POST)"""
+    return int(request.values['year']), request.values['event']
+
+def cold_fill(year, event):
+    """
+    Обработчик холодного запроса для race_response: недостающие разделы
+    заполняются в очереди задач, а клиент получает 202 с адресом опроса.
+    С wait=1 данные собираются прямо в запросе, как без очереди.
+    """
+    def queue(data_types):
+        if request.values.get('wait') == '1':
+            return None
+        sections = [section for section, data_type in SECTIONS.items() if data_type in data_types]
+        job = job_queue.submit(year, event, sections)
+        if job is None:
+            return None
+        job['status_url'] = url_for('job_status', job_id=job['id'])
+        response = jsonify(job)
+        response.status_code = 202
+        response.headers['Location'] = job['status_url']
+        response.cache_control.no_store = True
+        return response
+    return queue
+
+def live_response(data):
+    """Данные живой гонки меняются с каждым кругом и не кэшируются"""
+    response = to_json(data)
+    response.cache_control.no_store = True
+    return response
+
+@app.route('/live/positions', methods=['GET'])
+def live_positions():
+    """
+    Поток SSE живой гонки: снимок позиций и стинтов, затем новые круги.
+    Если гонка не в живом режиме, 204 говорит браузеру не переподключаться.
+    """
+    year, event = race_args()
+    if not live_races.is_live(year, event):
+        return '', 204
+
+    last_event_id = request.headers.get('Last-Event-ID')
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    response = Response(live_races.stream(year, event, last_event_id), mimetype='text/event-stream')
+    response.cache_control.no_cache = True
+    # Прокси не должен буферизовать поток
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def live_control_denied():
+    """Ответ 403, если управление живым режимом выключено или токен запроса не совпадает"""
+    token = app.config['LIVE_CONTROL_TOKEN']
+    if not token:
+        return jsonify({'error': 'Управление живым режимом выключено (LIVE_CONTROL_TOKEN не задан)'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Live-Token', '').encode(), token.encode()):
+        return jsonify({'error': 'Неверный токен управления живым режимом'}), 403
+    return None
 
-    # Если нет в кэше или устарели, загружаем и кэшируем
+@app.route('/live/start', methods=['POST'])
+def live_start():
+    """Запускает живой режим гонки; source=replay проигрывает круги гонки с ускорением speed"""
+    denied = live_control_denied()
+    if denied:
+        return denied
     try:
-        session = f1.get_session(year, event, 'R')
-        session.load(laps=True)
-
-        results_data = session.results[['Position', 'FullName', 'DriverNumber', 'TeamName', 'Time']]
-        
-        fastest_driver = get_fastest_lap_driver(session)
-        
-        points_list = []
-        
-        for idx, row in results_data.iterrows():
-            position = row['Position']
-            driver_abbr = None
-            
-            try:
-                driver_number = row['DriverNumber']
-                driver_info = session.results[session.results['DriverNumber'] == driver_number]
-                if not driver_info.empty:
-                    driver_abbr = driver_info.iloc[0]['Abbreviation']
-            except Exception:
-                pass
-
-            has_fastest_lap = False
-            if driver_abbr and fastest_driver and driver_abbr == fastest_driver:
-                has_fastest_lap = True
-            
-            points = calculate_points(position, has_fastest_lap)
-            points_list.append(points)
-        
-        results_data['Points'] = points_list
-        
-        results_data = results_data.rename(columns={
-            'Position': 'Позиция',
-            'FullName': 'Имя',
-            'DriverNumber': 'Номер',
-            'TeamName': 'Команда',
-            'Time': 'Время',
-            'Points': 'Очки'
-        })
-        
-        results_data['Позиция'] = results_data['Позиция'].apply(
-            lambda x: int(x) if pd.notna(x) else 'нет информации'
-        )
-        
-        formatted_times = []
-        for idx, row in results_data.iterrows():
-            position = row['Позиция']
-            time_value = row['Время']
-            driver_number = row['Номер']
-            
-            formatted_time = get_formatted_time_for_driver(session, position, time_value, driver_number)
-            formatted_times.append(formatted_time)
-        
-        results_data['Время'] = formatted_times
-        
-        table_html = results_data[['Позиция', 'Имя', 'Номер', 'Команда', 'Время', 'Очки']].to_html(
-            index=False, 
-            classes='f1-table'
-        )
-        
-        # Сохраняем в БД
-        save_race_results_to_db(year, event, session)
-        
+        year, event = race_args()
+        source = request.values.get('source', 'replay')
+        if source != 'replay':
+            raise ValueError(f"Неизвестный источник живых данных: {source}")
+        speed = float(request.values.get('speed', app.config['LIVE_REPLAY_SPEED']))
+        feed = ReplayFeed.from_session(year, event, speed=speed)
+        return jsonify(live_races.start(year, event, feed))
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        table_html = f'<p>Ошибка: {e}</p>'
-
-    return table_html
-
-@app.route('/positions', methods=['POST'])
-def positions():
-    year = int(request.form['year'])
-    event = request.form['event']
+        return jsonify({'error': str(e)}), 500
 
-    # Пробуем взять из БД
-    if should_use_cache('position_data', year, event):
-        position_data = get_position_data_from_db(year, event)
-        if position_data:
-            print(f"/positions: используем кэшированные данные из БД ({event} {year})")
-            return jsonify(position_data)
+@app.route('/live/stop', methods=['POST'])
+def live_stop():
+    """Останавливает живой режим гонки"""
+    denied = live_control_denied()
+    if denied:
+        return denied
+    year, event = race_args()
+    info = live_races.stop(year, event)
+    if info is None:
+        return jsonify({'error': f'Живой режим {event} {year} не запущен'}), 404
+    return jsonify(info)
+
+@app.route('/live/status', methods=['GET'])
+def live_status():
+    """Живые гонки процесса: состояние, полученные круги, подписчики"""
+    return jsonify(live_races.stats())
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Состояние задачи заполнения кэша с прогрессом по этапам"""
+    job = job_queue.get(job_id)
+    if job is None:
+        response = jsonify({'id': job_id, 'state': 'unknown', 'error': 'Задача не найдена'})
+        response.status_code = 404
+    else:
+        response = jsonify(job)
+    response.cache_control.no_store = True
+    return response
 
-    # Если нет в кэше, загружаем и кэшируем
+@app.route('/race_bundle', methods=['GET', 'POST'])
+def race_bundle():
+    """Возвращает все разделы панели гонки одним ответом"""
     try:
-        session = f1.get_session(year, event, 'R')
-        session.load(telemetry=False, weather=False, messages=False)
-
-        data = []
-        for drv in session.drivers:
-            drv_laps = session.laps.pick_drivers(drv)
+        year, event = race_args()
+        sections = parse_sections(request.values.get('sections'))
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
 
-            if drv_laps.empty:
-                continue
+    def build():
+        bundle = build_race_bundle(year, event, sections)
+        return to_json(bundle), not bundle['errors']
 
-            abb = drv_laps['Driver'].iloc[0]
-            positions_list = drv_laps['Position'].tolist()
-            laps_list = drv_laps['LapNumber'].tolist()
+    return race_response(year, event, [SECTIONS[section] for section in sections], build,
+                         cold=cold_fill(year, event))
 
-            positions_list = [int(x) if pd.notna(x) else None for x in positions_list]
-            
-            team = session.results[session.results['DriverNumber'] == drv]['TeamName'].iloc[0]
-            color = get_team_color(team)
-
-            data.append({
-                'name': abb,
-                'positions': positions_list,
-                'laps': laps_list,
-                'color': color,
-                'team': team  
-            })
+@app.route('/results', methods=['GET', 'POST'])
+def results():
+    year, event = race_args()
 
-        # Группируем по командам для разных типов линий
-        from collections import defaultdict
-        team_drivers = defaultdict(list)
+    def build():
+        bundle = build_race_bundle(year, event, ['results'])
+        if 'results' in bundle:
+            return bundle['results'], True
+        return f"<p>Ошибка: {bundle['errors']['results']}</p>", False
 
-        for driver in data:
-            team_drivers[driver['team']].append(driver)
+    return race_response(year, event, [SECTIONS['results']], build, panel='results',
+                         cold=cold_fill(year, event))
 
-        for team, drivers in team_drivers.items():
-            for i, driver in enumerate(drivers):
-                driver['dash'] = 'solid' if i == 0 else 'dash'
+@app.route('/positions', methods=['GET', 'POST'])
+def positions():
+    year, event = race_args()
 
-        # Сохраняем в БД
-        save_position_data_to_db(year, event, data)
+    live = live_races.snapshot(year, event)
+    if live is not None:
+        return live_response(live['positions'])
 
-    except Exception as e:
-        print(f"Ошибка в /positions: {e}")
-        data = []
+    def build():
+        bundle = build_race_bundle(year, event, ['positions'])
+        return to_json(bundle.get('positions', [])), 'positions' in bundle
 
-    return jsonify(data)
+    return race_response(year, event, [SECTIONS['positions']], build, panel='positions',
+                         cold=cold_fill(year, event))
  
-@app.route('/track_stats', methods=['POST'])
+@app.route('/track_stats', methods=['GET', 'POST'])
 def track_stats():
     """Возвращает статистику трассы из кэша или загружает новую"""
-    year = int(request.form['year'])
-    event = request.form['event']
-    
-    # Пробуем взять из БД
-    if should_use_cache('track_stats', year, event):
-        stats_data = get_track_stats_from_db(year, event)
-        if stats_data:
-            print(f"/track_stats: используем кэшированные данные из БД ({event} {year})")
-            return jsonify(stats_data)
+    year, event = race_args()
     
-    # Если нет в кэше, загружаем и кэшируем
-    try:
-        stats_data = get_track_stats(year, event)
-        
-        if stats_data and 'error' not in stats_data:
-            # Сохраняем в БД
-            save_track_stats_to_db(year, event, stats_data)
-        
-        return jsonify(stats_data)
-    except Exception as e:
-        print(f"Ошибка в track_stats: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': str(e)})
+    def build():
+        bundle = build_race_bundle(year, event, ['track_stats'])
+        if 'track_stats' in bundle:
+            return to_json(bundle['track_stats']), True
+        return jsonify({'error': bundle['errors']['track_stats']}), False
+
+    return race_response(year, event, [SECTIONS['track_stats']], build, panel='track_stats',
+                         cold=cold_fill(year, event))
 
 @app.route('/clear_cache', methods=['POST'])
 def clear_cache():
@@ -552,11 +343,14 @@ def clear_cache():
         
         # Удаляем данные из всех таблиц
         RaceResult.query.filter_by(year=year, event=event).delete()
+        ResultsFragment.query.filter_by(year=year, event=event).delete()
+        payload_store.invalidate(year, event)
         TrackStats.query.filter_by(year=year, event=event).delete()
         PositionData.query.filter_by(year=year, event=event).delete()
         CacheStatus.query.filter_by(year=year, event=event).delete()
         
         db.session.commit()
+        session_registry.invalidate(year, event)
         
         return jsonify({'message': f'Кэш для {event} {year} очищен из PostgreSQL'})
     except Exception as e:
@@ -575,132 +369,125 @@ def cache_stats():
             'race_results_count': race_count,
             'track_stats_count': track_count,
             'position_data_count': position_count,
-            'total_cached_items': race_count + track_count + position_count
+            'total_cached_items': race_count + track_count + position_count,
+            'session_registry': session_registry.stats(),
+            'disk_cache': disk_cache.usage(),
+            'track_telemetry': telemetry_load_stats.snapshot(),
+            'payloads': payload_store.stats(),
+            'fill_locks': fill_locks.stats(),
+            'revalidation': revalidator.stats(),
+            'fixtures': fixture_store.stats()
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/tyre_strategy', methods=['POST'])
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Метрики процесса в текстовом формате Prometheus (без запросов к БД)"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+@app.route('/tyre_strategy', methods=['GET', 'POST'])
 def tyre_strategy():
     """Возвращает данные стратегии по шинам"""
-    year = int(request.form['year'])
-    event = request.form['event']
-    
-    # Пробуем взять из БД
-    if should_use_cache('tyre_strategy', year, event):
-        strategy_data = get_tyre_strategy_from_db(year, event)
-        if strategy_data:
-            print(f"/tyre_strategy: используем кэшированные данные из БД ({event} {year})")
-            return jsonify(strategy_data)
+    year, event = race_args()
+
+    live = live_races.snapshot(year, event)
+    if live is not None:
+        return live_response(live['tyre_strategy'])
     
-    # Если нет в кэше, загружаем и кэшируем
-    try:
-        session = f1.get_session(year, event, 'R')
-        session.load(laps=True)
-        
-        strategy_data = extract_tyre_strategy(session)
-        
-        # Сохраняем в БД
-        if strategy_data:
-            save_tyre_strategy_to_db(year, event, strategy_data)
-        
-        return jsonify(strategy_data)
-        
-    except Exception as e:
-        print(f"Ошибка в /tyre_strategy: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': str(e)})
+    def build():
+        bundle = build_race_bundle(year, event, ['tyre_strategy'])
+        if 'tyre_strategy' in bundle:
+            return to_json(bundle['tyre_strategy']), True
+        return jsonify({'error': bundle['errors']['tyre_strategy']}), False
 
-@app.route('/pitstop_analysis', methods=['POST'])
+    return race_response(year, event, [SECTIONS['tyre_strategy']], build, panel='tyre_strategy',
+                         cold=cold_fill(year, event))
+
+@app.route('/pitstop_analysis', methods=['GET', 'POST'])
 def pitstop_analysis():
     """Возвращает данные анализа пит-стопов"""
-    year = int(request.form['year'])
-    event = request.form['event']
-    
-    # Пробуем взять из БД
-    if should_use_cache('pitstop_data', year, event):
-        pitstop_data = get_pitstop_data_from_db(year, event)
-        if pitstop_data:
-            print(f"/pitstop_analysis: используем кэшированные данные из БД ({event} {year})")
-            # Анализируем данные из БД
-            return analyze_pitstop_data(pitstop_data)
-    
-    # Если нет в кэше, загружаем и кэшируем
-    try:
-        session = f1.get_session(year, event, 'R')
-        session.load(laps=True)
-        
-        # Получаем данные пит-стопов
-        pitstop_data = get_pitstop_data(session)
-        
-        # Сохраняем в БД
-        if pitstop_data:
-            save_pitstop_data_to_db(year, event, pitstop_data)
-        
-        # Анализируем и возвращаем
-        return analyze_pitstop_data(pitstop_data)
-        
-    except Exception as e:
-        print(f"Ошибка в /pitstop_analysis: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': str(e), 'teams': {}, 'drivers': {}, 'total_pitstops': 0})
-
-def analyze_pitstop_data(pitstop_data):
-    """Анализирует данные пит-стопов"""
-    team_analysis = {}
-    driver_analysis = {}
-    
-    for pitstop in pitstop_data:
-        team = pitstop['team']
-        driver = pitstop['driver']
-        
-        # Анализ по командам
-        if team not in team_analysis:
-            team_analysis[team] = {
-                'total_stops': 0,
-                'total_time': 0,
-                'avg_time': 0,
-                'stops': []
-            }
-        
-        team_analysis[team]['total_stops'] += 1
-        team_analysis[team]['total_time'] += pitstop['pitstop_time']
-        team_analysis[team]['stops'].append({
-            'driver': driver,
-            'time': pitstop['pitstop_time'],
-            'lap': pitstop['lap']
-        })
-        
-        # Анализ по гонщикам
-        if driver not in driver_analysis:
-            driver_analysis[driver] = {
-                'team': team,
-                'total_stops': 0,
-                'stops': []
-            }
-        
-        driver_analysis[driver]['total_stops'] += 1
-        driver_analysis[driver]['stops'].append({
-            'time': pitstop['pitstop_time'],
-            'lap': pitstop['lap'],
-            'compound': pitstop['compound']
-        })
+    year, event = race_args()
     
-    # Рассчитываем среднее время для команд
-    for team in team_analysis:
-        if team_analysis[team]['total_stops'] > 0:
-            team_analysis[team]['avg_time'] = (
-                team_analysis[team]['total_time'] / team_analysis[team]['total_stops']
-            )
-    
-    return jsonify({
-        'teams': team_analysis,
-        'drivers': driver_analysis,
-        'total_pitstops': len(pitstop_data)
-    })
+    def build():
+        bundle = build_race_bundle(year, event, ['pitstop_analysis'])
+        if 'pitstop_analysis' in bundle:
+            return to_json(bundle['pitstop_analysis']), True
+        return jsonify({'error': bundle['errors']['pitstop_analysis'], 'teams': {}, 'drivers': {}, 'total_pitstops': 0}), False
+
+    return race_response(year, event, [SECTIONS['pitstop_analysis']], build, panel='pitstop_analysis',
+                         cold=cold_fill(year, event))
     
     
+@app.cli.command('warm-cache')
+@click.option('--year', type=int, required=True, help='Сезон для прогрева')
+@click.option('--event', 'events', multiple=True, help='Гонка (можно указать несколько раз)')
+@click.option('--workers', type=int, default=2, show_default=True, help='Число параллельных загрузок')
+@click.option('--force', is_flag=True, help='Пересчитать даже уже прогретые гонки')
+def warm_cache_command(year, events, workers, force):
+    """Заранее заполняет кэш всех разделов для гонок сезона"""
+    reports = warm_season(app, year, events, workers=workers, force=force)
+    failed = [report['event'] for report in reports if report['errors']]
+    print(f"Прогрев {year} завершен: {len(reports) - len(failed)} ok, {len(failed)} с ошибками")
+
+@app.cli.command('ingest')
+@click.option('--from-year', type=int, default=2018, show_default=True, help='Первый сезон')
+@click.option('--to-year', type=int, default=YEARS[-1], show_default=True, help='Последний сезон')
+@click.option('--processes', type=int, default=None, help='Число процессов (по умолчанию - число ядер)')
+@click.option('--batch', 'batch_events', type=int, default=8, show_default=True, help='Гонок в одной транзакции записи')
+@click.option('--force', is_flag=True, help='Перезагрузить даже уже сохраненные гонки')
+def ingest_command(from_year, to_year, processes, batch_events, force):
+    """Загружает сезоны целиком в пуле процессов с пакетной записью в БД"""
+    run_ingestion(app, range(from_year, to_year + 1), processes=processes,
+                  batch_events=batch_events, force=force)
+
+@app.cli.command('register-layout')
+@click.option('--location', required=True, help='Площадка, как в расписании (например, Melbourne)')
+@click.option('--from-year', type=int, required=True, help='Сезон, с которого действует новая конфигурация')
+@click.option('--note', default=None, help='Описание изменения')
+def register_layout_command(location, from_year, note):
+    """Регистрирует изменение конфигурации трассы"""
+    circuit_geometry_store.register_layout_change(location, from_year, note)
+
+@app.cli.command('record-fixtures')
+@click.option('--year', type=int, required=True, help='Сезон для записи')
+@click.option('--event', 'events', multiple=True, help='Гонка (по умолчанию - все прошедшие гонки сезона)')
+@click.option('--telemetry', is_flag=True, help='Записать полную телеметрию (car_data и pos_data)')
+@click.option('--synthetic', type=int, default=None, help='Вместо FastF1 записать столько синтетических гонок')
+def record_fixtures_command(year, events, telemetry, synthetic):
+    """Записывает расписание и гонки сезона в F1_FIXTURE_DIR для F1_DATA_SOURCE=replay"""
+    if not app.config['F1_FIXTURE_DIR']:
+        raise click.UsageError('Не задан F1_FIXTURE_DIR')
+    fixture_store.configure(app.config['F1_FIXTURE_DIR'], 'record')
+
+    if synthetic:
+        from benchmarks.synthetic import offline_position_data, synthetic_schedule, synthetic_season
+        sessions = synthetic_season(year, rounds=synthetic)
+        fixture_store.record_schedule(year, synthetic_schedule(sessions))
+        with offline_position_data(sessions):
+            for session in sessions:
+                fixture_store.record_session(year, session.event['EventName'], 'R', session, {'laps'})
+        return
+
+    flags = {'laps', 'telemetry'} if telemetry else {'laps'}
+    with app.app_context():
+        schedule_store.ingest(year)
+        for event in events or get_past_events(year):
+            try:
+                load_session(year, event, 'R', flags)
+            except Exception as e:
+                print(f"Не удалось записать {event} {year}: {e}")
+
+@app.cli.command('migrate-packed-arrays')
+@click.option('--batch', 'batch_size', type=int, default=500, show_default=True, help='Строк в одной транзакции')
+@click.option('--schema-only', is_flag=True, help='Только добавить столбцы *_packed, без переноса строк')
+def migrate_packed_arrays_command(batch_size, schema_only):
+    """Добавляет упакованные столбцы и переносит в них позиции, круги, стинты и координаты из JSON"""
+    with app.app_context():
+        if schema_only:
+            ensure_packed_columns()
+        else:
+            migrate_json_arrays(batch_size)
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+Сравнение размера и времени чтения массивов кэша в JSON и в упакованном виде.
+
+    python -m benchmarks.bench_array_storage --rounds 24 --repeat 5
+
+Массивы (позиции и номера кругов по пилотам, стинты, координаты трассы)
+строятся теми же функциями, что пишут кэш, на синтетическом сезоне.
+"""
+import argparse
+import contextlib
+import io
+import json
+import time
+
+from benchmarks.synthetic import offline_position_data, synthetic_season
+from packed_arrays import (pack_coordinates, pack_laps, pack_positions, pack_stints, unpack_coordinates,
+                           unpack_laps, unpack_positions, unpack_stints)
+from race_bundle import build_position_data
+from strategy_utils import extract_tyre_strategy
+from track_utils import get_track_coordinates
+
+# Вид массива -> (упаковка, чтение в список, чтение в NumPy или None)
+KINDS = {
+    'positions': (pack_positions, unpack_positions, lambda blob: unpack_positions(blob, as_array=True)),
+    'laps': (pack_laps, unpack_laps, lambda blob: unpack_laps(blob, as_array=True)),
+    'stints': (pack_stints, unpack_stints, None),
+    'coordinates': (pack_coordinates, unpack_coordinates, lambda blob: unpack_coordinates(blob, as_array=True))
+}
+
+
+def _collect(sessions):
+    """Массивы в том виде, в каком их пишут save_*_to_db"""
+    values = {kind: [] for kind in KINDS}
+    with offline_position_data(sessions):
+        for session in sessions:
+            for driver_data in build_position_data(session):
+                values['positions'].append(driver_data['positions'])
+                values['laps'].append(driver_data['laps'])
+            values['stints'].extend(driver_data['stints'] for driver_data in extract_tyre_strategy(session))
+            values['coordinates'].append(get_track_coordinates(session, mode='fastest_lap'))
+    return values
+
+
+def _best(function, items, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            function(item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _check(kind, expected, actual):
+    if expected != actual:
+        raise SystemExit(f"Упакованные {kind} читаются не так, как JSON")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=24)
+    parser.add_argument('--laps', type=int, default=57)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        values = _collect(synthetic_season(rounds=args.rounds, n_laps=args.laps))
+
+    print(f"Гонок: {args.rounds}, кругов: {args.laps}")
+    print(f"{'массив':<13}{'строк':>7}{'JSON, байт':>12}{'упак., байт':>13}{'сжатие':>8}"
+          f"{'json.loads, мс':>16}{'список, мс':>12}{'NumPy, мс':>11}")
+    for kind, (pack, unpack, unpack_array) in KINDS.items():
+        texts = [json.dumps(value) for value in values[kind]]
+        blobs = [pack(value) for value in values[kind]]
+        _check(kind, [json.loads(text) for text in texts], [unpack(blob) for blob in blobs])
+
+        json_bytes = sum(len(text.encode('utf-8')) for text in texts)
+        packed_bytes = sum(len(blob) for blob in blobs)
+        json_ms = _best(json.loads, texts, args.repeat) * 1000
+        list_ms = _best(unpack, blobs, args.repeat) * 1000
+        array_ms = f"{_best(unpack_array, blobs, args.repeat) * 1000:>11.2f}" if unpack_array else f"{'-':>11}"
+        print(f"{kind:<13}{len(texts):>7}{json_bytes:>12}{packed_bytes:>13}{json_bytes / packed_bytes:>7.1f}x"
+              f"{json_ms:>16.2f}{list_ms:>12.2f}{array_ms}")
+
+
+if __name__ == '__main__':
+    main()
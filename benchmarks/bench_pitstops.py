@@ -0,0 +1,124 @@
+"""
+Сравнение векторного поиска пит-стопов с прежним построчным алгоритмом.
+
+    python -m benchmarks.bench_pitstops --rounds 24 --repeat 3
+"""
+import argparse
+import math
+import contextlib
+import io
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_season
+from strategy_utils import get_pitstop_data, get_season_pitstop_data
+
+LEGACY_DEFAULT_TIME = 2.5
+
+
+def legacy_get_pitstop_data(session):
+    """Прежняя реализация get_pitstop_data (повторные фильтры по номеру круга) без отладочного вывода"""
+    laps = session.laps
+    pitstop_data = []
+
+    for driver in sorted(laps['Driver'].unique()):
+        driver_laps = laps[laps['Driver'] == driver].copy()
+        driver_laps = driver_laps.sort_values('LapNumber')
+
+        stints = []
+        for _, lap in driver_laps.iterrows():
+            stint_num = int(lap['Stint']) if pd.notna(lap['Stint']) else 1
+            lap_num = int(lap['LapNumber']) if pd.notna(lap['LapNumber']) else 0
+            stints.append((lap_num, stint_num))
+
+        pitstops_for_driver = []
+        prev_stint = None
+        for lap_num, stint_num in stints:
+            if prev_stint is not None and stint_num != prev_stint:
+                pitstop_time_seconds = LEGACY_DEFAULT_TIME
+                pit_lap_data = driver_laps[driver_laps['LapNumber'] == lap_num]
+                if not pit_lap_data.empty:
+                    pit_lap = pit_lap_data.iloc[0]
+                    if pd.notna(pit_lap.get('PitOutTime')):
+                        in_lap_data = driver_laps[driver_laps['LapNumber'] == lap_num - 1]
+                        if not in_lap_data.empty:
+                            in_lap = in_lap_data.iloc[0]
+                            if pd.notna(in_lap.get('PitInTime')):
+                                pitstop_time_seconds = (pit_lap['PitOutTime'] - in_lap['PitInTime']).total_seconds()
+                pitstops_for_driver.append({'lap': lap_num, 'to_stint': stint_num, 'time': pitstop_time_seconds})
+            prev_stint = stint_num
+
+        for pitstop in pitstops_for_driver:
+            lap_data = driver_laps[driver_laps['LapNumber'] == pitstop['lap']]
+            if not lap_data.empty:
+                lap_row = lap_data.iloc[0]
+                pitstop_data.append({
+                    'driver': str(driver),
+                    'team': str(lap_row['Team']) if 'Team' in lap_row and pd.notna(lap_row['Team']) else 'Unknown',
+                    'lap': int(pitstop['lap']),
+                    'pitstop_time': pitstop['time'],
+                    'compound': str(lap_row['Compound']) if pd.notna(lap_row['Compound']) else 'UNKNOWN',
+                    'stint': int(pitstop['to_stint'])
+                })
+
+    pitstop_data.sort(key=lambda x: x['lap'])
+    return pitstop_data
+
+
+def _same_stops(expected, actual):
+    """
+    Совпадение с прежним результатом: остановки без времени раньше получали
+    2.5 с, а время сравнивается с точностью до последнего знака float.
+    """
+    if len(expected) != len(actual):
+        return False
+    for old, new in zip(expected, actual):
+        new_time = LEGACY_DEFAULT_TIME if new['pitstop_time'] is None else new['pitstop_time']
+        if not math.isclose(old['pitstop_time'], new_time, rel_tol=1e-12):
+            return False
+        if dict(old, pitstop_time=None) != dict(new, pitstop_time=None):
+            return False
+    return True
+
+
+def _timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            output = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=24)
+    parser.add_argument('--laps', type=int, default=57)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    sessions = synthetic_season(rounds=args.rounds, n_laps=args.laps)
+    total_laps = sum(len(session.laps) for session in sessions)
+
+    legacy_seconds, expected = _timed(lambda: [legacy_get_pitstop_data(s) for s in sessions], args.repeat)
+    vector_seconds, actual = _timed(lambda: [get_pitstop_data(s) for s in sessions], args.repeat)
+    season_seconds, season = _timed(lambda: get_season_pitstop_data(sessions), args.repeat)
+
+    if not all(_same_stops(old, new) for old, new in zip(expected, actual)):
+        raise SystemExit('Пит-стопы векторного расчета отличаются от прежнего алгоритма')
+    if [season[s.event['EventName']] for s in sessions] != actual:
+        raise SystemExit('Расчет сезона одним вызовом отличается от расчета по гонкам')
+
+    stops = sum(len(race) for race in actual)
+    untimed = sum(stop['pitstop_time'] is None for race in actual for stop in race)
+    print(f"Гонок: {len(sessions)}, кругов: {total_laps}, пит-стопов: {stops} (без времени: {untimed})")
+    print(f"  построчно        {legacy_seconds * 1000:9.1f} мс")
+    print(f"  по гонкам        {vector_seconds * 1000:9.1f} мс ({legacy_seconds / vector_seconds:.1f}x)")
+    print(f"  сезон за вызов   {season_seconds * 1000:9.1f} мс ({legacy_seconds / season_seconds:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Сравнение векторного расчета стендов с прежним построчным алгоритмом.
+
+    python -m benchmarks.bench_stints --rounds 24 --repeat 3
+"""
+import argparse
+import contextlib
+import io
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_season
+from strategy_utils import extract_tyre_strategy
+
+
+def legacy_extract_tyre_strategy(session):
+    """Прежняя реализация extract_tyre_strategy (iterrows по каждому гонщику) без отладочного вывода"""
+    laps = session.laps
+    strategy_data = []
+
+    for driver in laps['Driver'].unique():
+        driver_laps = laps[laps['Driver'] == driver].copy()
+        if driver_laps.empty:
+            continue
+        driver_laps = driver_laps.sort_values('LapNumber')
+
+        stints = []
+        current_stint = None
+        current_compound = None
+        stint_start_lap = 0
+        stint_length = 0
+
+        for idx, lap in driver_laps.iterrows():
+            lap_num = lap['LapNumber']
+            compound = lap['Compound'] if pd.notna(lap['Compound']) else 'UNKNOWN'
+            stint = lap['Stint'] if pd.notna(lap['Stint']) else 1
+
+            if current_stint is None or stint != current_stint or compound != current_compound:
+                if current_stint is not None and stint_length > 0:
+                    stints.append({
+                        'compound': current_compound,
+                        'stint_length': stint_length,
+                        'start_lap': stint_start_lap,
+                        'end_lap': stint_start_lap + stint_length - 1
+                    })
+                current_stint = stint
+                current_compound = compound
+                stint_start_lap = lap_num
+                stint_length = 1
+            else:
+                stint_length += 1
+
+        if current_stint is not None and stint_length > 0:
+            stints.append({
+                'compound': current_compound,
+                'stint_length': stint_length,
+                'start_lap': stint_start_lap,
+                'end_lap': stint_start_lap + stint_length - 1
+            })
+
+        try:
+            driver_number = driver_laps['DriverNumber'].iloc[0] if 'DriverNumber' in driver_laps.columns else None
+            if driver_number:
+                driver_abbr = session.get_driver(driver_number)["Abbreviation"]
+            else:
+                driver_abbr = driver
+        except Exception:
+            driver_abbr = driver
+
+        if stints:
+            strategy_data.append({
+                'driver': driver_abbr,
+                'stints': stints,
+                'total_laps': sum(stint['stint_length'] for stint in stints)
+            })
+
+    return strategy_data
+
+
+def _run(func, sessions, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            outputs = [func(session) for session in sessions]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=24)
+    parser.add_argument('--laps', type=int, default=57)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    sessions = synthetic_season(rounds=args.rounds, n_laps=args.laps)
+    total_laps = sum(len(session.laps) for session in sessions)
+
+    legacy_seconds, expected = _run(legacy_extract_tyre_strategy, sessions, args.repeat)
+    vector_seconds, actual = _run(extract_tyre_strategy, sessions, args.repeat)
+
+    if actual != expected:
+        raise SystemExit('Результаты векторного расчета отличаются от прежнего алгоритма')
+
+    print(f"Гонок: {len(sessions)}, кругов: {total_laps}")
+    print(f"  iterrows   {legacy_seconds * 1000:9.1f} мс")
+    print(f"  векторный  {vector_seconds * 1000:9.1f} мс")
+    print(f"  ускорение  {legacy_seconds / vector_seconds:9.1f}x, результаты совпадают")
+
+
+if __name__ == '__main__':
+    main()
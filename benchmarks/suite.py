@@ -0,0 +1,209 @@
+"""
+Набор офлайн-замеров горячих функций на синтетическом сезоне с сохраненной базовой линией.
+
+    python -m benchmarks.suite                   # сравнить с benchmarks/baseline.json
+    python -m benchmarks.suite --save-baseline   # записать новую базовую линию
+    python -m benchmarks.suite --rounds 24 --drivers 22 --laps 70 --only get_pitstop_data
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import offline_position_data, synthetic_season
+from race_bundle import build_results_html
+from strategy_utils import analyze_pitstop_data, extract_tyre_strategy, get_pitstop_data
+from track_utils import get_track_coordinates
+from utils import build_results_frame, calculate_points_for_session, check_laps_behind
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Замедление относительно базовой линии, после которого замер считается регрессией
+DEFAULT_THRESHOLD = 1.25
+
+
+class Case:
+    """
+    Один замер: setup(sessions) готовит входные данные вне замера,
+    run(state) выполняется repeat раз.
+    """
+
+    def __init__(self, name, run, setup=None):
+        self.name = name
+        self.run = run
+        self.setup = setup or (lambda sessions: sessions)
+
+
+def _prepare_telemetry(sessions):
+    # Поток позиций строится заранее, в замер входит только чтение круга и нормализация
+    for session in sessions:
+        session.pos_data
+    return sessions
+
+
+def _track_coordinates(sessions):
+    with offline_position_data(sessions):
+        return [get_track_coordinates(session, mode='fastest_lap') for session in sessions]
+
+
+def _laps_behind(sessions):
+    # Прежний цикл результатов: отдельный вызов на каждого пилота
+    return [[check_laps_behind(session, number) for number in session.results['DriverNumber']]
+            for session in sessions]
+
+
+CASES = [
+    Case('extract_tyre_strategy', lambda sessions: [extract_tyre_strategy(s) for s in sessions]),
+    Case('get_pitstop_data', lambda sessions: [get_pitstop_data(s) for s in sessions]),
+    Case('analyze_pitstop_data', lambda stops: [analyze_pitstop_data(s) for s in stops],
+         setup=lambda sessions: [get_pitstop_data(s) for s in sessions]),
+    Case('get_track_coordinates', _track_coordinates, setup=_prepare_telemetry),
+    Case('calculate_points_for_session', lambda sessions: [calculate_points_for_session(s) for s in sessions]),
+    Case('check_laps_behind', _laps_behind),
+    Case('build_results_frame', lambda sessions: [build_results_frame(s) for s in sessions]),
+    Case('build_results_html', lambda sessions: [build_results_html(s) for s in sessions]),
+]
+
+
+def _measure(case, state, repeat):
+    """Лучшее и медианное время в миллисекундах; вывод функций подавляется"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            case.run(state)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {'best_ms': round(min(samples), 3), 'median_ms': round(statistics.median(samples), 3)}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_suite(scale, repeat=5, only=None):
+    """Выполняет замеры на синтетическом сезоне заданного масштаба"""
+    sessions = synthetic_season(rounds=scale['rounds'], n_drivers=scale['drivers'],
+                                n_laps=scale['laps'], telemetry_hz=scale['telemetry_hz'])
+    results = {}
+    for case in CASES:
+        if only and case.name not in only:
+            continue
+        with contextlib.redirect_stdout(io.StringIO()):
+            state = case.setup(sessions)
+        results[case.name] = _measure(case, state, repeat)
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'repeat': repeat
+        },
+        'scale': scale,
+        'results': results
+    }
+
+
+def comparison_problem(report, baseline):
+    """Причина, по которой запуск нельзя сравнить с базовой линией, или None"""
+    if not baseline:
+        return "базовой линии нет"
+    if baseline.get('scale') != report['scale']:
+        return f"масштаб базовой линии {baseline.get('scale')} отличается от текущего {report['scale']}"
+    missing = [name for name in report['results'] if name not in baseline.get('results', {})]
+    if missing:
+        return f"в базовой линии нет замеров: {', '.join(missing)}"
+    return None
+
+
+def compare(report, baseline, threshold):
+    """Печатает сравнение с базовой линией и возвращает список регрессий"""
+    base_results = baseline.get('results', {}) if baseline else {}
+    if baseline and baseline.get('scale') != report['scale']:
+        base_results = {}
+
+    regressions = []
+    print(f"{'замер':<30}{'лучшее, мс':>12}{'медиана, мс':>13}{'база, мс':>11}{'изменение':>11}")
+    for name, result in report['results'].items():
+        line = f"{name:<30}{result['best_ms']:>12.2f}{result['median_ms']:>13.2f}"
+        base = base_results.get(name)
+        if base:
+            ratio = result['best_ms'] / base['best_ms']
+            mark = ' РЕГРЕССИЯ' if ratio > threshold else ''
+            line += f"{base['best_ms']:>11.2f}{ratio:>10.2f}x{mark}"
+            if mark:
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=6)
+    parser.add_argument('--drivers', type=int, default=20)
+    parser.add_argument('--laps', type=int, default=57)
+    parser.add_argument('--telemetry-hz', type=float, default=4.0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', action='append', choices=[case.name for case in CASES],
+                        help='Выполнить только этот замер (можно указать несколько раз)')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Файл базовой линии')
+    parser.add_argument('--save-baseline', action='store_true', help='Записать результаты как новую базовую линию')
+    parser.add_argument('--output', help='Записать результаты текущего запуска в JSON')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Допустимое замедление относительно базовой линии')
+    parser.add_argument('--check', action='store_true',
+                        help='Код выхода 1 при регрессии, 2 - если сравнить с базовой линией нельзя')
+    args = parser.parse_args()
+
+    scale = {'rounds': args.rounds, 'drivers': args.drivers, 'laps': args.laps,
+             'telemetry_hz': args.telemetry_hz}
+    report = run_suite(scale, repeat=args.repeat, only=args.only)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print(f"Масштаб: {scale}, коммит {report['meta']['commit']}")
+    if baseline:
+        print(f"База: коммит {baseline['meta'].get('commit')}, Python {baseline['meta'].get('python')}, "
+              f"pandas {baseline['meta'].get('pandas')}")
+    regressions = compare(report, None if args.save_baseline else baseline, args.threshold)
+    problem = None if args.save_baseline else comparison_problem(report, baseline)
+    if problem:
+        print(f"\nВНИМАНИЕ: сравнение с базовой линией не выполнено: {problem}. "
+              f"Запустите с масштабом базовой линии или обновите ее (--save-baseline)")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        if args.only and baseline and baseline.get('scale') == scale:
+            # Частичный запуск обновляет только свои замеры
+            report['results'] = dict(baseline['results'], **report['results'])
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"Базовая линия записана в {args.baseline}")
+    elif regressions:
+        print(f"Замедление больше {args.threshold:.2f}x: {', '.join(regressions)}")
+        if args.check:
+            sys.exit(1)
+    elif problem and args.check:
+        # --check без сравнения не должен проходить молча
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
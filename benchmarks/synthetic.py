@@ -0,0 +1,186 @@
+"""Синтетические сессии FastF1 для офлайн-замеров без сети и дискового кэша"""
+import contextlib
+import warnings
+
+import numpy as np
+import pandas as pd
+from fastf1.core import Laps, SessionResults
+
+TEAMS = ['Red Bull Racing', 'Ferrari', 'Mercedes', 'McLaren', 'Aston Martin',
+         'Alpine', 'Williams', 'Haas F1 Team', 'Kick Sauber', 'RB']
+COMPOUNDS = ['SOFT', 'MEDIUM', 'HARD', 'INTERMEDIATE', 'WET']
+
+
+class SyntheticSession:
+    """
+    Гонка со случайными, но воспроизводимыми (по seed) кругами и результатами.
+
+    Повторяет столбцы session.laps и session.results, которые читает
+    приложение, включая неудобные случаи реальных данных: пропуски
+    состава и номера стенда, сходы и смену состава внутри стенда.
+    Поток позиций (pos_data) с частотой telemetry_hz строится при первом
+    обращении, чтобы замеры без телеметрии не тратили на него время.
+    """
+
+    def __init__(self, year=2024, round_number=1, n_drivers=20, n_laps=57, seed=0, telemetry_hz=4.0):
+        rng = np.random.default_rng(seed)
+        self.event = {'EventName': f'Synthetic Grand Prix {round_number}', 'RoundNumber': round_number,
+                      'EventDate': pd.Timestamp(year=year, month=3, day=1) + pd.Timedelta(weeks=round_number)}
+        self.name = 'Race'
+        self.api_path = f'synthetic/{year}/{round_number}/'
+        self.telemetry_hz = telemetry_hz
+        self._seed = seed
+        self._pos_data = None
+
+        laps = []
+        results = []
+        # Порядок гонщиков в таблице кругов не алфавитный, как и в FastF1
+        for d in rng.permutation(n_drivers):
+            number = str(d + 1)
+            abbreviation = f'D{d:02d}'
+            team = TEAMS[d // 2 % len(TEAMS)]
+            laps_done = n_laps if rng.random() > 0.15 else int(rng.integers(5, n_laps))
+            window = np.arange(3, max(4, laps_done - 2))
+            stops = set(rng.choice(window, size=min(len(window), int(rng.integers(1, 4))), replace=False).tolist())
+            stint = 1
+            compound = COMPOUNDS[int(rng.integers(0, 3))]
+            time = pd.Timedelta(minutes=5)
+
+            for lap in range(1, laps_done + 1):
+                pit_in = pit_out = pd.NaT
+                if lap in stops:
+                    pit_in = time + pd.Timedelta(seconds=88)
+                if lap - 1 in stops:
+                    stint += 1
+                    compound = COMPOUNDS[int(rng.integers(0, 3))]
+                    pit_out = time + pd.Timedelta(seconds=20 + rng.random() * 6)
+                    # Иногда FastF1 теряет время въезда или выезда
+                    if rng.random() < 0.1:
+                        pit_out = pd.NaT
+                lap_time = pd.Timedelta(seconds=90 + rng.random() * 4)
+                time += lap_time
+                laps.append({
+                    'Driver': abbreviation,
+                    'DriverNumber': number,
+                    'Team': team,
+                    'LapNumber': float(lap),
+                    # Пропуск номера стенда встречается в первом стенде, где он трактуется как 1
+                    'Stint': np.nan if stint == 1 and rng.random() < 0.05 else float(stint),
+                    'Compound': compound if rng.random() > 0.01 else None,
+                    'TyreLife': float(lap),
+                    'LapTime': lap_time,
+                    'Time': time,
+                    'LapStartTime': time - lap_time,
+                    'PitInTime': pit_in,
+                    'PitOutTime': pit_out,
+                    'Position': float(int(rng.integers(1, n_drivers + 1))),
+                    'IsPersonalBest': False,
+                    'IsAccurate': True,
+                    'Deleted': False
+                })
+
+            results.append({
+                'DriverNumber': number,
+                'Abbreviation': abbreviation,
+                'FullName': f'Driver {d:02d}',
+                'TeamName': team,
+                'Position': np.nan,
+                'Time': pd.NaT,
+                'Status': 'Finished' if laps_done == n_laps else 'Retired',
+                'Laps': float(laps_done)
+            })
+
+        frame = pd.DataFrame(laps)
+        frame.loc[frame.groupby('Driver')['LapTime'].idxmin(), 'IsPersonalBest'] = True
+        self.laps = Laps(frame, session=self)
+
+        results = pd.DataFrame(results).sort_values('Laps', ascending=False, kind='mergesort')
+        results['Position'] = np.arange(1, len(results) + 1, dtype=float)
+        results['Time'] = [pd.Timedelta(hours=1, minutes=30) if i == 0 else pd.Timedelta(seconds=i * 2.5)
+                           for i in range(len(results))]
+        self.results = SessionResults(results.reset_index(drop=True))
+        self.drivers = self.results['DriverNumber'].tolist()
+
+    def get_driver(self, identifier):
+        return self.results[self.results['DriverNumber'] == identifier].iloc[0]
+
+    @property
+    def pos_data(self):
+        """Позиции машин {номер пилота: DataFrame}, как fastf1.api.position_data"""
+        if self._pos_data is None:
+            self._pos_data = _position_frames(self.laps, self.telemetry_hz, self._seed)
+        return self._pos_data
+
+
+def _track_shape(phase):
+    """Замкнутая кривая, похожая на трассу (координаты в дециметрах, как у FastF1)"""
+    angle = 2 * np.pi * phase
+    x = 5000 * np.cos(angle) + 1500 * np.cos(3 * angle)
+    y = 3000 * np.sin(angle) + 800 * np.sin(2 * angle)
+    return x, y
+
+
+def _position_frames(laps, hz, seed):
+    """Позиции каждого пилота на всей дистанции с шагом 1/hz секунды"""
+    rng = np.random.default_rng(seed + 1)
+    step = pd.Timedelta(seconds=1 / hz)
+    frames = {}
+    for number, driver_laps in laps.groupby('DriverNumber', sort=False):
+        starts = driver_laps['LapStartTime'].to_numpy()
+        ends = driver_laps['Time'].to_numpy()
+        times = pd.timedelta_range(starts[0], ends[-1], freq=step).to_numpy()
+        lap = np.clip(np.searchsorted(ends, times, side='left'), 0, len(ends) - 1)
+        phase = (times - starts[lap]) / (ends[lap] - starts[lap])
+        x, y = _track_shape(phase)
+        frames[str(number)] = pd.DataFrame({
+            'Date': pd.Timestamp('2024-03-01 15:00') + pd.to_timedelta(times),
+            'Status': 'OnTrack',
+            'X': x + rng.normal(0, 5, len(x)),
+            'Y': y + rng.normal(0, 5, len(y)),
+            'Z': rng.normal(0, 2, len(x)),
+            'Time': pd.to_timedelta(times),
+            'SessionTime': pd.to_timedelta(times)
+        })
+    return frames
+
+
+@contextlib.contextmanager
+def offline_position_data(sessions):
+    """
+    Подменяет fastf1.api.position_data потоками позиций синтетических сессий.
+
+    Так get_track_coordinates в режиме 'fastest_lap' работает без сети:
+    поток берется по session.api_path, как и настоящий.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        from fastf1 import api as f1_api
+
+    by_path = {session.api_path: session for session in sessions}
+    original = f1_api.position_data
+    f1_api.position_data = lambda path, *args, **kwargs: by_path[path].pos_data
+    try:
+        yield
+    finally:
+        f1_api.position_data = original
+
+
+def synthetic_season(year=2024, rounds=24, n_drivers=20, n_laps=57, seed=0, telemetry_hz=4.0):
+    """Сезон синтетических гонок с разными seed"""
+    return [SyntheticSession(year, round_number, n_drivers, n_laps, seed=seed * 1000 + round_number,
+                             telemetry_hz=telemetry_hz)
+            for round_number in range(1, rounds + 1)]
+
+
+def synthetic_schedule(sessions):
+    """Расписание сезона синтетических гонок в столбцах fastf1.get_event_schedule"""
+    return pd.DataFrame([{
+        'RoundNumber': session.event['RoundNumber'],
+        'Country': 'Synthetic',
+        'Location': f"Synthetic {session.event['RoundNumber']}",
+        'OfficialEventName': session.event['EventName'].upper(),
+        'EventDate': session.event['EventDate'],
+        'EventName': session.event['EventName'],
+        'EventFormat': 'conventional',
+        'Session5DateUtc': session.event['EventDate'] + pd.Timedelta(hours=13)
+    } for session in sessions])
@@ -0,0 +1,123 @@
+from collections import Counter
+
+from sqlalchemy import bindparam, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import db, CacheStatus, PitstopData, PositionData, RaceResult, TrackStats, TyreStrategy, utcnow
+
+# Столбцы, которые upsert не перезаписывает у существующей строки
+KEEP_ON_UPDATE = ('id', 'created_at')
+# Ключ строки внутри гонки: уникальное ограничение таблицы кэша без (year, event)
+RACE_ROW_KEYS = {
+    RaceResult: ('driver_name',),
+    PositionData: ('driver_code',),
+    TyreStrategy: ('driver_code',),
+    PitstopData: ('driver_code', 'lap'),
+    TrackStats: ()
+}
+
+
+def _insert(table):
+    """INSERT с ON CONFLICT для диалекта текущего соединения или None, если диалект его не знает"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table)
+    if dialect == 'sqlite':
+        return sqlite.insert(table)
+    return None
+
+
+def _dedupe(table, rows, keys):
+    """Оставляет последнюю строку каждого ключа; о повторах пишет в лог, а не теряет их молча"""
+    unique = {tuple(row[key] for key in keys): row for row in rows}
+    if len(unique) < len(rows):
+        counts = Counter(tuple(row[key] for key in keys) for row in rows)
+        repeated = [value for value, count in counts.items() if count > 1]
+        print(f"Предупреждение: {table.name}: {len(rows) - len(unique)} строк с повторным ключом "
+              f"({', '.join(keys)}) заменены последними: {repeated[:5]}")
+    return list(unique.values())
+
+
+def _update_then_insert(table, rows, keys, update, onupdate):
+    """
+    Upsert без ON CONFLICT: существующие по ключу строки обновляются
+    одним executemany UPDATE, остальные вставляются обычным INSERT.
+    """
+    key_columns = tuple_(*(table.c[key] for key in keys))
+    existing = set(db.session.execute(
+        select(*(table.c[key] for key in keys)).where(key_columns.in_([tuple(row[key] for key in keys) for row in rows]))
+    ).tuples())
+    updated = [row for row in rows if tuple(row[key] for key in keys) in existing]
+    inserted = [row for row in rows if tuple(row[key] for key in keys) not in existing]
+    if updated and (update or onupdate):
+        where = [table.c[key] == bindparam(f'{key}_key') for key in keys]
+        stmt = table.update().where(*where).values(
+            {**{name: bindparam(f'{name}_value') for name in update}, **onupdate})
+        db.session.execute(stmt, [{**{f'{key}_key': row[key] for key in keys},
+                                   **{f'{name}_value': row[name] for name in update}} for row in updated])
+    if inserted:
+        db.session.execute(table.insert(), inserted)
+
+
+def upsert(model, rows, keys):
+    """
+    Пишет строки одним INSERT ... ON CONFLICT (keys) DO UPDATE.
+
+    keys - столбцы уникального ограничения модели. Строки передаются
+    как executemany: выражение компилируется один раз (кэш SQLAlchemy),
+    а драйвер PostgreSQL собирает их в многострочные VALUES.
+    Строки с одинаковым ключом схлопываются (побеждает последняя, повторы
+    пишутся в лог), столбцы с onupdate получают текущее время. Диалекты
+    без ON CONFLICT получают UPDATE существующих строк и INSERT остальных.
+    Не делает commit; возвращает число строк.
+    """
+    if not rows:
+        return 0
+    table = model.__table__
+    rows = _dedupe(table, rows, keys)
+    update = [name for name in rows[0] if name not in keys and name not in KEEP_ON_UPDATE]
+    now = utcnow()
+    onupdate = {column.name: now for column in table.columns
+                if column.onupdate is not None and column.name not in update}
+
+    stmt = _insert(table)
+    if stmt is None:
+        _update_then_insert(table, rows, keys, update, onupdate)
+        return len(rows)
+    values = {name: stmt.excluded[name] for name in update}
+    values.update(onupdate)
+    db.session.execute(stmt.on_conflict_do_update(index_elements=list(keys), set_=values), rows)
+    return len(rows)
+
+
+def replace_race_rows(model, year, event, rows):
+    """
+    Заменяет строки гонки без delete-then-insert: новые и изменившиеся
+    строки пишутся upsert по уникальному ключу (RACE_ROW_KEYS), а
+    удаляются только те, которых нет в новом наборе. Не делает commit.
+    """
+    keys = RACE_ROW_KEYS[model]
+    rows = [dict(row, year=year, event=event) for row in rows]
+    written = upsert(model, rows, ('year', 'event') + tuple(keys))
+
+    stale = model.query.filter_by(year=year, event=event)
+    if rows and not keys:
+        # Одна строка на гонку: upsert уже заменил ее
+        return written
+    if len(keys) == 1:
+        stale = stale.filter(getattr(model, keys[0]).notin_({row[keys[0]] for row in rows}))
+    elif keys:
+        columns = tuple_(*(getattr(model, key) for key in keys))
+        stale = stale.filter(columns.notin_({tuple(row[key] for key in keys) for row in rows}))
+    stale.delete(synchronize_session=False)
+    return written
+
+
+def mark_cache_status(data_types, year, event, is_valid=True):
+    """Upsert CacheStatus разделов гонки в текущей транзакции (без commit)"""
+    now = utcnow()
+    return upsert(CacheStatus, [
+        {'data_type': data_type, 'year': year, 'event': event, 'is_valid': is_valid, 'last_updated': now}
+        for data_type in data_types
+    ], ('data_type', 'year', 'event'))
+
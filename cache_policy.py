@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta, timezone
+
+from schedule_store import schedule_store
+from server_timing import timed
+
+# Гоночный уик-энд начинается примерно за три дня до гонки
+WEEKEND_BEFORE_RACE = timedelta(days=3)
+# Первые часы после гонки данные FastF1 еще догружаются
+LIVE_AFTER_RACE = timedelta(hours=6)
+# Через неделю после гонки результаты с учетом штрафов окончательные
+FINAL_AFTER_RACE = timedelta(days=7)
+
+# Срок годности кэша по состоянию гонки и типу данных.
+# Для окончательной гонки срока нет: см. is_cache_entry_fresh.
+CACHE_TTL = {
+    'live': {
+        'race_results': timedelta(minutes=10),
+        'position_data': timedelta(minutes=10),
+        'tyre_strategy': timedelta(minutes=10),
+        'pitstop_data': timedelta(minutes=10),
+        'track_stats': timedelta(days=1)
+    },
+    'recent': {
+        'race_results': timedelta(hours=6),
+        'position_data': timedelta(hours=6),
+        'tyre_strategy': timedelta(hours=6),
+        'pitstop_data': timedelta(hours=6),
+        'track_stats': timedelta(days=7)
+    }
+}
+DEFAULT_TTL = {'live': timedelta(minutes=10), 'recent': timedelta(hours=6)}
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _naive_utc(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+@timed('race_state')
+def race_state(year, event, now=None):
+    """
+    Состояние гонки для политики кэша и время окончания гонки (или None).
+
+    'live' - идет уик-энд или первые часы после гонки, 'recent' - гонка
+    прошла, но результаты еще могут уточняться, 'final' - данные больше
+    не меняются.
+    """
+    now = now or _utcnow()
+    try:
+        event_info = schedule_store.get_event(year, event)
+    except Exception:
+        event_info = None
+
+    race_date = event_info and (event_info['race_date_utc'] or event_info['event_date'])
+    if race_date is None:
+        # Без расписания ориентируемся на сезон
+        return ('final' if int(year) < now.year else 'recent'), None
+
+    race_date = _naive_utc(race_date)
+    if now < race_date + LIVE_AFTER_RACE:
+        return ('live' if now >= race_date - WEEKEND_BEFORE_RACE else 'recent'), race_date
+    if now < race_date + FINAL_AFTER_RACE:
+        return 'recent', race_date
+    return 'final', race_date
+
+
+def cache_ttl(data_type, state):
+    """Срок годности записи кэша типа data_type (None - бессрочно)"""
+    if state == 'final':
+        return None
+    return CACHE_TTL.get(state, {}).get(data_type, DEFAULT_TTL[state])
+
+
+def is_cache_entry_fresh(cache_status, year, event, now=None):
+    """
+    Проверяет запись CacheStatus по политике сроков годности.
+
+    Кэш окончательной гонки бессрочный, если он заполнен уже после того,
+    как гонка стала окончательной; более ранняя запись один раз
+    перепроверяется, чтобы подхватить поздние изменения результатов.
+    """
+    if not cache_status or not cache_status.is_valid:
+        return False
+
+    now = now or _utcnow()
+    last_updated = _naive_utc(cache_status.last_updated)
+    state, race_date = race_state(year, event, now)
+
+    if state == 'final':
+        return race_date is None or last_updated >= race_date + FINAL_AFTER_RACE
+
+    return now - last_updated < cache_ttl(cache_status.data_type, state)
@@ -0,0 +1,287 @@
+import hashlib
+import html
+import json
+import pandas as pd
+from datetime import datetime, timezone
+from collections import defaultdict
+from database import db, RaceResult, TrackStats, PositionData, CacheStatus, ResultsFragment
+from bulk_write import mark_cache_status, replace_race_rows
+from packed_arrays import pack_coordinates, pack_laps, pack_positions
+from utils import build_results_frame
+from cache_policy import is_cache_entry_fresh
+from server_timing import timed
+
+# Функции работы с кэшем 
+
+def is_cache_fresh(cache_status, year, event):
+    """Проверяет срок годности записи CacheStatus по политике кэша (см. cache_policy)"""
+    return is_cache_entry_fresh(cache_status, year, event)
+
+def should_use_cache(data_type, year, event):
+    """Проверяет, можно ли использовать кэшированные данные из БД"""
+    cache_status = CacheStatus.query.filter_by(
+        data_type=data_type,
+        year=year,
+        event=event,
+        is_valid=True
+    ).first()
+
+    return is_cache_fresh(cache_status, year, event)
+
+@timed('cache_status')
+def get_cache_statuses(year, event, data_types):
+    """Возвращает действующие записи CacheStatus гонки по типам данных без учета срока (одним запросом)"""
+    statuses = CacheStatus.query.filter(
+        CacheStatus.year == year,
+        CacheStatus.event == event,
+        CacheStatus.data_type.in_(list(data_types)),
+        CacheStatus.is_valid.is_(True)
+    ).all()
+
+    return {status.data_type: status for status in statuses}
+
+def get_fresh_data_types(year, event, data_types):
+    """Возвращает множество типов данных гонки со свежим кэшем (одним запросом)"""
+    statuses = get_cache_statuses(year, event, data_types)
+    return {data_type for data_type, status in statuses.items() if is_cache_fresh(status, year, event)}
+
+def update_cache_status(data_type, year, event, is_valid=True):
+    """Обновляет статус кэша в таблице CacheStatus отдельной транзакцией"""
+    try:
+        mark_cache_status([data_type], year, event, is_valid)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ошибка обновления статуса кэша: {e}")
+
+def build_race_result_rows(year, event, session, results=None):
+    """Строит строки таблицы RaceResult из сессии (без обращения к БД)"""
+    if results is None:
+        results = build_results_frame(session)
+    
+    rows = []
+    for position, driver_name, driver_number, team, formatted_time, points, fastest_lap in zip(
+            results['position'].tolist(), results['full_name'].tolist(), results['driver_number'].tolist(),
+            results['team'].tolist(), results['formatted_time'].tolist(), results['points'].tolist(),
+            results['fastest_lap'].tolist()):
+        rows.append({
+            'year': year,
+            'event': event,
+            # Имя - ключ строки гонки: без номера все пилоты без имени схлопнулись бы в одну строку
+            'driver_name': driver_name if pd.notna(driver_name) else (
+                f'Unknown #{driver_number}' if pd.notna(driver_number) and driver_number != '' else 'Unknown'),
+            'driver_number': driver_number if pd.notna(driver_number) else '',
+            'team': team if pd.notna(team) else 'Unknown',
+            'position': int(position) if pd.notna(position) else None,
+            'time': formatted_time,
+            'points': points,
+            'fastest_lap': bool(fastest_lap),
+            'status': 'Finished'
+        })
+    
+    return rows
+
+def position_data_rows(position_data):
+    """Строки PositionData из данных графика позиций (без year/event)"""
+    return [{
+        'driver_code': driver_data['name'],
+        'positions_packed': pack_positions(driver_data['positions'] or []),
+        'laps_packed': pack_laps(driver_data['laps'] or []),
+        'positions_json': None,
+        'laps_json': None,
+        'team': driver_data.get('team', ''),
+        'color': driver_data.get('color', '#CCCCCC')
+    } for driver_data in position_data]
+
+def track_stats_rows(event, track_data):
+    """Строка TrackStats из статистики трассы (без year/event)"""
+    if not track_data:
+        return []
+    track_info = track_data.get('track_info', {})
+    turns_count = track_data.get('turns_count')
+    return [{
+        'track_name': track_info.get('name', event),
+        'country': track_info.get('country', 'Unknown'),
+        'location': track_info.get('location', 'Unknown'),
+        'circuit_length': track_data.get('circuit_length', 'Нет данных'),
+        # Вместо числа поворотов может прийти 'Нет данных'
+        'turns_count': turns_count if isinstance(turns_count, int) else None,
+        'coordinates_packed': pack_coordinates(track_data.get('coordinates') or []),
+        'coordinates_json': None
+    }]
+
+@timed('db_save')
+def save_race_results_to_db(year, event, session, results=None):
+    """
+    Сохраняет результаты гонки в таблицу RaceResult (results - готовая build_results_frame).
+
+    Вместе со строками в той же транзакции сохраняется HTML таблицы;
+    возвращает его или None при ошибке.
+    """
+    try:
+        print(f"Сохраняем результаты {event} {year} в PostgreSQL...")
+        
+        # Строки, фрагмент и статус кэша пишутся одной транзакцией
+        replace_race_rows(RaceResult, year, event,
+                          build_race_result_rows(year, event, session, results))
+        table_html = store_results_fragment(year, event)
+        mark_cache_status(['race_results'], year, event)
+        db.session.commit()
+        print(f"Результаты {event} {year} сохранены в PostgreSQL")
+        return table_html
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ошибка сохранения результатов в БД: {e}")
+        update_cache_status('race_results', year, event, False)
+        return None
+
+# Столбцы таблицы результатов (ключи RaceResult.to_dict)
+RESULTS_COLUMNS = ['Позиция', 'Имя', 'Номер', 'Команда', 'Время', 'Очки']
+
+def render_results_html(rows):
+    """
+    Строит HTML таблицы результатов без pandas.
+
+    Разметка совпадает с DataFrame.to_html(index=False, classes='f1-table'),
+    которым таблица строилась раньше, поэтому стили и скрипты не меняются.
+    """
+    lines = ['<table border="1" class="dataframe f1-table">',
+             '  <thead>',
+             '    <tr style="text-align: right;">']
+    lines += [f'      <th>{html.escape(column, quote=False)}</th>' for column in RESULTS_COLUMNS]
+    lines += ['    </tr>', '  </thead>', '  <tbody>']
+    for row in rows:
+        lines.append('    <tr>')
+        lines += [f'      <td>{html.escape(str(row[column]), quote=False)}</td>' for column in RESULTS_COLUMNS]
+        lines.append('    </tr>')
+    lines += ['  </tbody>', '</table>']
+    return '\n'.join(lines)
+
+def results_content_hash(rows):
+    """Хэш содержимого таблицы результатов"""
+    payload = json.dumps(rows, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _race_result_rows_from_db(year, event):
+    results = RaceResult.query.filter_by(year=year, event=event)\
+        .order_by(RaceResult.position).all()
+    return [result.to_dict() for result in results]
+
+def store_results_fragment(year, event):
+    """
+    Перестраивает сохраненный HTML результатов гонки по строкам RaceResult.
+
+    Вызывается в транзакции, которая меняет RaceResult, и не делает
+    commit сама. Если хэш строк не изменился, HTML не перестраивается.
+    """
+    rows = _race_result_rows_from_db(year, event)
+    fragment = ResultsFragment.query.filter_by(year=year, event=event).first()
+    
+    if not rows:
+        if fragment:
+            db.session.delete(fragment)
+        return None
+    
+    content_hash = results_content_hash(rows)
+    if fragment and fragment.content_hash == content_hash:
+        return fragment.html
+    
+    table_html = render_results_html(rows)
+    if fragment is None:
+        fragment = ResultsFragment(year=year, event=event)
+        db.session.add(fragment)
+    fragment.content_hash = content_hash
+    fragment.html = table_html
+    fragment.created_at = datetime.now(timezone.utc)
+    return table_html
+
+@timed('db_read')
+def get_race_results_from_db(year, event):
+    """Получает HTML результатов гонки: готовый фрагмент или строки RaceResult"""
+    fragment = ResultsFragment.query.filter_by(year=year, event=event).first()
+    if fragment:
+        return fragment.html
+    
+    # Фрагмента еще нет (результаты сохранены до его появления) - строим и сохраняем
+    try:
+        table_html = store_results_fragment(year, event)
+        db.session.commit()
+        return table_html
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ошибка сохранения HTML результатов: {e}")
+        rows = _race_result_rows_from_db(year, event)
+        return render_results_html(rows) if rows else None
+
+@timed('db_save')
+def save_track_stats_to_db(year, event, track_data):
+    """Сохраняет статистику трассы в таблицу TrackStats"""
+    try:
+        print(f"Сохраняем статистику трассы {event} {year} в PostgreSQL...")
+        
+        replace_race_rows(TrackStats, year, event, track_stats_rows(event, track_data))
+        mark_cache_status(['track_stats'], year, event)
+        db.session.commit()
+        print(f"Статистика трассы {event} {year} сохранена в PostgreSQL")
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ошибка сохранения статистики трассы: {e}")
+        update_cache_status('track_stats', year, event, False)
+
+@timed('db_read')
+def get_track_stats_from_db(year, event):
+    """Получает статистику трассы из таблицы TrackStats"""
+    track_stats = TrackStats.query.filter_by(year=year, event=event).first()
+    
+    if track_stats:
+        return track_stats.to_dict()
+    
+    return None
+
+@timed('db_save')
+def save_position_data_to_db(year, event, position_data):
+    """Сохраняет данные для графика позиций"""
+    try:
+        print(f"Сохраняем данные графика {event} {year} в PostgreSQL...")
+        
+        replace_race_rows(PositionData, year, event, position_data_rows(position_data))
+        mark_cache_status(['position_data'], year, event)
+        db.session.commit()
+        print(f"Данные графика {event} {year} сохранены в PostgreSQL")
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ошибка сохранения данных графика: {e}")
+        update_cache_status('position_data', year, event, False)
+
+@timed('db_read')
+def get_position_data_from_db(year, event):
+    """Получает данные для графика позиций из БД"""
+    position_data = PositionData.query.filter_by(year=year, event=event).all()
+    
+    if not position_data:
+        return None
+    
+    # Преобразуем в формат для Plotly
+    data = []
+    for entry in position_data:
+        data.append({
+            'name': entry.driver_code,
+            'positions': entry.positions,
+            'laps': entry.laps,
+            'team': entry.team,
+            'color': entry.color
+        })
+    # Восстанавливаем тип линии для каждой команды    
+    team_drivers = defaultdict(list)
+    
+    for driver in data:
+        team_drivers[driver['team']].append(driver)
+    
+    for team, drivers in team_drivers.items():
+        for i, driver in enumerate(drivers):
+            driver['dash'] = 'solid' if i == 0 else 'dash'
+            
+    return data
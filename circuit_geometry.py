@@ -0,0 +1,192 @@
+import threading
+import time
+
+from database import db, CircuitLayout, CircuitGeometry, CacheStatus, EventSchedule
+
+# Известные реконфигурации трасс: circuit_key -> сезоны, с которых действует новая версия
+KNOWN_LAYOUT_CHANGES = {
+    'yas island': [(2021, 'Перестройка секторов 2 и 3')],
+    'melbourne': [(2022, 'Реконфигурация Альберт-парка, 14 поворотов')],
+    'barcelona': [(2023, 'Убрана шикана в последнем секторе')],
+    'marina bay': [(2023, 'Убрана секция под трибуной')],
+}
+
+# Разные написания одной и той же площадки в расписаниях FastF1
+LOCATION_ALIASES = {
+    'yas marina': 'yas island',
+    'são paulo': 'sao paulo',
+    'montréal': 'montreal',
+    'spa-francorchamps': 'spa',
+    'spa francorchamps': 'spa',
+}
+
+# Этапы на другой конфигурации, чем обычный этап той же площадки (Location совпадает)
+EVENT_CIRCUITS = {
+    'sakhir grand prix': 'sakhir outer',
+}
+
+# Как долго процесс доверяет таблице конфигураций, прежде чем перечитать ее из БД:
+# register-layout в другом процессе становится виден воркерам не позже чем через это время
+LAYOUTS_TTL = 60
+
+
+def circuit_key(location):
+    """Нормализованный ключ площадки по полю Location из расписания"""
+    if not location:
+        return None
+    key = ' '.join(str(location).strip().lower().split())
+    return LOCATION_ALIASES.get(key, key)
+
+
+def event_circuit_key(event_info):
+    """Ключ площадки этапа: по EVENT_CIRCUITS, иначе по Location"""
+    if not event_info:
+        return None
+    name = ' '.join(str(event_info.get('event_name') or '').lower().split())
+    return EVENT_CIRCUITS.get(name) or circuit_key(event_info.get('location'))
+
+
+class CircuitGeometryStore:
+    """
+    Геометрия трасс по ключу площадки и версии конфигурации.
+
+    Карта трассы почти никогда не меняется между сезонами, поэтому этап
+    нового сезона на знакомой площадке получает координаты из этого
+    хранилища без загрузки телеметрии. Версия конфигурации равна числу
+    зарегистрированных изменений, вступивших в силу к данному сезону.
+    Таблица изменений перечитывается из БД раз в LAYOUTS_TTL секунд и
+    перед каждым сохранением геометрии.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._geometry = {}
+        self._layouts = None
+        self._layouts_expires_at = 0
+
+    def _layout_changes(self, fresh=False):
+        """Сезоны изменений конфигурации по площадкам (из БД и известных)"""
+        with self._lock:
+            if not fresh and self._layouts is not None and time.monotonic() < self._layouts_expires_at:
+                return self._layouts
+
+        layouts = {key: sorted(year for year, _ in changes)
+                   for key, changes in KNOWN_LAYOUT_CHANGES.items()}
+        for row in CircuitLayout.query.all():
+            years = layouts.setdefault(row.circuit_key, [])
+            if row.valid_from_year not in years:
+                years.append(row.valid_from_year)
+                years.sort()
+
+        with self._lock:
+            if self._layouts is not None and layouts != self._layouts:
+                # Изменение зарегистрировано в другом процессе: версии площадок сдвинулись
+                self._geometry = {}
+            self._layouts = layouts
+            self._layouts_expires_at = time.monotonic() + LAYOUTS_TTL
+        return layouts
+
+    def layout_version(self, key, year, fresh=False):
+        return sum(1 for change_year in self._layout_changes(fresh).get(key, []) if change_year <= int(year))
+
+    def lookup(self, year, event_info):
+        """Возвращает сохраненную геометрию для этапа или None"""
+        key = event_circuit_key(event_info)
+        if not key:
+            return None
+        version = self.layout_version(key, year)
+
+        with self._lock:
+            cached = self._geometry.get((key, version))
+        if cached is not None:
+            return cached
+
+        row = CircuitGeometry.query.filter_by(circuit_key=key, layout_version=version).first()
+        coordinates = row.coordinates if row is not None else None
+        if not coordinates:
+            return None
+
+        geometry = {
+            'circuit_length': row.circuit_length,
+            'turns_count': row.turns_count,
+            'coordinates': coordinates,
+            'source_year': row.source_year,
+            'source_event': row.source_event
+        }
+        with self._lock:
+            self._geometry[(key, version)] = geometry
+        return geometry
+
+    def save(self, year, event, event_info, stats):
+        """Сохраняет геометрию, посчитанную по телеметрии этапа"""
+        key = event_circuit_key(event_info)
+        coordinates = stats.get('coordinates') if stats else None
+        if not key or not coordinates:
+            return
+        # Версию берем по свежей таблице: геометрию нельзя записать под устаревшей версией
+        version = self.layout_version(key, year, fresh=True)
+        turns_count = stats.get('turns_count')
+
+        try:
+            row = CircuitGeometry.query.filter_by(circuit_key=key, layout_version=version).first()
+            if row is None:
+                row = CircuitGeometry(circuit_key=key, layout_version=version)
+                db.session.add(row)
+            row.circuit_length = stats.get('circuit_length')
+            row.turns_count = turns_count if isinstance(turns_count, int) else None
+            row.coordinates = coordinates
+            row.source_year = year
+            row.source_event = event
+            db.session.commit()
+            print(f"Геометрия трассы {key} (версия {version}) сохранена по {event} {year}")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Ошибка сохранения геометрии трассы: {e}")
+            return
+
+        with self._lock:
+            self._geometry.pop((key, version), None)
+
+    def register_layout_change(self, location, valid_from_year, note=None):
+        """
+        Регистрирует новую конфигурацию трассы, действующую с valid_from_year.
+
+        Версии геометрии площадки сдвигаются, поэтому ее сохраненная
+        геометрия и кэш статистики трассы затронутых этапов сбрасываются
+        и будут пересчитаны по телеметрии при следующем запросе.
+        """
+        key = circuit_key(location)
+        try:
+            if not CircuitLayout.query.filter_by(circuit_key=key, valid_from_year=valid_from_year).first():
+                db.session.add(CircuitLayout(circuit_key=key, valid_from_year=valid_from_year, note=note))
+            CircuitGeometry.query.filter_by(circuit_key=key).delete()
+
+            affected = [row.event_name for row in EventSchedule.query.filter(
+                EventSchedule.year >= valid_from_year).all()
+                if event_circuit_key({'event_name': row.event_name, 'location': row.location}) == key]
+            invalidated = 0
+            if affected:
+                invalidated = CacheStatus.query.filter(
+                    CacheStatus.data_type == 'track_stats',
+                    CacheStatus.year >= valid_from_year,
+                    CacheStatus.event.in_(affected)
+                ).update({'is_valid': False}, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        with self._lock:
+            self._layouts = None
+            self._geometry = {k: v for k, v in self._geometry.items() if k[0] != key}
+        print(f"Зарегистрирована новая конфигурация {key} с {valid_from_year}, "
+              f"сброшено записей статистики трасс: {invalidated}")
+        return key
+
+    def stats(self):
+        """Размер кэша геометрии в памяти процесса"""
+        with self._lock:
+            return {'geometries': len(self._geometry)}
+
+
+circuit_geometry_store = CircuitGeometryStore()
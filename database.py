@@ -2,8 +2,15 @@ from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timezone
 import json
 
+from packed_arrays import (pack_coordinates, pack_laps, pack_positions, pack_stints, unpack_coordinates,
+                           unpack_laps, unpack_positions, unpack_stints)
+
 db = SQLAlchemy()
 
+def utcnow():
+    """Текущее время UTC; передается в default/onupdate как функция, чтобы вычисляться при каждой записи"""
+    return datetime.now(timezone.utc)
+
 class RaceResult(db.Model):
     """Результаты конкретной гонки"""
     __tablename__ = 'race_results'
@@ -20,8 +27,8 @@ class RaceResult(db.Model):
     fastest_lap = db.Column(db.Boolean, default=False)
     laps_behind = db.Column(db.Integer, default=0)
     status = db.Column(db.String(50), default='Finished')
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
-    updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
     
     __table_args__ = (
         db.UniqueConstraint('year', 'event', 'driver_name', name='unique_race_result'),
@@ -49,9 +56,11 @@ class TrackStats(db.Model):
     location = db.Column(db.String(200))
     circuit_length = db.Column(db.String(50))
     turns_count = db.Column(db.Integer)
+    coordinates_packed = db.Column(db.LargeBinary)
+    # Прежнее хранение в JSON; читается, пока строка не переписана или не перенесена migrate-packed-arrays
     coordinates_json = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
-    updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
     
     __table_args__ = (
         db.UniqueConstraint('year', 'event', name='unique_track_stats'),
@@ -59,13 +68,16 @@ class TrackStats(db.Model):
     
     @property
     def coordinates(self):
+        if self.coordinates_packed is not None:
+            return unpack_coordinates(self.coordinates_packed)
         if self.coordinates_json:
             return json.loads(self.coordinates_json)
         return []
     
     @coordinates.setter
     def coordinates(self, value):
-        self.coordinates_json = json.dumps(value if value else [])
+        self.coordinates_packed = pack_coordinates(value or [])
+        self.coordinates_json = None
     
     def to_dict(self):
         return {
@@ -89,11 +101,14 @@ class PositionData(db.Model):
     year = db.Column(db.Integer, nullable=False, index=True)
     event = db.Column(db.String(200), nullable=False, index=True)
     driver_code = db.Column(db.String(10), nullable=False)
+    positions_packed = db.Column(db.LargeBinary)
+    laps_packed = db.Column(db.LargeBinary)
+    # Прежнее хранение в JSON; читается, пока строка не переписана или не перенесена migrate-packed-arrays
     positions_json = db.Column(db.Text)  
     laps_json = db.Column(db.Text)       
     team = db.Column(db.String(100))
     color = db.Column(db.String(20))
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=utcnow)
     
     __table_args__ = (
         db.UniqueConstraint('year', 'event', 'driver_code', name='unique_position_data'),
@@ -101,23 +116,29 @@ class PositionData(db.Model):
     
     @property
     def positions(self):
+        if self.positions_packed is not None:
+            return unpack_positions(self.positions_packed)
         if self.positions_json:
             return json.loads(self.positions_json)
         return []
     
     @positions.setter
     def positions(self, value):
-        self.positions_json = json.dumps(value if value else [])
+        self.positions_packed = pack_positions(value or [])
+        self.positions_json = None
     
     @property
     def laps(self):
+        if self.laps_packed is not None:
+            return unpack_laps(self.laps_packed)
         if self.laps_json:
             return json.loads(self.laps_json)
         return []
     
     @laps.setter
     def laps(self, value):
-        self.laps_json = json.dumps(value if value else [])
+        self.laps_packed = pack_laps(value or [])
+        self.laps_json = None
 
 class CacheStatus(db.Model):
     """Статус кэширования"""
@@ -127,7 +148,7 @@ class CacheStatus(db.Model):
     data_type = db.Column(db.String(50), nullable=False)  
     year = db.Column(db.Integer, nullable=False)
     event = db.Column(db.String(200), nullable=False)
-    last_updated = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    last_updated = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
     is_valid = db.Column(db.Boolean, default=True)
     
     __table_args__ = (
@@ -142,8 +163,10 @@ class TyreStrategy(db.Model):
     year = db.Column(db.Integer, nullable=False, index=True)
     event = db.Column(db.String(200), nullable=False, index=True)
     driver_code = db.Column(db.String(10), nullable=False)
+    stints_packed = db.Column(db.LargeBinary)
+    # Прежнее хранение в JSON; читается, пока строка не переписана или не перенесена migrate-packed-arrays
     stints_json = db.Column(db.Text)  
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=utcnow)
     
     __table_args__ = (
         db.UniqueConstraint('year', 'event', 'driver_code', name='unique_tyre_strategy'),
@@ -151,13 +174,16 @@ class TyreStrategy(db.Model):
     
     @property
     def stints(self):
+        if self.stints_packed is not None:
+            return unpack_stints(self.stints_packed)
         if self.stints_json:
             return json.loads(self.stints_json)
         return []
     
     @stints.setter
     def stints(self, value):
-        self.stints_json = json.dumps(value if value else [])
+        self.stints_packed = pack_stints(value or [])
+        self.stints_json = None
         
 class PitstopData(db.Model):
     """Данные пит-стопов"""
@@ -172,7 +198,7 @@ class PitstopData(db.Model):
     pitstop_time = db.Column(db.Float)  
     compound = db.Column(db.String(20))
     stint = db.Column(db.Integer)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=utcnow)
     
     __table_args__ = (
         db.UniqueConstraint('year', 'event', 'driver_code', 'lap', name='unique_pitstop'),
@@ -186,4 +212,128 @@ class PitstopData(db.Model):
             'pitstop_time': self.pitstop_time,
             'compound': self.compound,
             'stint': self.stint
-        }
\ No newline at end of file
+        }
+
+class LatestRace(db.Model):
+    """Последняя гонка с результатами, найденная для главной страницы"""
+    __tablename__ = 'latest_race'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    event = db.Column(db.String(200), nullable=False)
+    resolved_at = db.Column(db.DateTime, nullable=False)
+    next_refresh_at = db.Column(db.DateTime)
+
+class EventSchedule(db.Model):
+    """Расписание этапов сезона"""
+    __tablename__ = 'event_schedule'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False, index=True)
+    round_number = db.Column(db.Integer)
+    event_name = db.Column(db.String(200), nullable=False)
+    official_name = db.Column(db.String(300))
+    country = db.Column(db.String(100))
+    location = db.Column(db.String(200))
+    event_format = db.Column(db.String(50))
+    event_date = db.Column(db.DateTime)
+    race_date_utc = db.Column(db.DateTime)
+    fetched_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('year', 'event_name', name='unique_event_schedule'),
+        db.Index('ix_event_schedule_year_round', 'year', 'round_number'),
+    )
+    
+    def to_dict(self):
+        return {
+            'year': self.year,
+            'round_number': self.round_number,
+            'event_name': self.event_name,
+            'official_name': self.official_name,
+            'country': self.country,
+            'location': self.location,
+            'event_format': self.event_format,
+            'event_date': self.event_date,
+            'race_date_utc': self.race_date_utc
+        }
+
+class CircuitLayout(db.Model):
+    """Изменения конфигурации трасс: с какого сезона действует новая версия"""
+    __tablename__ = 'circuit_layout'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    circuit_key = db.Column(db.String(200), nullable=False, index=True)
+    valid_from_year = db.Column(db.Integer, nullable=False)
+    note = db.Column(db.String(300))
+    
+    __table_args__ = (
+        db.UniqueConstraint('circuit_key', 'valid_from_year', name='unique_circuit_layout'),
+    )
+
+class CircuitGeometry(db.Model):
+    """Геометрия трассы, общая для всех сезонов с одной версией конфигурации"""
+    __tablename__ = 'circuit_geometry'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    circuit_key = db.Column(db.String(200), nullable=False)
+    layout_version = db.Column(db.Integer, nullable=False, default=0)
+    circuit_length = db.Column(db.String(50))
+    turns_count = db.Column(db.Integer)
+    coordinates_packed = db.Column(db.LargeBinary)
+    # Прежнее хранение в JSON; читается, пока строка не переписана или не перенесена migrate-packed-arrays
+    coordinates_json = db.Column(db.Text)
+    source_year = db.Column(db.Integer)
+    source_event = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('circuit_key', 'layout_version', name='unique_circuit_geometry'),
+    )
+    
+    @property
+    def coordinates(self):
+        if self.coordinates_packed is not None:
+            return unpack_coordinates(self.coordinates_packed)
+        if self.coordinates_json:
+            return json.loads(self.coordinates_json)
+        return []
+    
+    @coordinates.setter
+    def coordinates(self, value):
+        self.coordinates_packed = pack_coordinates(value or [])
+        self.coordinates_json = None
+
+class ResultsFragment(db.Model):
+    """Готовый HTML таблицы результатов гонки и хэш строк RaceResult, по которым он построен"""
+    __tablename__ = 'results_fragment'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    event = db.Column(db.String(200), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('year', 'event', name='unique_results_fragment'),
+    )
+
+class PanelPayload(db.Model):
+    """Готовое тело ответа раздела гонки: исходное, gzip и brotli"""
+    __tablename__ = 'panel_payload'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    event = db.Column(db.String(200), nullable=False)
+    panel = db.Column(db.String(50), nullable=False)
+    etag = db.Column(db.String(64), nullable=False)
+    mimetype = db.Column(db.String(50), nullable=False)
+    identity = db.Column(db.LargeBinary, nullable=False)
+    gzip = db.Column(db.LargeBinary, nullable=False)
+    brotli = db.Column(db.LargeBinary)
+    created_at = db.Column(db.DateTime, default=utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('year', 'event', 'panel', name='unique_panel_payload'),
+    )
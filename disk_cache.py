@@ -0,0 +1,259 @@
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+import fastf1 as f1
+
+# Файл-метка внутри каталога сессии, mtime которого хранит время последнего использования
+USAGE_MARKER = '.last_used'
+# Сколько дней после сессии ее данные еще могут исправляться на сервере
+SETTLE_DAYS = 3
+# Дата в начале имени каталога этапа или сессии FastF1 (2024-03-02_Race)
+_DIR_DATE = re.compile(r'^(\d{4}-\d{2}-\d{2})')
+
+
+def _dir_usage(path):
+    """Возвращает размер каталога и время последней записи данных в нем"""
+    total = 0
+    written = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            total += stat.st_size
+            if name != USAGE_MARKER:
+                written = max(written, stat.st_mtime)
+    return total, written
+
+
+class DiskCache:
+    """
+    Управляемый дисковый кэш FastF1 под кэшем PostgreSQL.
+
+    FastF1 раскладывает данные по каталогам <год>/<этап>/<сессия>. Каждый
+    каталог сессии - единица вытеснения: при превышении лимита удаляются
+    сессии, которые дольше всего не использовались. В лимит входит и
+    http-кэш FastF1 (sqlite в корне каталога). Сессии, прошедшие больше
+    SETTLE_DAYS назад, неизменяемы и не устаревают, более свежие
+    перечитываются с сервера после mutable_ttl_hours.
+
+    Обход каталога выполняется в фоновом потоке; /cache_stats отдает
+    результат последнего обхода.
+    """
+
+    def __init__(self):
+        self.cache_dir = None
+        self.max_bytes = 0
+        self.mutable_ttl_seconds = 24 * 3600
+        self.check_interval = 60
+        self._lock = threading.Lock()
+        self._last_check = 0
+        self._enforcing = False
+        self._snapshot = None
+        self._evictions = 0
+        self._expirations = 0
+
+    @property
+    def enabled(self):
+        return self.cache_dir is not None
+
+    def configure(self, cache_dir, max_gb, mutable_ttl_hours=24):
+        """Включает дисковый кэш FastF1 в каталоге cache_dir"""
+        if not cache_dir:
+            self.cache_dir = None
+            return
+
+        os.makedirs(cache_dir, exist_ok=True)
+        f1.Cache.enable_cache(cache_dir)
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = int(float(max_gb) * 1024 ** 3)
+        self.mutable_ttl_seconds = float(mutable_ttl_hours) * 3600
+        print(f"Дисковый кэш FastF1: {self.cache_dir} (лимит {max_gb} ГБ)")
+
+    @staticmethod
+    def is_immutable(session_dir, year):
+        """
+        Данные сессии больше не меняются, если с ее даты прошло больше
+        SETTLE_DAYS. Дата берется из имени каталога сессии или этапа,
+        без нее неизменяемыми считаются прошлые сезоны.
+        """
+        now = datetime.now(timezone.utc)
+        for name in (os.path.basename(session_dir), os.path.basename(os.path.dirname(session_dir))):
+            match = _DIR_DATE.match(name)
+            if match:
+                try:
+                    date = datetime.strptime(match.group(1), '%Y-%m-%d').replace(tzinfo=timezone.utc)
+                except ValueError:
+                    continue
+                return (now - date).days > SETTLE_DAYS
+        return int(year) < now.year
+
+    def _session_dir(self, session):
+        api_path = getattr(session, 'api_path', None)
+        if not self.enabled or not api_path:
+            return None
+        # Так же, как FastF1: ведущий '/static/' отбрасывается
+        return os.path.join(self.cache_dir, api_path[8:])
+
+    def record_use(self, session):
+        """Отмечает использование сессии и при необходимости освобождает место"""
+        session_dir = self._session_dir(session)
+        if session_dir and os.path.isdir(session_dir):
+            marker = os.path.join(session_dir, USAGE_MARKER)
+            try:
+                with open(marker, 'a'):
+                    pass
+                os.utime(marker)
+            except OSError as e:
+                print(f"Не удалось обновить метку дискового кэша: {e}")
+        self.maybe_enforce()
+
+    def _iter_session_dirs(self):
+        """Перечисляет каталоги сессий: (год, путь)"""
+        if not self.enabled:
+            return
+        for year_name in os.listdir(self.cache_dir):
+            year_dir = os.path.join(self.cache_dir, year_name)
+            if not year_name.isdigit() or not os.path.isdir(year_dir):
+                continue
+            for event_name in os.listdir(year_dir):
+                event_dir = os.path.join(year_dir, event_name)
+                if not os.path.isdir(event_dir):
+                    continue
+                for session_name in os.listdir(event_dir):
+                    session_dir = os.path.join(event_dir, session_name)
+                    if os.path.isdir(session_dir):
+                        yield int(year_name), session_dir
+
+    def _scan(self):
+        entries = []
+        for year, session_dir in self._iter_session_dirs():
+            size, written = _dir_usage(session_dir)
+            marker = os.path.join(session_dir, USAGE_MARKER)
+            try:
+                last_used = os.path.getmtime(marker)
+            except OSError:
+                last_used = written
+            entries.append({
+                'year': year,
+                'path': session_dir,
+                'size': size,
+                'written': written,
+                'last_used': last_used,
+                'immutable': self.is_immutable(session_dir, year)
+            })
+        return entries
+
+    def _root_files_bytes(self):
+        """Файлы в корне кэша: http-кэш FastF1 (fastf1_http_cache.sqlite) и его журналы"""
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file():
+                try:
+                    total += entry.stat().st_size
+                except OSError:
+                    continue
+        return total
+
+    def _remove(self, path):
+        shutil.rmtree(path, ignore_errors=True)
+        # Удаляем опустевший каталог этапа
+        parent = os.path.dirname(path)
+        try:
+            if not os.listdir(parent):
+                os.rmdir(parent)
+        except OSError:
+            pass
+
+    def maybe_enforce(self):
+        """
+        Проверяет лимит не чаще одного раза в check_interval секунд.
+        Обход каталога идет в фоновом потоке, запрос его не ждет.
+        """
+        with self._lock:
+            if self._enforcing or time.monotonic() - self._last_check < self.check_interval:
+                return
+            self._enforcing = True
+        threading.Thread(target=self._enforce_background, daemon=True).start()
+
+    def _enforce_background(self):
+        try:
+            self.enforce()
+        except Exception as e:
+            print(f"Ошибка проверки дискового кэша: {e}")
+        finally:
+            with self._lock:
+                self._enforcing = False
+
+    def enforce(self):
+        """Удаляет устаревшие сессии текущего сезона и вытесняет LRU сверх лимита"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._last_check = time.monotonic()
+        now = time.time()
+        entries = []
+        for entry in self._scan():
+            expired = not entry['immutable'] and now - entry['written'] > self.mutable_ttl_seconds
+            if expired:
+                self._remove(entry['path'])
+                with self._lock:
+                    self._expirations += 1
+            else:
+                entries.append(entry)
+
+        # http-кэш FastF1 не вытесняется по сессиям, но занимает место в лимите
+        other_bytes = self._root_files_bytes()
+        total = other_bytes + sum(entry['size'] for entry in entries)
+        if total > self.max_bytes:
+            for entry in sorted(entries, key=lambda e: e['last_used']):
+                if total <= self.max_bytes:
+                    break
+                self._remove(entry['path'])
+                entries.remove(entry)
+                total -= entry['size']
+                with self._lock:
+                    self._evictions += 1
+                print(f"Дисковый кэш FastF1: вытеснена сессия {entry['path']}")
+
+        with self._lock:
+            self._snapshot = {
+                'sessions_bytes': sum(entry['size'] for entry in entries),
+                'other_bytes': other_bytes,
+                'sessions': len(entries),
+                'immutable_sessions': sum(1 for entry in entries if entry['immutable']),
+                'scanned_at': datetime.now(timezone.utc).isoformat(timespec='seconds')
+            }
+
+    def usage(self):
+        """
+        Статистика дискового кэша для /cache_stats по последнему обходу
+        каталога; если обхода еще не было, он запускается в фоне.
+        """
+        if not self.enabled:
+            return {'enabled': False}
+
+        with self._lock:
+            snapshot = dict(self._snapshot) if self._snapshot else None
+            stats = {
+                'enabled': True,
+                'path': self.cache_dir,
+                'max_bytes': self.max_bytes,
+                'evictions': self._evictions,
+                'expirations': self._expirations
+            }
+        if snapshot is None:
+            self.maybe_enforce()
+            stats['scanned_at'] = None
+            return stats
+        stats.update(snapshot)
+        stats['size_bytes'] = snapshot['sessions_bytes'] + snapshot['other_bytes']
+        return stats
+
+
+disk_cache = DiskCache()
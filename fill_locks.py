@@ -0,0 +1,209 @@
+import threading
+import time
+import zlib
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from database import db
+
+# Как часто повторять попытку взять занятую блокировку
+POLL_INTERVAL = 0.1
+
+
+def _int32(value):
+    """crc32 строки как знаковое 32-битное число (ключ advisory-блокировки)"""
+    value = zlib.crc32(value.encode('utf-8'))
+    return value - (1 << 32) if value >= (1 << 31) else value
+
+
+def lock_key(data_type, year, event):
+    """Пара ключей pg_advisory_lock для заполнения кэша (data_type, year, event)"""
+    return _int32(data_type), _int32(f"{year}|{event}")
+
+
+class FillLock:
+    """Взятые блокировки заполнения кэша одной гонки"""
+
+    def __init__(self, owner, keys, connection=None):
+        self._owner = owner
+        self.keys = keys
+        self._connection = connection
+
+    def release(self):
+        self._owner._release(self)
+
+
+class FillLocks:
+    """
+    Блокировки заполнения кэша БД между процессами и узлами.
+
+    На PostgreSQL используются сессионные advisory-блокировки на
+    отдельном соединении с ключом (data_type, year, event): кэш гонки
+    заполняет только один процесс, остальные ждут его или отдают
+    устаревшую копию. На других СУБД (SQLite при локальной разработке)
+    блокировки действуют только внутри процесса.
+
+    Соединение держится все время заполнения, поэтому блокировки берутся
+    из отдельного маленького пула (pool_size), а не из пула db.session:
+    одновременные заполнения не могут занять соединения запросов. Заодно
+    пул ограничивает число заполнений в процессе: когда он занят,
+    acquire ждет свободное соединение не дольше timeout.
+    """
+
+    def __init__(self, timeout=30.0, pool_size=4):
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._local_held = set()
+        self._stats = {}
+        self._engine = None
+
+    def configure(self, timeout, pool_size=4):
+        self.timeout = timeout
+        self.pool_size = pool_size
+        with self._lock:
+            engine, self._engine = self._engine, None
+        if engine is not None:
+            engine.dispose()
+
+    @staticmethod
+    def _is_postgres():
+        return db.engine.dialect.name == 'postgresql'
+
+    def _lock_engine(self):
+        """Отдельный пул соединений для сессионных блокировок"""
+        with self._lock:
+            if self._engine is None or self._engine.url != db.engine.url:
+                self._engine = create_engine(db.engine.url, pool_size=self.pool_size, max_overflow=0,
+                                             pool_timeout=self.timeout, pool_pre_ping=True)
+            return self._engine
+
+    def acquire(self, year, event, data_types, wait=True, timeout=None):
+        """
+        Берет блокировки всех data_types гонки или возвращает None.
+
+        Если wait=False, а блокировка занята, None возвращается сразу;
+        иначе попытки повторяются до timeout секунд.
+        """
+        keys = sorted({lock_key(data_type, year, event) for data_type in data_types})
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + (timeout if wait else 0)
+        start = time.perf_counter()
+        contended = False
+
+        connection = None
+        if self._is_postgres():
+            engine = self._lock_engine()
+            try:
+                if not wait and engine.pool.checkedout() >= self.pool_size:
+                    raise PoolTimeoutError()
+                connection = engine.connect()
+            except PoolTimeoutError:
+                # Все соединения пула блокировок заняты заполнениями
+                self._record(data_types, time.perf_counter() - start, True, acquired=False, waited=wait)
+                return None
+        try:
+            while True:
+                if self._try_acquire(keys, connection):
+                    self._record(data_types, time.perf_counter() - start, contended, acquired=True)
+                    return FillLock(self, keys, connection)
+                contended = True
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(POLL_INTERVAL)
+        except Exception:
+            if connection is not None:
+                connection.invalidate()
+                connection.close()
+            raise
+
+        if connection is not None:
+            connection.close()
+        self._record(data_types, time.perf_counter() - start, contended, acquired=False, waited=wait)
+        return None
+
+    def _try_acquire(self, keys, connection):
+        if connection is None:
+            with self._lock:
+                if self._local_held.intersection(keys):
+                    return False
+                self._local_held.update(keys)
+                return True
+
+        taken = []
+        for key in keys:
+            if connection.execute(text('SELECT pg_try_advisory_lock(:k1, :k2)'),
+                                  {'k1': key[0], 'k2': key[1]}).scalar():
+                taken.append(key)
+                continue
+            for held in taken:
+                connection.execute(text('SELECT pg_advisory_unlock(:k1, :k2)'), {'k1': held[0], 'k2': held[1]})
+            connection.commit()
+            return False
+        # Блокировки сессионные, транзакция соединения не должна висеть открытой
+        connection.commit()
+        return True
+
+    def _release(self, fill_lock):
+        connection = fill_lock._connection
+        if connection is None:
+            with self._lock:
+                self._local_held.difference_update(fill_lock.keys)
+            return
+
+        try:
+            for key in fill_lock.keys:
+                connection.execute(text('SELECT pg_advisory_unlock(:k1, :k2)'), {'k1': key[0], 'k2': key[1]})
+            connection.commit()
+        except Exception as e:
+            # Закрытое соединение освобождает все свои advisory-блокировки
+            print(f"Ошибка снятия блокировки заполнения кэша: {e}")
+            connection.invalidate()
+        finally:
+            connection.close()
+
+    def lock_in_transaction(self, year, event, data_types):
+        """
+        Ждет блокировки data_types гонки до конца текущей транзакции db.session.
+
+        Нужна пакетным писателям, которые заменяют строки гонки внутри
+        своей транзакции: они не пересекаются с заполнением по запросу.
+        """
+        if not self._is_postgres():
+            return
+        for key in sorted({lock_key(data_type, year, event) for data_type in data_types}):
+            db.session.execute(text('SELECT pg_advisory_xact_lock(:k1, :k2)'), {'k1': key[0], 'k2': key[1]})
+
+    def record_stale(self, data_type):
+        """Учитывает ответ устаревшей копией, пока кэш заполняет другой процесс"""
+        with self._lock:
+            self._entry(data_type)['stale_served'] += 1
+
+    def _entry(self, data_type):
+        return self._stats.setdefault(data_type, {
+            'acquired': 0, 'contended': 0, 'timeouts': 0, 'busy': 0,
+            'stale_served': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0
+        })
+
+    def _record(self, data_types, seconds, contended, acquired, waited=True):
+        with self._lock:
+            for data_type in data_types:
+                stats = self._entry(data_type)
+                if acquired:
+                    stats['acquired'] += 1
+                elif waited:
+                    stats['timeouts'] += 1
+                else:
+                    stats['busy'] += 1
+                if contended:
+                    stats['contended'] += 1
+                    stats['wait_seconds'] += seconds
+                    stats['max_wait_seconds'] = max(stats['max_wait_seconds'], seconds)
+
+    def stats(self):
+        with self._lock:
+            return {data_type: dict(stats) for data_type, stats in self._stats.items()}
+
+
+fill_locks = FillLocks()
@@ -0,0 +1,303 @@
+import json
+import os
+import re
+import threading
+import time
+import warnings
+from datetime import datetime, timezone
+
+import pandas as pd
+from fastf1.core import Laps, SessionResults, Telemetry
+
+# Режимы источника данных FastF1
+MODES = ('fastf1', 'record', 'replay')
+# Описание снимка сессии; пишется последним и отмечает снимок как полный
+META_FILE = 'session.json'
+# Таблицы сессии: имя файла снимка -> атрибут сессии FastF1
+FRAME_ATTRS = {
+    'laps': 'laps',
+    'results': 'results',
+    'weather': 'weather_data',
+    'messages': 'race_control_messages',
+    'status': 'session_status'
+}
+# Таблицы, которые есть только при соответствующем флаге session.load()
+FRAME_FLAGS = {'weather': 'weather', 'messages': 'messages'}
+
+
+class FixtureNotFound(LookupError):
+    """В хранилище нет снимка с нужными данными"""
+
+
+def _slug(value):
+    return re.sub(r'[^0-9a-z]+', '_', str(value).lower()).strip('_')
+
+
+def _write_pickle(obj, path):
+    # Запись через временный файл: читатель не увидит наполовину записанный снимок
+    tmp = f'{path}.tmp'
+    pd.to_pickle(obj, tmp)
+    os.replace(tmp, path)
+
+
+def _frame(value):
+    """Таблица FastF1 как обычный DataFrame, без ссылки на сессию"""
+    return pd.DataFrame(value) if isinstance(value, pd.DataFrame) else None
+
+
+def _raw_position_data(session):
+    """Поток позиций в том виде, в каком его читает track_utils.load_lap_positions"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        from fastf1 import api as f1_api
+    return f1_api.position_data(session.api_path)
+
+
+class FixtureSession:
+    """
+    Сессия, восстановленная из снимка.
+
+    Повторяет атрибуты сессии FastF1, которые читает приложение: laps
+    (fastf1.core.Laps), results, event, drivers, погоду, сообщения,
+    а при телеметрии - car_data и pos_data. Поток позиций для карты
+    трассы читается с диска только при первом обращении.
+    """
+
+    def __init__(self, path, meta, flags):
+        self._path = path
+        self._position_data = None
+        self.name = meta['name']
+        self.api_path = meta.get('api_path')
+        self.date = pd.Timestamp(meta['date']) if meta.get('date') else None
+        self.t0_date = pd.Timestamp(meta['t0_date']) if meta.get('t0_date') else None
+        self.drivers = list(meta['drivers'])
+        self.event = self._read('event')
+        self.results = SessionResults(self._read('results'))
+        self.laps = Laps(self._read('laps'), session=self) if 'laps' in flags else None
+        self.session_status = self._read('status', required=False)
+        self.weather_data = self._read('weather') if 'weather' in flags else None
+        self.race_control_messages = self._read('messages') if 'messages' in flags else None
+        self.car_data = {}
+        self.pos_data = {}
+        if 'telemetry' in flags:
+            for attr, name in (('car_data', 'car_data'), ('pos_data', 'pos_data')):
+                frames = self._read(name)
+                setattr(self, attr, {drv: Telemetry(frame, session=self, driver=drv)
+                                     for drv, frame in frames.items()})
+
+    def _read(self, name, required=True):
+        path = os.path.join(self._path, f'{name}.pkl')
+        if not os.path.exists(path):
+            if required:
+                raise FixtureNotFound(f"В снимке {self._path} нет {name}")
+            return None
+        return pd.read_pickle(path)
+
+    def position_data(self):
+        """Поток позиций {номер пилота: DataFrame}, как fastf1.api.position_data"""
+        if self._position_data is None:
+            self._position_data = self._read('position_data')
+        return self._position_data
+
+    def get_driver(self, identifier):
+        return self.results[self.results['DriverNumber'] == str(identifier)].iloc[0]
+
+
+class FixtureStore:
+    """
+    Локальное хранилище снимков данных FastF1 для работы без сети.
+
+    В режиме record каждая загрузка сессии и расписания дополнительно
+    сохраняется на диск: круги, результаты, этап, погода и сообщения
+    (если загружались), телеметрия и поток позиций. В режиме replay
+    приложение вообще не обращается к FastF1 и Ergast: сессии и
+    расписания читаются из снимков, а время загрузки можно имитировать
+    (latency_scale - доля записанного времени загрузки FastF1). Так
+    замеры кэша, загрузки и живого режима воспроизводимы на машине без
+    доступа к серверам.
+
+    Раскладка: <root>/<год>/<этап>/<сессия>/*.pkl + session.json,
+    расписания - <root>/<год>/schedule.pkl.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.mode = 'fastf1'
+        self.latency_scale = 0.0
+        self._lock = threading.Lock()
+        self._index = None
+        self._recorded = 0
+        self._replayed = 0
+        self._misses = 0
+
+    def configure(self, root, mode='fastf1', latency_scale=0.0):
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим источника данных: {mode} (ожидается {', '.join(MODES)})")
+        self.mode = mode if root else 'fastf1'
+        self.root = os.path.abspath(root) if root else None
+        self.latency_scale = float(latency_scale)
+        with self._lock:
+            self._index = None
+        if self.mode != 'fastf1':
+            os.makedirs(self.root, exist_ok=True)
+            print(f"Снимки данных FastF1: {self.root} (режим {self.mode})")
+
+    def settings(self):
+        """Параметры configure() для дочерних процессов загрузки"""
+        return self.root, self.mode, self.latency_scale
+
+    @property
+    def recording(self):
+        return self.mode == 'record'
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    # Запись
+
+    def record_session(self, year, event, session_type, session, flags, load_seconds=None):
+        """Сохраняет загруженную сессию; уже записанные данные других флагов сохраняются"""
+        event_name = str(session.event['EventName'])
+        path = os.path.join(self.root, str(int(year)), _slug(event_name), str(session_type))
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, META_FILE)
+        previous = {}
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as f:
+                previous = json.load(f)
+
+        flags = set(flags)
+        _write_pickle(pd.Series(session.event), os.path.join(path, 'event.pkl'))
+        for name, attr in FRAME_ATTRS.items():
+            flag = FRAME_FLAGS.get(name)
+            if flag and flag not in flags:
+                continue
+            try:
+                frame = _frame(getattr(session, attr))
+            except Exception:
+                frame = None
+            if frame is not None:
+                _write_pickle(frame, os.path.join(path, f'{name}.pkl'))
+
+        if 'telemetry' in flags:
+            for attr in ('car_data', 'pos_data'):
+                frames = {drv: pd.DataFrame(frame) for drv, frame in getattr(session, attr).items()}
+                _write_pickle(frames, os.path.join(path, f'{attr}.pkl'))
+        if 'laps' in flags and not os.path.exists(os.path.join(path, 'position_data.pkl')):
+            try:
+                _write_pickle(_raw_position_data(session), os.path.join(path, 'position_data.pkl'))
+            except Exception as e:
+                print(f"Поток позиций {event_name} {year} не записан: {e}")
+
+        t0_date = getattr(session, 't0_date', None)
+        date = getattr(session, 'date', None)
+        meta = {
+            'year': int(year),
+            'event_name': event_name,
+            'round_number': int(session.event['RoundNumber']) if pd.notna(session.event.get('RoundNumber')) else None,
+            'aliases': sorted(set(previous.get('aliases', [])) | {str(event)}),
+            'session_type': str(session_type),
+            'name': str(session.name),
+            'api_path': getattr(session, 'api_path', None),
+            'date': str(date) if date is not None and pd.notna(date) else None,
+            't0_date': str(t0_date) if t0_date is not None and pd.notna(t0_date) else None,
+            'drivers': [str(drv) for drv in session.drivers],
+            'flags': sorted(flags | set(previous.get('flags', []))),
+            'load_seconds': load_seconds if load_seconds is not None else previous.get('load_seconds'),
+            'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds')
+        }
+        with open(f'{meta_path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(f'{meta_path}.tmp', meta_path)
+
+        with self._lock:
+            self._index = None
+            self._recorded += 1
+        print(f"Снимок {event_name} {year} ({session_type}) записан в {path}")
+        return path
+
+    def record_schedule(self, year, schedule):
+        path = os.path.join(self.root, str(int(year)))
+        os.makedirs(path, exist_ok=True)
+        _write_pickle(pd.DataFrame(schedule), os.path.join(path, 'schedule.pkl'))
+
+    # Воспроизведение
+
+    def _load_index(self):
+        with self._lock:
+            if self._index is not None:
+                return self._index
+        index = []
+        if self.root and os.path.isdir(self.root):
+            for dirpath, _, files in os.walk(self.root):
+                if META_FILE in files:
+                    with open(os.path.join(dirpath, META_FILE), encoding='utf-8') as f:
+                        index.append((dirpath, json.load(f)))
+        with self._lock:
+            self._index = index
+        return index
+
+    def find_session(self, year, event, session_type='R'):
+        """Путь и описание снимка сессии; этап ищется по названию, номеру раунда или имени из запроса"""
+        candidates = [(path, meta) for path, meta in self._load_index()
+                      if meta['year'] == int(year) and meta['session_type'] == str(session_type)]
+        key = _slug(event)
+        for path, meta in candidates:
+            if key == _slug(meta['event_name']) or key in (_slug(alias) for alias in meta['aliases']):
+                return path, meta
+        if key.isdigit():
+            for path, meta in candidates:
+                if meta['round_number'] == int(key):
+                    return path, meta
+        # Часть названия подходит, только если она указывает на один этап: иначе "grand prix"
+        # отдал бы первый попавшийся снимок вместо ошибки
+        partial = [(path, meta) for path, meta in candidates if key and key in _slug(meta['event_name'])]
+        if len(partial) == 1:
+            return partial[0]
+        return None, None
+
+    def load_session(self, year, event, session_type, flags):
+        """Сессия из снимка (FixtureSession) с имитацией времени загрузки FastF1"""
+        path, meta = self.find_session(year, event, session_type)
+        missing = set(flags) - set(meta['flags']) if meta else set()
+        if meta is None or missing:
+            with self._lock:
+                self._misses += 1
+            detail = f"нет данных {', '.join(sorted(missing))}" if meta else "снимок не записан"
+            raise FixtureNotFound(f"Сессия {event} {year} ({session_type}): {detail}")
+
+        started = time.perf_counter()
+        session = FixtureSession(path, meta, flags)
+        if self.latency_scale and meta.get('load_seconds'):
+            time.sleep(max(0.0, meta['load_seconds'] * self.latency_scale - (time.perf_counter() - started)))
+        with self._lock:
+            self._replayed += 1
+        return session
+
+    def load_schedule(self, year):
+        path = os.path.join(self.root, str(int(year)), 'schedule.pkl')
+        if not os.path.exists(path):
+            with self._lock:
+                self._misses += 1
+            raise FixtureNotFound(f"Расписание {year} не записано")
+        return pd.read_pickle(path)
+
+    def sessions(self):
+        """Записанные снимки: год, этап, сессия, флаги"""
+        return [{key: meta[key] for key in ('year', 'event_name', 'round_number', 'session_type',
+                                             'flags', 'load_seconds', 'recorded_at')}
+                for _, meta in sorted(self._load_index(), key=lambda item: item[0])]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'root': self.root,
+                'recorded': self._recorded,
+                'replayed': self._replayed,
+                'misses': self._misses
+            }
+
+
+fixture_store = FixtureStore()
@@ -0,0 +1,168 @@
+import hashlib
+from datetime import timedelta, timezone
+
+from flask import request, make_response
+from werkzeug.http import is_resource_modified
+
+from cache_policy import race_state
+from cache_utils import get_cache_statuses, is_cache_fresh
+from metrics import http_cache_responses
+from payload_store import payload_store
+from race_bundle import SECTIONS, revalidator
+from schedule_store import schedule_store
+from server_timing import stage
+
+# Сколько прокси и браузер могут отдавать данные окончательной гонки без проверки
+HISTORICAL_MAX_AGE = int(timedelta(days=7).total_seconds())
+
+# Расписание прошедших сезонов не меняется, текущего - изредка
+FINAL_SCHEDULE_MAX_AGE = int(timedelta(days=1).total_seconds())
+CURRENT_SCHEDULE_MAX_AGE = int(timedelta(minutes=10).total_seconds())
+
+
+def _as_utc(value):
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def is_historical(year, event):
+    """Гонка окончательная по политике кэша, ее данные больше не меняются"""
+    return race_state(year, event)[0] == 'final'
+
+
+def race_validators(year, event, data_types, statuses=None):
+    """
+    ETag и Last-Modified данных гонки по CacheStatus.last_updated.
+
+    Валидаторы строятся и по устаревшим записям: пока раздел обновляется
+    в фоне, отдается именно эта копия. Возвращает None, если хотя бы один
+    тип данных еще не сохранен в кэше БД: тогда валидатор можно построить
+    только по телу ответа.
+    """
+    data_types = sorted(set(data_types))
+    if statuses is None:
+        statuses = get_cache_statuses(year, event, data_types)
+    if any(data_type not in statuses for data_type in data_types):
+        return None
+
+    updated = {data_type: _as_utc(statuses[data_type].last_updated) for data_type in data_types}
+    key = '|'.join([str(year), event] + [f"{data_type}:{updated[data_type].isoformat()}" for data_type in data_types])
+    etag = hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+    return etag, max(updated.values())
+
+
+def _revalidate_stale(year, event, statuses):
+    """
+    Ставит устаревшие разделы на фоновое обновление.
+
+    Возвращает False, если фоновое обновление выключено: тогда кэшированную
+    копию отдавать нельзя, и ответ строится заново.
+    """
+    stale = [section for section, data_type in SECTIONS.items()
+             if data_type in statuses and not is_cache_fresh(statuses[data_type], year, event)]
+    return not stale or revalidator.submit(year, event, stale)
+
+
+def _set_cache_control(response, historical):
+    response.cache_control.public = True
+    if historical:
+        response.cache_control.max_age = HISTORICAL_MAX_AGE
+    else:
+        # Ответ можно хранить, но перед использованием надо проверить (получив 304)
+        response.cache_control.no_cache = True
+
+
+def _set_validators(response, validators):
+    """
+    ETag данных гонки всегда слабый: он описывает данные, а не байты, и
+    одинаков для сжатых и несжатых представлений, для 200 и для 304.
+    """
+    etag, last_modified = validators
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+
+
+def _payload_response(payload, validators, historical):
+    """Ответ из готового payload (тело уже в кодировке из Accept-Encoding)"""
+    response = make_response(payload.body)
+    response.mimetype = payload.mimetype
+    response.vary.add('Accept-Encoding')
+    if payload.encoding != 'identity':
+        response.content_encoding = payload.encoding
+    _set_validators(response, validators)
+    _set_cache_control(response, historical)
+    return response.make_conditional(request)
+
+
+def race_response(year, event, data_types, build, panel=None, cold=None):
+    """
+    Ответ с данными гонки с поддержкой условных запросов.
+
+    Если все типы данных уже есть в кэше БД и клиент прислал совпадающие
+    If-None-Match/If-Modified-Since, возвращается 304 без чтения данных;
+    устаревшие по политике кэша типы при этом обновляются в фоне.
+    build() возвращает (тело ответа, признак успеха); ответы с ошибкой
+    не кэшируются. Для раздела panel тело хранится в payload_store
+    заранее сжатым и отдается оттуда, пока не изменится ETag.
+    Если части типов данных в кэше БД нет, вызывается cold(типы данных):
+    его ответ (например, 202 с задачей заполнения) возвращается вместо
+    сборки в запросе, None означает собрать как обычно.
+    """
+    statuses = get_cache_statuses(year, event, data_types)
+    missing = [data_type for data_type in data_types if data_type not in statuses]
+    if missing and cold is not None:
+        response = cold(missing)
+        if response is not None:
+            http_cache_responses.inc(panel=panel or 'bundle', result='queued')
+            return response
+
+    validators = race_validators(year, event, data_types, statuses)
+    if validators and not _revalidate_stale(year, event, statuses):
+        validators = None
+    if validators and request.method in ('GET', 'HEAD') and not is_resource_modified(
+            request.environ, etag=validators[0], last_modified=validators[1]):
+        http_cache_responses.inc(panel=panel or 'bundle', result='not_modified')
+        response = make_response('', 304)
+        _set_validators(response, validators)
+        _set_cache_control(response, is_historical(year, event))
+        return response
+
+    if validators and panel:
+        with stage('payload'):
+            payload = payload_store.get(year, event, panel, validators[0], request.accept_encodings)
+        if payload is not None:
+            http_cache_responses.inc(panel=panel, result='payload')
+            return _payload_response(payload, validators, is_historical(year, event))
+
+    http_cache_responses.inc(panel=panel or 'bundle', result='built')
+    body, ok = build()
+    response = make_response(body)
+    if not ok:
+        response.cache_control.no_store = True
+        return response
+
+    # Валидаторы берутся после build(): он мог сохранить данные в кэш БД
+    validators = race_validators(year, event, data_types)
+    if validators and panel:
+        with stage('payload'):
+            payload = payload_store.put(year, event, panel, validators[0], response.mimetype, response.get_data(),
+                                        request.accept_encodings)
+        if payload is not None:
+            return _payload_response(payload, validators, is_historical(year, event))
+    if validators:
+        _set_validators(response, validators)
+    else:
+        response.add_etag()
+    _set_cache_control(response, is_historical(year, event))
+    return response.make_conditional(request)
+
+
+def schedule_response(year, body):
+    """Ответ с расписанием: ETag по содержимому и срок хранения по сезону"""
+    response = make_response(body)
+    response.add_etag()
+    response.cache_control.public = True
+    final = schedule_store.is_final(year)
+    response.cache_control.max_age = FINAL_SCHEDULE_MAX_AGE if final else CURRENT_SCHEDULE_MAX_AGE
+    return response.make_conditional(request)
@@ -0,0 +1,265 @@
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import fastf1 as f1
+
+from bulk_write import mark_cache_status, replace_race_rows
+from cache_utils import build_race_result_rows, position_data_rows, store_results_fragment, track_stats_rows
+from circuit_geometry import circuit_geometry_store
+from database import db, RaceResult, PositionData, TyreStrategy, PitstopData, TrackStats
+from fill_locks import fill_locks
+from fixture_store import fixture_store
+from metrics import db_write_duration, db_write_failures, db_write_rows
+from race_bundle import build_position_data
+from schedule_store import schedule_store
+from session_registry import load_session
+from strategy_utils import build_pitstop_data, build_tyre_strategy, pitstop_rows, tyre_strategy_rows
+from track_utils import build_track_stats
+from warmup import get_past_events, is_event_warm
+
+# Таблицы, которые заполняет конвейер, в порядке записи
+ARTIFACT_MODELS = {
+    'race_results': RaceResult,
+    'position_data': PositionData,
+    'tyre_strategy': TyreStrategy,
+    'pitstop_data': PitstopData,
+    'track_stats': TrackStats
+}
+
+
+def _timed(stages, name, func, *args):
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        stages[name] = time.perf_counter() - start
+
+
+def _artifact(stages, errors, name, func, *args):
+    """Артефакт гонки или None: ошибка записывается в errors, а не превращается в пустые данные"""
+    try:
+        return _timed(stages, name, func, *args)
+    except Exception as e:
+        errors[name] = str(e)
+        return None
+
+
+def compute_event_artifacts(year, event, event_info=None, cache_dir=None, fixtures=None):
+    """
+    Загружает одну сессию и считает по ней все артефакты гонки.
+
+    Выполняется в дочернем процессе: не обращается к БД и возвращает
+    только простые структуры, которые можно передать через pickle.
+    fixtures - настройки fixture_store.settings() родительского процесса.
+    """
+    if cache_dir:
+        f1.Cache.enable_cache(cache_dir)
+    if fixtures:
+        fixture_store.configure(*fixtures)
+
+    stages = {}
+    errors = {}
+    session = _timed(stages, 'load', _load_session, year, event)
+
+    artifacts = {
+        'race_results': _artifact(stages, errors, 'race_results', build_race_result_rows, year, event, session),
+        'position_data': _artifact(stages, errors, 'position_data', build_position_data, session),
+        'tyre_strategy': _artifact(stages, errors, 'tyre_strategy', build_tyre_strategy, session),
+        'pitstop_data': _artifact(stages, errors, 'pitstop_data', build_pitstop_data, session),
+        'track_stats': _artifact(stages, errors, 'track_stats', build_track_stats, session, year, event, event_info)
+    }
+
+    return {'year': year, 'event': event, 'event_info': event_info, 'artifacts': artifacts,
+            'errors': errors, 'stages': stages, 'pid': os.getpid()}
+
+
+def _load_session(year, event):
+    # Для карты трассы читаются только позиции опорного круга, полная телеметрия не нужна
+    return load_session(year, event, 'R', {'laps'})
+
+
+# Артефакт -> строки таблицы кэша (без year/event)
+ROW_BUILDERS = {
+    'race_results': lambda event, rows: rows,
+    'position_data': lambda event, data: position_data_rows(data),
+    'tyre_strategy': lambda event, data: tyre_strategy_rows(data),
+    'pitstop_data': lambda event, data: pitstop_rows(data),
+    'track_stats': track_stats_rows
+}
+
+
+def _to_rows(event, artifacts, errors=()):
+    """Строки таблиц кэша по артефактам гонки; артефакты с ошибкой пропускаются"""
+    return {data_type: build(event, artifacts[data_type])
+            for data_type, build in ROW_BUILDERS.items() if data_type not in errors}
+
+
+class BatchWriter:
+    """
+    Единственный писатель конвейера: копит строки нескольких гонок и
+    записывает их одной транзакцией вместе со статусами кэша.
+
+    CacheStatus ставится только разделам, которые посчитались без ошибки:
+    раздел с ошибкой остается холодным и загрузится повторно. Гонки
+    откатившегося пакета копятся в failed.
+    """
+
+    def __init__(self, batch_events=8):
+        self.batch_events = batch_events
+        self._pending = []
+        self._geometry = []
+        self.failed = []
+        self.rows = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    def add(self, year, event, artifacts, event_info=None, errors=()):
+        self._pending.append((year, event, _to_rows(event, artifacts, errors)))
+        if 'track_stats' not in errors:
+            self._geometry.append((year, event, event_info, artifacts['track_stats']))
+        if len(self._pending) >= self.batch_events:
+            self.flush()
+
+    def flush(self):
+        """Пишет накопленные гонки; возвращает (year, event) гонок, пакет которых откатился"""
+        if not self._pending:
+            return []
+
+        start = time.perf_counter()
+        rows = 0
+        failed = []
+        try:
+            for year, event, race_rows in self._pending:
+                # Не пересекаемся с заполнением кэша этой гонки по запросу
+                fill_locks.lock_in_transaction(year, event, ARTIFACT_MODELS)
+                for data_type, race_data in race_rows.items():
+                    rows += replace_race_rows(ARTIFACT_MODELS[data_type], year, event, race_data)
+                if 'race_results' in race_rows:
+                    store_results_fragment(year, event)
+                mark_cache_status(list(race_rows), year, event)
+            db.session.commit()
+            self.batches += 1
+            self.rows += rows
+            db_write_rows.observe(rows, writer='ingest')
+            db_write_duration.observe(time.perf_counter() - start, writer='ingest')
+        except Exception as e:
+            db.session.rollback()
+            db_write_failures.inc(writer='ingest')
+            failed = [(year, event) for year, event, _ in self._pending]
+            self._geometry = []
+            events = ', '.join(f"{event} {year}" for year, event in failed)
+            print(f"Ошибка пакетной записи ({events}): {e}")
+        finally:
+            self._pending = []
+            self.seconds += time.perf_counter() - start
+
+        # Геометрия площадок пишется после пакета: она общая для всех сезонов
+        for year, event, event_info, track_data in self._geometry:
+            try:
+                if not circuit_geometry_store.lookup(year, event_info):
+                    circuit_geometry_store.save(year, event, event_info, track_data)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Ошибка записи геометрии трассы {event} {year}: {e}")
+        self._geometry = []
+        self.failed.extend(failed)
+        return failed
+
+
+def run_ingestion(app, years, processes=None, batch_events=8, force=False):
+    """
+    Загружает сезоны целиком: гонки распределяются по пулу процессов,
+    каждый процесс считает все артефакты одной гонки, а результаты
+    по мере готовности пишет в БД один писатель пакетными транзакциями.
+    """
+    started = time.perf_counter()
+
+    with app.app_context():
+        jobs = []
+        for year in years:
+            try:
+                events = get_past_events(year)
+            except Exception as e:
+                print(f"Не удалось получить расписание за {year}: {e}")
+                continue
+            for event in events:
+                if force or not is_event_warm(year, event):
+                    jobs.append((year, event, schedule_store.get_event(year, event)))
+        db.session.remove()
+
+    total = len(jobs)
+    processes = processes or os.cpu_count() or 1
+    print(f"Загрузка {total} гонок в {processes} процессах")
+
+    stage_seconds = defaultdict(float)
+    failed = []
+    # (year, event, раздел, ошибка): гонка записана без этих разделов
+    artifact_errors = []
+    cache_dir = app.config.get('F1_CACHE_DIR') or None
+    fixtures = fixture_store.settings()
+
+    with app.app_context():
+        writer = BatchWriter(batch_events=batch_events)
+        # spawn, а не fork: в родительском процессе работают фоновые потоки и соединения с БД
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+            futures = {
+                executor.submit(compute_event_artifacts, year, event, event_info, cache_dir, fixtures): (year, event)
+                for year, event, event_info in jobs
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                year, event = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed.append((year, event))
+                    print(f"[{done}/{total}] {event} {year}: ошибка {e}")
+                    continue
+
+                for stage, seconds in result['stages'].items():
+                    stage_seconds[stage] += seconds
+                writer.add(year, event, result['artifacts'], result['event_info'], result['errors'])
+                artifact_errors.extend((year, event, data_type, error)
+                                       for data_type, error in result['errors'].items())
+                skipped = f", без разделов: {', '.join(result['errors'])}" if result['errors'] else ''
+                print(f"[{done}/{total}] {event} {year}: загрузка {result['stages']['load']:.1f} с "
+                      f"(процесс {result['pid']}){skipped}")
+        writer.flush()
+        db.session.remove()
+
+    # Гонки откатившихся пакетов не записаны, как и гонки с ошибкой загрузки
+    failed += writer.failed
+    wall = time.perf_counter() - started
+    report = {
+        'events': total - len(failed),
+        'failed': failed,
+        'artifact_errors': artifact_errors,
+        'wall_seconds': wall,
+        'stages': dict(stage_seconds),
+        'rows_written': writer.rows,
+        'write_batches': writer.batches,
+        'write_seconds': writer.seconds
+    }
+    print_report(report)
+    return report
+
+
+def print_report(report):
+    """Печатает пропускную способность конвейера по стадиям"""
+    events = report['events']
+    wall = report['wall_seconds'] or 1e-9
+    print(f"\nГонок: {events}, ошибок: {len(report['failed'])}, общее время {wall:.1f} с "
+          f"({events / wall * 60:.1f} гонок/мин)")
+    for stage, seconds in sorted(report['stages'].items(), key=lambda item: -item[1]):
+        per_event = seconds / events if events else 0
+        print(f"  {stage:15s} {seconds:9.1f} с суммарно по процессам, {per_event:.2f} с/гонка")
+    write_seconds = report['write_seconds'] or 1e-9
+    print(f"  {'write':15s} {report['write_seconds']:9.1f} с, {report['rows_written']} строк "
+          f"в {report['write_batches']} транзакциях ({report['rows_written'] / write_seconds:.0f} строк/с)")
+    if report['failed']:
+        print("Не записаны: " + ', '.join(f"{event} {year}" for year, event in report['failed']))
+    for year, event, data_type, error in report.get('artifact_errors', []):
+        print(f"  {event} {year}: раздел {data_type} не посчитан ({error}), загрузится повторно")
@@ -0,0 +1,137 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from database import db
+from race_bundle import fill_race_sections
+
+# Сколько секунд хранить завершенные задачи для опроса /jobs/<id>
+FINISHED_JOB_TTL = 600
+
+
+class Job:
+    """Задача заполнения кэша разделов одной гонки с прогрессом по этапам"""
+
+    def __init__(self, year, event, sections):
+        self.id = uuid.uuid4().hex
+        self.year = year
+        self.event = event
+        self.sections = list(sections)
+        self.state = 'queued'
+        stages = (['session'] if any(section != 'track_stats' for section in self.sections) else []) + self.sections
+        self.stages = {stage: 'pending' for stage in stages}
+        self.errors = {}
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        done = sum(1 for state in self.stages.values() if state in ('done', 'error'))
+        now = self.finished_at or time.time()
+        return {
+            'id': self.id,
+            'year': self.year,
+            'event': self.event,
+            'sections': self.sections,
+            'state': self.state,
+            'stages': dict(self.stages),
+            'progress': round(done / len(self.stages), 2) if self.stages else 1.0,
+            'errors': dict(self.errors),
+            'queued_seconds': round((self.started_at or now) - self.created_at, 3),
+            'running_seconds': round(now - self.started_at, 3) if self.started_at else 0.0
+        }
+
+
+class JobQueue:
+    """
+    Очередь холодных заполнений кэша в пуле потоков процесса.
+
+    Запрос раздела, которого еще нет в кэше БД, не ждет загрузки FastF1:
+    он ставит задачу и сразу получает 202 с ее идентификатором, а поток
+    веб-сервера освобождается для запросов к прогретым гонкам. Пока
+    задача тех же разделов гонки не завершена, новые запросы получают ее
+    же. Задачи живут в памяти процесса; если /jobs/<id> попал в другой
+    процесс, клиент просто повторяет исходный запрос.
+    """
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._app = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active = {}
+
+    def init_app(self, app, background=True, workers=None):
+        self._app = app
+        if workers:
+            self.workers = workers
+        if background and self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='cold-fill')
+
+    @property
+    def enabled(self):
+        return self._executor is not None
+
+    def submit(self, year, event, sections):
+        """Ставит заполнение разделов в очередь и возвращает задачу (словарь) или None, если очередь выключена"""
+        if not self.enabled:
+            return None
+        key = (year, event, tuple(sorted(sections)))
+        with self._lock:
+            self._purge_locked()
+            job = self._active.get(key)
+            if job is None:
+                job = Job(year, event, sections)
+                self._jobs[job.id] = job
+                self._active[key] = job
+                self._executor.submit(self._run, job, key)
+                print(f"Задача {job.id}: заполнение {', '.join(sections)} для {event} {year} поставлена в очередь")
+            return job.to_dict()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def _progress(self, job, stage, state):
+        with self._lock:
+            job.stages[stage] = state
+
+    def _run(self, job, key):
+        with self._lock:
+            job.state = 'running'
+            job.started_at = time.time()
+        try:
+            with self._app.app_context():
+                bundle = fill_race_sections(job.year, job.event, job.sections,
+                                            progress=lambda stage, state: self._progress(job, stage, state))
+                db.session.remove()
+            errors = bundle['errors']
+        except Exception as e:
+            print(f"Ошибка задачи {job.id} ({job.event} {job.year}): {e}")
+            errors = {section: str(e) for section in job.sections}
+
+        with self._lock:
+            job.errors = errors
+            job.state = 'failed' if errors else 'done'
+            job.finished_at = time.time()
+            self._active.pop(key, None)
+        print(f"Задача {job.id}: {job.state} за {job.finished_at - job.started_at:.1f} с")
+
+    def _purge_locked(self):
+        deadline = time.time() - FINISHED_JOB_TTL
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at and job.finished_at < deadline]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            states = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+            for job in self._jobs.values():
+                states[job.state] += 1
+            return states
+
+
+job_queue = JobQueue()
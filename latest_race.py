@@ -0,0 +1,201 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from database import db, LatestRace
+from fill_locks import fill_locks
+from schedule_store import schedule_store
+from utils import get_latest_race
+
+# Через сколько после старта гонки ожидаем опубликованные результаты
+RESULTS_DELAY = timedelta(hours=3)
+# Как часто повторять поиск, если результаты прошедшей гонки еще не появились
+RETRY_INTERVAL = timedelta(minutes=30)
+# Сколько времени после гонки продолжать повторные попытки
+RETRY_WINDOW = timedelta(days=2)
+# Как долго отдавать устаревшее значение, пока его обновляет другой процесс
+STALE_RECHECK = timedelta(minutes=1)
+# Ключ блокировки обновления между процессами (data_type, year, event для fill_locks)
+REFRESH_LOCK = ('latest_race', 0, 'refresh')
+
+
+def _utcnow():
+    """Текущее время UTC без tzinfo, как хранится в БД и в расписании FastF1"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def get_race_end_times(years):
+    """Возвращает список (год, этап, время ожидаемых результатов) по расписанию"""
+    ends = []
+    for year in years:
+        try:
+            schedule = schedule_store.get_schedule(year)
+        except Exception as e:
+            print(f"Не удалось получить расписание за {year}: {e}")
+            continue
+        for event in schedule:
+            if event['event_name'] == 'Test' or event['round_number'] == 0:
+                continue
+            start = event['race_date_utc'] or event['event_date']
+            if start is None:
+                continue
+            ends.append((year, event['event_name'], start + RESULTS_DELAY))
+    return sorted(ends, key=lambda item: item[2])
+
+
+class LatestRaceResolver:
+    """
+    Кэш последней гонки с результатами для главной страницы.
+
+    Значение хранится в памяти процесса с TTL и в таблице latest_race,
+    чтобы новый воркер не повторял обход расписания. После планового
+    окончания гонки значение обновляет фоновый поток, а без него - первый
+    запрос, увидевший устаревшую строку. Обновляет один процесс: под
+    advisory-блокировкой (fill_locks), остальные пока отдают прежнее значение.
+    """
+
+    def __init__(self, ttl=timedelta(hours=6)):
+        self.ttl = ttl
+        self._app = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._value = None
+        self._expires_at = 0
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def init_app(self, app, background=True):
+        self._app = app
+        if background and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='latest-race-refresh', daemon=True)
+            self._thread.start()
+
+    def _remember(self, row):
+        # В памяти держим значение не дольше TTL и не дольше следующего планового обновления
+        ttl = self.ttl.total_seconds()
+        if row.next_refresh_at is not None:
+            ttl = min(ttl, max(0, (row.next_refresh_at - _utcnow()).total_seconds()))
+        with self._lock:
+            self._value = (row.year, row.event)
+            self._expires_at = time.monotonic() + ttl
+        return self._value
+
+    @staticmethod
+    def _is_stale(row):
+        return row is None or row.next_refresh_at is None or row.next_refresh_at <= _utcnow()
+
+    def _remember_for(self, row, seconds):
+        with self._lock:
+            self._value = (row.year, row.event)
+            self._expires_at = time.monotonic() + seconds
+        return self._value
+
+    def get(self):
+        """Возвращает (год, этап) последней гонки без обращений к FastF1, если значение уже найдено"""
+        with self._lock:
+            if self._value is not None and time.monotonic() < self._expires_at:
+                return self._value
+
+        row = db.session.get(LatestRace, 1)
+        if not self._is_stale(row):
+            return self._remember(row)
+
+        # Значения нет или оно устарело - обновляем сами, если не обновляет другой процесс
+        try:
+            value = self._refresh_if_stale(wait=row is None)
+        except Exception as e:
+            if row is None:
+                raise
+            print(f"Ошибка обновления последней гонки: {e}")
+            return self._remember_for(row, RETRY_INTERVAL.total_seconds())
+        if value is not None:
+            return value
+        if row is None:
+            return self.refresh()
+        return self._remember_for(row, STALE_RECHECK.total_seconds())
+
+    def _refresh_if_stale(self, wait):
+        """
+        Обновляет значение под блокировкой между процессами, если оно все
+        еще устарело. Возвращает None, если блокировку держит другой процесс.
+        """
+        with self._refresh_lock:
+            lock = fill_locks.acquire(REFRESH_LOCK[1], REFRESH_LOCK[2], [REFRESH_LOCK[0]], wait=wait)
+            if lock is None:
+                return None
+            try:
+                # Другой процесс мог обновить строку, пока мы ждали блокировку
+                row = db.session.get(LatestRace, 1, populate_existing=True)
+                if not self._is_stale(row):
+                    return self._remember(row)
+                return self.refresh()
+            finally:
+                lock.release()
+
+    def _next_refresh_at(self, value, now):
+        ends = get_race_end_times([now.year - 1, now.year, now.year + 1])
+        past = [item for item in ends if item[2] <= now]
+        upcoming = [item for item in ends if item[2] > now]
+
+        if past:
+            last_year, last_event, last_end = past[-1]
+            # Результаты только что прошедшей гонки еще не опубликованы
+            if value != (last_year, last_event) and now - last_end < RETRY_WINDOW:
+                return now + RETRY_INTERVAL
+        if upcoming:
+            return upcoming[0][2]
+        return now + self.ttl
+
+    def refresh(self):
+        """Заново находит последнюю гонку и сохраняет результат в БД"""
+        value = get_latest_race()
+        now = _utcnow()
+
+        row = db.session.get(LatestRace, 1)
+        if row is None:
+            row = LatestRace(id=1, year=value[0], event=value[1], resolved_at=now)
+            db.session.add(row)
+        row.year, row.event = value
+        row.resolved_at = now
+        row.next_refresh_at = self._next_refresh_at(value, now)
+
+        try:
+            db.session.commit()
+            print(f"Последняя гонка: {value[1]} {value[0]}, следующее обновление {row.next_refresh_at}")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Ошибка сохранения последней гонки: {e}")
+            with self._lock:
+                self._value = value
+                self._expires_at = time.monotonic() + RETRY_INTERVAL.total_seconds()
+            return value
+
+        return self._remember(row)
+
+    def _run(self):
+        """Фоновое обновление после окончания каждой гонки"""
+        while True:
+            wait = RETRY_INTERVAL.total_seconds()
+            with self._app.app_context():
+                try:
+                    row = db.session.get(LatestRace, 1)
+                    if self._is_stale(row):
+                        self._refresh_if_stale(wait=False)
+                        row = db.session.get(LatestRace, 1, populate_existing=True)
+                    elif row is not None:
+                        self._remember(row)
+                    if row is not None and row.next_refresh_at is not None:
+                        wait = (row.next_refresh_at - _utcnow()).total_seconds()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Ошибка фонового обновления последней гонки: {e}")
+                finally:
+                    db.session.remove()
+
+            # Просыпаемся не реже раза в TTL, чтобы заметить обновление из другого воркера
+            wait = min(max(wait, 60), self.ttl.total_seconds())
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+
+
+latest_race_resolver = LatestRaceResolver()
@@ -0,0 +1,408 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+
+from bulk_write import mark_cache_status, upsert
+from cache_policy import race_state
+from cache_utils import position_data_rows
+from database import db, CacheStatus, PositionData, TyreStrategy
+from session_registry import get_session
+from strategy_utils import tyre_strategy_rows
+from utils import get_team_color
+
+# Сколько последних событий хранить для переподключения по Last-Event-ID
+HISTORY_SIZE = 500
+# Пустой комментарий SSE раз в столько секунд, чтобы прокси не закрывали соединение
+HEARTBEAT_SECONDS = 15
+# Очередь подписчика; медленный клиент, не успевший ее разобрать, отключается
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+def _optional_int(value):
+    return int(value) if pd.notna(value) else None
+
+
+def lap_records(laps):
+    """
+    Круги сессии в виде записей живого потока, в порядке завершения круга.
+
+    Запись - словарь driver, driver_number, team, lap, position, compound,
+    stint и time (секунды от начала сессии). Такие записи отдают все
+    источники живых данных.
+    """
+    laps = laps.dropna(subset=['Time', 'LapNumber']).sort_values('Time', kind='mergesort')
+    records = []
+    for row in laps[['Driver', 'DriverNumber', 'Team', 'LapNumber', 'Position',
+                     'Compound', 'Stint', 'Time']].itertuples(index=False):
+        records.append({
+            'driver': str(row.Driver),
+            'driver_number': str(row.DriverNumber),
+            'team': str(row.Team) if pd.notna(row.Team) else 'Unknown',
+            'lap': int(row.LapNumber),
+            'position': _optional_int(row.Position),
+            'compound': str(row.Compound) if pd.notna(row.Compound) else 'UNKNOWN',
+            'stint': _optional_int(row.Stint),
+            'time': row.Time.total_seconds()
+        })
+    return records
+
+
+class ReplayFeed:
+    """
+    Локальный источник вместо живого тайминга: круги уже загруженной
+    гонки отдаются в темпе гонки, ускоренном в speed раз.
+
+    Итерация дает пачки записей (см. lap_records), пришедшие вместе;
+    записи не дальше batch_seconds гоночного времени друг от друга
+    объединяются в одну пачку.
+    """
+
+    def __init__(self, records, speed=10.0, batch_seconds=1.0):
+        self.records = records
+        self.speed = speed
+        self.batch_seconds = batch_seconds
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_session(cls, year, event, session_type='R', **kwargs):
+        session = get_session(year, event, session_type, laps=True)
+        return cls(lap_records(session.laps), **kwargs)
+
+    def stop(self):
+        self._stop.set()
+
+    def __iter__(self):
+        batch = []
+        previous = None
+        for record in self.records:
+            if batch and record['time'] - batch[0]['time'] > self.batch_seconds:
+                yield batch
+                batch = []
+            if previous is not None and self.speed:
+                if self._stop.wait(max(0.0, record['time'] - previous) / self.speed):
+                    return
+            elif self._stop.is_set():
+                return
+            previous = record['time']
+            batch.append(record)
+        if batch:
+            yield batch
+
+
+class LiveRaceState:
+    """Позиции и стинты гонки, накопленные из живого потока"""
+
+    def __init__(self):
+        self.drivers = {}
+        self.stints = {}
+        self.last_lap = 0
+
+    def apply(self, records):
+        """Добавляет круги и возвращает изменения: новые точки позиций и стинты затронутых пилотов"""
+        positions = {}
+        stints_changed = set()
+        for record in records:
+            name = record['driver']
+            driver = self.drivers.get(name)
+            if driver is None:
+                teammates = sum(1 for other in self.drivers.values() if other['team'] == record['team'])
+                driver = self.drivers[name] = {
+                    'name': name,
+                    'team': record['team'],
+                    'color': get_team_color(record['team']),
+                    'dash': 'solid' if teammates == 0 else 'dash',
+                    'laps': [],
+                    'positions': []
+                }
+            if driver['laps'] and record['lap'] <= driver['laps'][-1]:
+                continue
+            driver['laps'].append(float(record['lap']))
+            driver['positions'].append(record['position'])
+            self.last_lap = max(self.last_lap, record['lap'])
+
+            delta = positions.setdefault(name, dict(driver, laps=[], positions=[]))
+            delta['laps'].append(float(record['lap']))
+            delta['positions'].append(record['position'])
+
+            self._extend_stint(name, record)
+            stints_changed.add(name)
+
+        return {
+            'positions': list(positions.values()),
+            'stints': [{'driver': name, 'stints': [dict(stint) for stint in self.stints[name]]}
+                       for name in sorted(stints_changed)],
+            'last_lap': self.last_lap
+        }
+
+    def _extend_stint(self, name, record):
+        stints = self.stints.setdefault(name, [])
+        # Номер стинта иногда пропущен: тогда стинт продолжается, пока не сменится состав
+        stint_number = record['stint'] if record['stint'] is not None else (
+            stints[-1]['stint'] if stints else 1)
+        last = stints[-1] if stints else None
+        if last and last['stint'] == stint_number and last['compound'] == record['compound']:
+            last['end_lap'] = record['lap']
+            last['stint_length'] += 1
+        else:
+            stints.append({'stint': stint_number, 'compound': record['compound'],
+                           'start_lap': record['lap'], 'end_lap': record['lap'], 'stint_length': 1})
+
+    def position_data(self):
+        return [dict(driver, laps=list(driver['laps']), positions=list(driver['positions']))
+                for driver in list(self.drivers.values())]
+
+    def strategy_data(self):
+        return [{'driver': name, 'stints': [dict(stint) for stint in stints],
+                 'total_laps': sum(stint['stint_length'] for stint in stints)}
+                for name, stints in list(self.stints.items())]
+
+
+def _disconnect(subscriber):
+    """Очищает очередь подписчика и ставит в нее признак конца потока"""
+    with subscriber.mutex:
+        subscriber.queue.clear()
+    subscriber.put_nowait(None)
+
+
+class Broadcaster:
+    """Рассылка событий SSE подписчикам гонки с историей для переподключения"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self._next_id = 1
+        self._closed = False
+
+    def publish(self, event, data):
+        with self._lock:
+            message = (self._next_id, event, json.dumps(data, ensure_ascii=False))
+            self._next_id += 1
+            self._history.append(message)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # Клиент не успевает читать: отключаем, он переподключится с Last-Event-ID
+                self.unsubscribe(subscriber)
+                _disconnect(subscriber)
+
+    def subscribe(self, last_event_id=None):
+        """
+        Очередь новых событий; с last_event_id в нее сначала попадают пропущенные.
+        После close() очередь сразу заканчивается признаком конца потока.
+        """
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE + HISTORY_SIZE)
+        with self._lock:
+            if last_event_id is not None:
+                for message in self._history:
+                    if message[0] > last_event_id:
+                        subscriber.put_nowait(message)
+            if self._closed:
+                subscriber.put_nowait(None)
+            else:
+                self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for subscriber in subscribers:
+            # Непрочитанные события (включая end) остаются в очереди перед признаком конца
+            try:
+                subscriber.put_nowait(None)
+            except queue.Full:
+                _disconnect(subscriber)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+def format_sse(message):
+    event_id, event, data = message
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+
+class LiveRace:
+    """Живая гонка: поток кругов, накопленное состояние и подписчики"""
+
+    def __init__(self, year, event, feed):
+        self.year = year
+        self.event = event
+        self.feed = feed
+        self.state = LiveRaceState()
+        self.broadcaster = Broadcaster()
+        self.status = 'starting'
+        self.laps_received = 0
+        self.started_at = time.time()
+        self.thread = None
+
+    def info(self):
+        return {
+            'year': self.year,
+            'event': self.event,
+            'status': self.status,
+            'laps_received': self.laps_received,
+            'last_lap': self.state.last_lap,
+            'subscribers': self.broadcaster.subscriber_count,
+            'running_seconds': round(time.time() - self.started_at, 1)
+        }
+
+
+class LiveRaces:
+    """
+    Живой режим гонок уик-энда.
+
+    Новые круги из источника (живой тайминг или ReplayFeed) дописываются
+    в PositionData и TyreStrategy пачками, CacheStatus обновляется на
+    каждой пачке, а подписанные браузеры получают по SSE только
+    изменения: новые точки графика позиций и стинты затронутых пилотов.
+    Подписчики и состояние живут в памяти процесса, в котором запущен
+    поток кругов.
+    """
+
+    def __init__(self):
+        self._app = None
+        self._lock = threading.Lock()
+        self._races = {}
+
+    def init_app(self, app):
+        self._app = app
+
+    def start(self, year, event, feed):
+        """
+        Запускает прием кругов гонки из feed; данные гонки в БД начинаются заново.
+        Гонку, которая уже закончилась и чьи позиции или стратегии есть в кэше,
+        живой режим не перезаписывает.
+        """
+        key = (year, event)
+        with self._app.app_context():
+            if race_state(year, event)[0] != 'live' and CacheStatus.query.filter(
+                    CacheStatus.data_type.in_(['position_data', 'tyre_strategy']),
+                    CacheStatus.year == year, CacheStatus.event == event).first() is not None:
+                raise ValueError(f"Данные {event} {year} уже в кэше, живой режим их не перезаписывает")
+        with self._lock:
+            race = self._races.get(key)
+            if race is not None and race.status in ('starting', 'running'):
+                raise ValueError(f"Живой режим {event} {year} уже запущен")
+            race = self._races[key] = LiveRace(year, event, feed)
+
+        with self._app.app_context():
+            PositionData.query.filter_by(year=year, event=event).delete()
+            TyreStrategy.query.filter_by(year=year, event=event).delete()
+            db.session.commit()
+
+        race.thread = threading.Thread(target=self._run, args=(race,), name=f'live-{year}-{event}', daemon=True)
+        race.thread.start()
+        print(f"Живой режим {event} {year} запущен")
+        return race.info()
+
+    def stop(self, year, event):
+        race = self.get(year, event)
+        if race is None:
+            return None
+        race.feed.stop()
+        return race.info()
+
+    def get(self, year, event):
+        with self._lock:
+            return self._races.get((year, event))
+
+    def is_live(self, year, event):
+        race = self.get(year, event)
+        return race is not None and race.status in ('starting', 'running')
+
+    def snapshot(self, year, event):
+        """Текущие данные живой гонки для /positions и /tyre_strategy или None"""
+        race = self.get(year, event)
+        if race is None or race.status not in ('starting', 'running'):
+            return None
+        return {'positions': race.state.position_data(), 'tyre_strategy': race.state.strategy_data(),
+                'last_lap': race.state.last_lap}
+
+    def _run(self, race):
+        race.status = 'running'
+        try:
+            with self._app.app_context():
+                for records in race.feed:
+                    delta = race.state.apply(records)
+                    if not delta['positions']:
+                        continue
+                    race.laps_received += sum(len(driver['laps']) for driver in delta['positions'])
+                    self._persist(race, delta)
+                    race.broadcaster.publish('laps', delta)
+                db.session.remove()
+            race.status = 'finished'
+        except Exception as e:
+            race.status = 'failed'
+            print(f"Ошибка живого режима {race.event} {race.year}: {e}")
+        race.broadcaster.publish('end', {'status': race.status, 'last_lap': race.state.last_lap})
+        race.broadcaster.close()
+        print(f"Живой режим {race.event} {race.year}: {race.status}, кругов {race.laps_received}")
+
+    @staticmethod
+    def _persist(race, delta):
+        """Дописывает круги затронутых пилотов в PositionData и TyreStrategy одной транзакцией со статусами кэша"""
+        year, event = race.year, race.event
+        names = [driver['name'] for driver in delta['positions']]
+        positions = position_data_rows([race.state.drivers[name] for name in names])
+        strategies = tyre_strategy_rows([{'driver': name, 'stints': race.state.stints[name]} for name in names])
+        try:
+            upsert(PositionData, [dict(row, year=year, event=event) for row in positions],
+                   ('year', 'event', 'driver_code'))
+            upsert(TyreStrategy, [dict(row, year=year, event=event) for row in strategies],
+                   ('year', 'event', 'driver_code'))
+            mark_cache_status(['position_data', 'tyre_strategy'], year, event)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Ошибка записи живых данных {event} {year}: {e}")
+
+    def stream(self, year, event, last_event_id=None):
+        """
+        Генератор SSE для подписчика: сначала снимок текущих данных (если
+        клиент подключается впервые), затем изменения по мере прихода кругов.
+        """
+        race = self.get(year, event)
+        subscriber = race.broadcaster.subscribe(last_event_id)
+        snapshot = self.snapshot(year, event) if last_event_id is None else None
+
+        def generate():
+            try:
+                yield "retry: 3000\n\n"
+                if snapshot is not None:
+                    yield f"event: snapshot\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+                while True:
+                    try:
+                        message = subscriber.get(timeout=HEARTBEAT_SECONDS)
+                    except queue.Empty:
+                        yield ": heartbeat\n\n"
+                        continue
+                    if message is None:
+                        return
+                    yield format_sse(message)
+            finally:
+                race.broadcaster.unsubscribe(subscriber)
+
+        return generate()
+
+    def stats(self):
+        with self._lock:
+            races = list(self._races.values())
+        return [race.info() for race in races]
+
+
+live_races = LiveRaces()
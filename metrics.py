@@ -0,0 +1,229 @@
+import threading
+import time
+
+from flask import g, request
+
+# Границы гистограмм по умолчанию: длительности в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Длительности загрузок FastF1 и пакетной записи больше, чем у запросов
+SLOW_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Объемы в байтах: от 64 КБ до 4 ГБ с шагом x4
+BYTES_BUCKETS = tuple(64 * 1024 * 4 ** i for i in range(9))
+# Число строк в пакете записи
+ROWS_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _snapshot(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, value in self._snapshot():
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонный счетчик"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_sample(self, key, value):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}']
+
+
+class Histogram(_Metric):
+    """Гистограмма с накопительными корзинами, суммой и числом наблюдений"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def _snapshot(self):
+        with self._lock:
+            return sorted((key, dict(state, counts=list(state['counts'])))
+                          for key, state in self._values.items())
+
+    def _render_sample(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state['counts']):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(state["sum"])}')
+        lines.append(f'{self.name}_count{labels} {state["count"]}')
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Значение, которое считывается в момент запроса /metrics.
+
+    collect() возвращает число (метрика без меток) или словарь
+    {кортеж значений меток: число}.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, collect, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._collect = collect
+
+    def render(self):
+        try:
+            values = self._collect()
+        except Exception as e:
+            print(f"Ошибка сбора метрики {self.name}: {e}")
+            values = {}
+        if not isinstance(values, dict):
+            values = {(): values}
+        with self._lock:
+            self._values = {tuple(str(v) for v in key): value for key, value in values.items()
+                            if value is not None}
+        return super().render()
+
+    def _render_sample(self, key, value):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}']
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса в текстовом формате Prometheus.
+
+    Счетчики и гистограммы обновляются по месту событий (запросы, чтение
+    кэша, загрузка сессий, пакетная запись), а размеры кэшей в памяти
+    считываются функциями-сборщиками только при запросе /metrics, без
+    обращений к БД. Метрики живут в памяти процесса: при нескольких
+    воркерах каждый отдает свои, и суммирует их Prometheus.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, collect, labelnames=()):
+        return self._register(Gauge(name, documentation, collect, labelnames))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def init_app(self, app):
+        """Измеряет длительность каждого запроса по эндпоинту, методу и статусу"""
+        @app.before_request
+        def _start_timer():
+            g.metrics_started = time.perf_counter()
+
+        @app.after_request
+        def _observe_request(response):
+            started = g.pop('metrics_started', None)
+            if started is not None:
+                request_duration.observe(time.perf_counter() - started,
+                                         endpoint=request.endpoint or 'unknown',
+                                         method=request.method,
+                                         status=response.status_code)
+            return response
+
+
+metrics = MetricsRegistry()
+
+request_duration = metrics.histogram(
+    'f1_http_request_duration_seconds', 'Длительность HTTP-запросов',
+    ('endpoint', 'method', 'status'))
+cache_lookups = metrics.counter(
+    'f1_cache_lookups_total', 'Чтения кэша БД по типу данных: hit - свежая копия, '
+    'stale - устаревшая копия отдана с фоновым обновлением, miss - данные считаются заново',
+    ('data_type', 'result'))
+section_fill_duration = metrics.histogram(
+    'f1_section_fill_seconds', 'Расчет и сохранение раздела из загруженной сессии',
+    ('data_type',))
+session_load_duration = metrics.histogram(
+    'f1_session_load_seconds', 'Загрузка сессии FastF1', ('session_type',), buckets=SLOW_BUCKETS)
+session_load_bytes = metrics.histogram(
+    'f1_session_load_bytes', 'Объем загруженной сессии FastF1 в памяти', ('session_type',),
+    buckets=BYTES_BUCKETS)
+session_load_failures = metrics.counter(
+    'f1_session_load_failures_total', 'Неудачные загрузки сессий FastF1', ('session_type',))
+db_write_duration = metrics.histogram(
+    'f1_db_write_batch_seconds', 'Длительность пакетной записи в БД', ('writer',), buckets=SLOW_BUCKETS)
+db_write_rows = metrics.histogram(
+    'f1_db_write_batch_rows', 'Число строк в пакете записи в БД', ('writer',), buckets=ROWS_BUCKETS)
+http_cache_responses = metrics.counter(
+    'f1_http_cache_responses_total', 'Ответы с данными гонки: not_modified - 304, payload - готовое '
+    'сжатое тело, built - тело собрано заново, queued - холодное заполнение поставлено в очередь (202)',
+    ('panel', 'result'))
+db_write_failures = metrics.counter(
+    'f1_db_write_batch_failures_total', 'Пакеты записи в БД, откаченные из-за ошибки', ('writer',))
@@ -0,0 +1,93 @@
+import json
+
+from sqlalchemy import bindparam, inspect, or_, select, text
+
+from database import db, CircuitGeometry, PositionData, TrackStats, TyreStrategy
+from packed_arrays import pack_coordinates, pack_laps, pack_positions, pack_stints
+
+# Прежний JSON-столбец -> (упакованный столбец, функция упаковки) по моделям
+PACKED_COLUMNS = {
+    PositionData: {'positions_json': ('positions_packed', pack_positions),
+                   'laps_json': ('laps_packed', pack_laps)},
+    TyreStrategy: {'stints_json': ('stints_packed', pack_stints)},
+    TrackStats: {'coordinates_json': ('coordinates_packed', pack_coordinates)},
+    CircuitGeometry: {'coordinates_json': ('coordinates_packed', pack_coordinates)}
+}
+
+
+def ensure_packed_columns():
+    """
+    Добавляет столбцы *_packed в таблицы, созданные до перехода на
+    упакованные массивы (db.create_all не меняет существующие таблицы).
+    """
+    inspector = inspect(db.engine)
+    column_type = db.LargeBinary().compile(dialect=db.engine.dialect)
+    added = []
+    with db.engine.begin() as connection:
+        for model, columns in PACKED_COLUMNS.items():
+            table = model.__tablename__
+            existing = {column['name'] for column in inspector.get_columns(table)}
+            for packed, _ in columns.values():
+                if packed not in existing:
+                    connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {packed} {column_type}'))
+                    added.append(f'{table}.{packed}')
+    if added:
+        print(f"Добавлены столбцы упакованных массивов: {', '.join(added)}")
+    return added
+
+
+def _migrate_table(model, columns, batch_size):
+    table = model.__table__
+    selected = [table.c.id] + [table.c[name] for name in columns] + \
+        [table.c[packed] for packed, _ in columns.values()]
+    pending = or_(*(table.c[name].isnot(None) for name in columns))
+    update = table.update().where(table.c.id == bindparam('row_id')).values(
+        {**{name: None for name in columns}, **{packed: bindparam(f'{packed}_value') for packed, _ in columns.values()}})
+
+    report = {'rows': 0, 'json_bytes': 0, 'packed_bytes': 0}
+    last_id = 0
+    while True:
+        rows = db.session.execute(select(*selected).where(pending, table.c.id > last_id)
+                                  .order_by(table.c.id).limit(batch_size)).mappings().all()
+        if not rows:
+            break
+        params = []
+        for row in rows:
+            values = {'row_id': row['id']}
+            for name, (packed, pack) in columns.items():
+                if row[name] is None:
+                    values[f'{packed}_value'] = row[packed]
+                    continue
+                blob = pack(json.loads(row[name]))
+                values[f'{packed}_value'] = blob
+                report['json_bytes'] += len(row[name].encode('utf-8'))
+                report['packed_bytes'] += len(blob)
+            params.append(values)
+        db.session.execute(update, params)
+        db.session.commit()
+        report['rows'] += len(rows)
+        last_id = rows[-1]['id']
+    return report
+
+
+def migrate_json_arrays(batch_size=500):
+    """
+    Переносит массивы, записанные в JSON, в упакованные столбцы.
+
+    Строки обрабатываются пачками по batch_size с commit после каждой,
+    поэтому перенос можно прервать и продолжить: JSON строки обнуляется
+    в той же транзакции, где пишется упакованное значение. Прежние
+    столбцы остаются в схеме, пустые значения в них почти не занимают места.
+    """
+    ensure_packed_columns()
+    reports = {}
+    for model, columns in PACKED_COLUMNS.items():
+        report = _migrate_table(model, columns, batch_size)
+        reports[model.__tablename__] = report
+        if report['rows']:
+            ratio = report['json_bytes'] / report['packed_bytes'] if report['packed_bytes'] else 0
+            print(f"{model.__tablename__}: {report['rows']} строк, JSON {report['json_bytes']} байт -> "
+                  f"{report['packed_bytes']} байт ({ratio:.1f}x)")
+        else:
+            print(f"{model.__tablename__}: переносить нечего")
+    return reports
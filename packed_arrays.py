@@ -0,0 +1,176 @@
+import json
+import struct
+
+import numpy as np
+
+# Массивы кэша (позиции, круги, стинты, координаты) хранятся в bytea как
+# little-endian байты: первый байт - вид упаковки, дальше данные. Чтение идет
+# прямо в NumPy (np.frombuffer) или список, без разбора JSON.
+INT8 = b'b'       # int8, None хранится как INT8_NONE (позиции в гонке)
+INT16 = b'h'      # int16, None хранится как INT16_NONE
+FLOAT32 = b'f'    # float32
+RANGE = b'r'      # последовательные целые start..start+count-1 (номера кругов)
+POINTS = b'p'     # пары float32 (x, y): только чтение строк, упакованных раньше
+POINTS64 = b'd'   # пары float64 (x, y): точки трассы без потери точности против JSON
+STINTS = b's'     # стинты: таблица составов и записи int16
+JSON = b'j'       # запасной вариант для данных, которые не укладываются в схему
+
+INT8_NONE = -128
+INT16_NONE = -32768
+INT16_MAX = 32767
+
+# Целые поля стинта в порядке хранения; у стинтов живого режима есть еще номер стинта
+STINT_FIELDS = ('stint', 'start_lap', 'end_lap', 'stint_length')
+
+_RANGE_HEADER = struct.Struct('<iI')
+_STINTS_HEADER = struct.Struct('<BH')
+# Ключи записи стинта по битовой маске полей
+_STINT_KEYS = {mask: ('compound', *(field for i, field in enumerate(STINT_FIELDS) if mask & (1 << i)))
+               for mask in range(1 << len(STINT_FIELDS))}
+
+
+def _int16(value):
+    """Целое для int16 (None и NaN - INT16_NONE) или ValueError"""
+    if value is None or value != value:
+        return INT16_NONE
+    if value != int(value) or abs(int(value)) > INT16_MAX:
+        raise ValueError(f"{value} не помещается в int16")
+    return int(value)
+
+
+def pack_json(value):
+    return JSON + json.dumps(value).encode('utf-8')
+
+
+def pack_positions(values):
+    """Позиции по кругам (целые или None) в int8, а если не помещаются - в int16"""
+    values = list(values)
+    try:
+        array = np.array([_int16(value) for value in values], dtype='<i2')
+    except (TypeError, ValueError):
+        return pack_json(values)
+    if np.all((array == INT16_NONE) | (np.abs(array) < -INT8_NONE)):
+        return INT8 + np.where(array == INT16_NONE, INT8_NONE, array).astype('i1').tobytes()
+    return INT16 + array.tobytes()
+
+
+def pack_laps(values):
+    """Номера кругов: 1..N хранится как (start, count), остальное - float32"""
+    values = list(values)
+    try:
+        if values and all(b - a == 1 for a, b in zip(values, values[1:])) and values[0] == int(values[0]):
+            return RANGE + _RANGE_HEADER.pack(int(values[0]), len(values))
+        return FLOAT32 + np.asarray(values, dtype='<f4').tobytes()
+    except (TypeError, ValueError):
+        return pack_json(values)
+
+
+def pack_coordinates(points):
+    """Точки трассы [{'x', 'y'}] в пары float64: чтение отдает те же числа, что и JSON"""
+    array = np.array([(point['x'], point['y']) for point in points], dtype='<f8').reshape(-1, 2)
+    return POINTS64 + array.tobytes()
+
+
+def pack_stints(stints):
+    """
+    Стинты [{'compound', 'start_lap', ...}]: таблица названий составов
+    и по записи на стинт (индекс состава + целые поля STINT_FIELDS).
+    """
+    if not stints:
+        return STINTS + bytes([0]) + _STINTS_HEADER.pack(0, 0)
+    fields = [field for field in STINT_FIELDS if field in stints[0]]
+    try:
+        if any(set(stint) != {'compound', *fields} for stint in stints):
+            raise ValueError('разный набор полей')
+        compounds = list(dict.fromkeys(str(stint['compound']) for stint in stints))
+        if len(compounds) > 255:
+            raise ValueError('слишком много составов')
+        records = np.array([[compounds.index(str(stint['compound']))] + [_int16(stint[field]) for field in fields]
+                            for stint in stints], dtype='<i2')
+    except (TypeError, ValueError):
+        return pack_json(stints)
+
+    names = b''.join(bytes([len(encoded)]) + encoded
+                     for encoded in (name.encode('utf-8')[:255] for name in compounds))
+    mask = sum(1 << STINT_FIELDS.index(field) for field in fields)
+    return STINTS + bytes([len(compounds)]) + names + _STINTS_HEADER.pack(mask, len(stints)) + records.tobytes()
+
+
+def _kind(blob):
+    return bytes(blob[:1])
+
+
+def unpack_positions(blob, as_array=False):
+    """Позиции: список с None или массив int16 (None = INT16_NONE)"""
+    if not blob:
+        return np.empty(0, dtype='<i2') if as_array else []
+    if _kind(blob) == JSON:
+        return json.loads(bytes(blob[1:]))
+    if _kind(blob) == INT8:
+        if as_array:
+            array = np.frombuffer(blob, dtype='i1', offset=1).astype('<i2')
+            array[array == INT8_NONE] = INT16_NONE
+            return array
+        values, none = list(struct.unpack_from(f'{len(blob) - 1}b', blob, 1)), INT8_NONE
+    else:
+        if as_array:
+            return np.frombuffer(blob, dtype='<i2', offset=1)
+        values, none = list(struct.unpack_from(f'<{(len(blob) - 1) // 2}h', blob, 1)), INT16_NONE
+    if none in values:
+        values = [None if value == none else value for value in values]
+    return values
+
+
+def unpack_laps(blob, as_array=False):
+    """Номера кругов: список float (как их отдает FastF1) или массив"""
+    if not blob:
+        return np.empty(0) if as_array else []
+    kind = _kind(blob)
+    if kind == RANGE:
+        start, count = _RANGE_HEADER.unpack_from(blob, 1)
+        array = np.arange(start, start + count, dtype=float)
+    elif kind == JSON:
+        return json.loads(bytes(blob[1:]))
+    else:
+        array = np.frombuffer(blob, dtype='<f4', offset=1)
+    return array if as_array else array.tolist()
+
+
+def unpack_coordinates(blob, as_array=False):
+    """Точки трассы: список {'x', 'y'} или массив формы (N, 2)"""
+    if not blob:
+        return np.empty((0, 2), dtype='<f8') if as_array else []
+    kind = _kind(blob)
+    if kind == JSON:
+        return json.loads(bytes(blob[1:]))
+    array = np.frombuffer(blob, dtype='<f4' if kind == POINTS else '<f8', offset=1).reshape(-1, 2)
+    if as_array:
+        return array
+    return [{'x': x, 'y': y} for x, y in array.tolist()]
+
+
+def unpack_stints(blob):
+    if not blob:
+        return []
+    if _kind(blob) == JSON:
+        return json.loads(bytes(blob[1:]))
+    blob = bytes(blob)
+    offset = 2
+    compounds = []
+    for _ in range(blob[1]):
+        length = blob[offset]
+        compounds.append(blob[offset + 1:offset + 1 + length].decode('utf-8'))
+        offset += 1 + length
+    mask, count = _STINTS_HEADER.unpack_from(blob, offset)
+    keys = _STINT_KEYS[mask]
+    width = len(keys)
+    # Записи короткие: struct и dict(zip) читают их быстрее, чем NumPy
+    values = struct.unpack_from(f'<{count * width}h', blob, offset + _STINTS_HEADER.size)
+
+    stints = [dict(zip(keys, values[start:start + width])) for start in range(0, len(values), width)]
+    has_none = INT16_NONE in values
+    for stint in stints:
+        stint['compound'] = compounds[stint['compound']]
+        if has_none:
+            stint.update({key: None for key in keys[1:] if stint[key] == INT16_NONE})
+    return stints
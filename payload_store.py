@@ -0,0 +1,159 @@
+import gzip
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func
+
+from database import db, PanelPayload
+
+try:
+    import brotli
+except ImportError:
+    # Без пакета brotli payload хранится только в gzip
+    brotli = None
+
+# Кодировки в порядке предпочтения при равном q в Accept-Encoding
+ENCODINGS = ('br', 'gzip', 'identity')
+
+# Готовый ответ раздела в одной кодировке
+StoredPayload = namedtuple('StoredPayload', 'panel mimetype encoding body')
+
+# Столбец PanelPayload с телом в каждой кодировке
+ENCODING_COLUMNS = {'br': 'brotli', 'gzip': 'gzip', 'identity': 'identity'}
+
+
+class PayloadStore:
+    """
+    Сериализованные ответы разделов гонки, сжатые заранее.
+
+    Тело ответа раздела (JSON или HTML) сохраняется один раз при
+    построении вместе с gzip-версией и привязывается к ETag данных;
+    brotli-версия (quality 11, это долго) досжимается в фоне и
+    становится доступна следующим запросам. Пока ETag не изменился,
+    запрос получает готовые байты в подходящей кодировке без
+    сериализации и сжатия; из БД читается только тело этой кодировки.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._served = {}
+        self._app = None
+        self._executor = None
+        self._pending = set()
+
+    def init_app(self, app, background=True):
+        """background=False сжимает brotli прямо при сохранении"""
+        self._app = app
+        if background and brotli is not None and self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='payload-brotli')
+
+    @staticmethod
+    def available_encodings(has_brotli):
+        return [encoding for encoding in ENCODINGS if encoding != 'br' or has_brotli]
+
+    def _count(self, panel, encoding):
+        with self._lock:
+            key = (panel, encoding)
+            self._served[key] = self._served.get(key, 0) + 1
+
+    def get(self, year, event, panel, etag, accept_encodings):
+        """Тело раздела для текущего ETag в лучшей кодировке из Accept-Encoding или None"""
+        row = db.session.query(PanelPayload.id, PanelPayload.etag, PanelPayload.mimetype,
+                               PanelPayload.brotli.isnot(None)).filter_by(
+            year=year, event=event, panel=panel).first()
+        if row is None or row[1] != etag:
+            return None
+        encoding = accept_encodings.best_match(self.available_encodings(row[3]), default='identity')
+        body = db.session.query(getattr(PanelPayload, ENCODING_COLUMNS[encoding])).filter_by(id=row[0]).scalar()
+        if body is None:
+            return None
+        self._count(panel, encoding)
+        return StoredPayload(panel, row[2], encoding, body)
+
+    def put(self, year, event, panel, etag, mimetype, data, accept_encodings):
+        """Сохраняет тело ответа раздела с gzip и отдает его в кодировке для текущего запроса"""
+        compressed = {'identity': data, 'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None and self._executor is None:
+            compressed['br'] = brotli.compress(data, quality=11)
+        try:
+            payload = PanelPayload.query.filter_by(year=year, event=event, panel=panel).first()
+            if payload is None:
+                payload = PanelPayload(year=year, event=event, panel=panel)
+                db.session.add(payload)
+            payload.etag = etag
+            payload.mimetype = mimetype
+            payload.identity = compressed['identity']
+            payload.gzip = compressed['gzip']
+            payload.brotli = compressed.get('br')
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Ошибка сохранения сжатого ответа {panel} для {event} {year}: {e}")
+            return None
+
+        if 'br' not in compressed and brotli is not None:
+            self._submit_brotli(year, event, panel, etag, data)
+        encoding = accept_encodings.best_match(self.available_encodings('br' in compressed), default='identity')
+        self._count(panel, encoding)
+        return StoredPayload(panel, mimetype, encoding, compressed[encoding])
+
+    def _submit_brotli(self, year, event, panel, etag, data):
+        key = (year, event, panel, etag)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._compress_brotli, key, data)
+
+    def _compress_brotli(self, key, data):
+        """Досжимает brotli и сохраняет, если payload за это время не заменили"""
+        year, event, panel, etag = key
+        try:
+            body = brotli.compress(data, quality=11)
+            with self._app.app_context():
+                try:
+                    PanelPayload.query.filter_by(year=year, event=event, panel=panel, etag=etag).update(
+                        {'brotli': body}, synchronize_session=False)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Ошибка сохранения brotli {panel} для {event} {year}: {e}")
+                finally:
+                    db.session.remove()
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def invalidate(self, year, event):
+        PanelPayload.query.filter_by(year=year, event=event).delete()
+
+    def stats(self):
+        """Размеры и степень сжатия по разделам, сколько ответов отдано в каждой кодировке"""
+        rows = db.session.query(
+            PanelPayload.panel,
+            func.count(PanelPayload.id),
+            func.sum(func.length(PanelPayload.identity)),
+            func.sum(func.length(PanelPayload.gzip)),
+            func.sum(func.length(PanelPayload.brotli))
+        ).group_by(PanelPayload.panel).all()
+
+        with self._lock:
+            served = dict(self._served)
+
+        panels = {}
+        for panel, count, identity, gzipped, brotli_size in rows:
+            identity = identity or 0
+            panels[panel] = {
+                'payloads': count,
+                'identity_bytes': identity,
+                'gzip_bytes': gzipped or 0,
+                'brotli_bytes': brotli_size or 0,
+                'gzip_ratio': round(identity / gzipped, 2) if gzipped else None,
+                'brotli_ratio': round(identity / brotli_size, 2) if brotli_size else None,
+                'served': {encoding: served.get((panel, encoding), 0) for encoding in ENCODINGS}
+            }
+        return {'brotli_available': brotli is not None, 'panels': panels}
+
+
+payload_store = PayloadStore()
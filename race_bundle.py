@@ -0,0 +1,366 @@
+import pandas as pd
+from collections import defaultdict
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cache_utils import (get_cache_statuses, get_fresh_data_types, is_cache_fresh, save_race_results_to_db, get_race_results_from_db,
+                         save_position_data_to_db, get_position_data_from_db,
+                         save_track_stats_to_db, get_track_stats_from_db)
+from database import db
+from session_registry import get_session
+from fill_locks import fill_locks
+from metrics import cache_lookups, section_fill_duration
+from server_timing import timed
+from track_utils import get_track_stats
+from utils import get_team_color, build_results_frame
+from strategy_utils import (build_tyre_strategy, save_tyre_strategy_to_db, get_tyre_strategy_from_db,
+                            build_pitstop_data, save_pitstop_data_to_db, get_pitstop_data_from_db,
+                            analyze_pitstop_data)
+
+# Разделы панели и соответствующие им типы данных в CacheStatus
+SECTIONS = {
+    'results': 'race_results',
+    'positions': 'position_data',
+    'tyre_strategy': 'tyre_strategy',
+    'pitstop_analysis': 'pitstop_data',
+    'track_stats': 'track_stats'
+}
+
+def parse_sections(value):
+    """Разбирает список разделов из параметра запроса (через запятую)"""
+    if not value:
+        return list(SECTIONS)
+    if isinstance(value, str):
+        value = value.split(',')
+    sections = [section.strip() for section in value if section.strip()]
+    unknown = [section for section in sections if section not in SECTIONS]
+    if unknown:
+        raise ValueError(f"Неизвестные разделы: {', '.join(unknown)}")
+    return sections
+
+@timed('results_html')
+def build_results_html(session, results=None):
+    """Строит HTML-таблицу результатов гонки из сессии (results - готовая build_results_frame)"""
+    if results is None:
+        results = build_results_frame(session)
+
+    table = pd.DataFrame({
+        'Позиция': [int(x) if pd.notna(x) else 'нет информации' for x in results['position'].tolist()],
+        'Имя': results['full_name'].tolist(),
+        'Номер': results['driver_number'].tolist(),
+        'Команда': results['team'].tolist(),
+        'Время': results['formatted_time'].tolist(),
+        'Очки': results['points'].tolist()
+    })
+
+    return table.to_html(
+        index=False,
+        classes='f1-table'
+    )
+
+@timed('positions')
+def build_position_data(session):
+    """Строит данные для графика позиций из сессии"""
+    data = []
+    for drv in session.drivers:
+        drv_laps = session.laps.pick_drivers(drv)
+
+        if drv_laps.empty:
+            continue
+
+        abb = drv_laps['Driver'].iloc[0]
+        positions_list = drv_laps['Position'].tolist()
+        laps_list = drv_laps['LapNumber'].tolist()
+
+        positions_list = [int(x) if pd.notna(x) else None for x in positions_list]
+
+        team = session.results[session.results['DriverNumber'] == drv]['TeamName'].iloc[0]
+        color = get_team_color(team)
+
+        data.append({
+            'name': abb,
+            'positions': positions_list,
+            'laps': laps_list,
+            'color': color,
+            'team': team
+        })
+
+    # Группируем по командам для разных типов линий
+    team_drivers = defaultdict(list)
+
+    for driver in data:
+        team_drivers[driver['team']].append(driver)
+
+    for team, drivers in team_drivers.items():
+        for i, driver in enumerate(drivers):
+            driver['dash'] = 'solid' if i == 0 else 'dash'
+
+    return data
+
+# Разделы, которые бывают законно пустыми (например, гонка без пит-стопов), и их пустое значение.
+# Такой раздел сохраняется без строк, но с CacheStatus: статус без строк означает "заполнен, пусто"
+EMPTY_SECTIONS = {
+    'positions': list,
+    'tyre_strategy': list,
+    'pitstop_analysis': lambda: analyze_pitstop_data([])
+}
+
+def _read_cached(section, year, event):
+    """Читает раздел из таблиц кэша в БД"""
+    if section == 'results':
+        return get_race_results_from_db(year, event)
+    if section == 'positions':
+        return get_position_data_from_db(year, event)
+    if section == 'tyre_strategy':
+        return get_tyre_strategy_from_db(year, event)
+    if section == 'pitstop_analysis':
+        pitstop_data = get_pitstop_data_from_db(year, event)
+        return analyze_pitstop_data(pitstop_data) if pitstop_data else None
+    if section == 'track_stats':
+        return get_track_stats_from_db(year, event)
+
+def _read_filled(section, year, event):
+    """Раздел, у которого есть CacheStatus: пустые данные отдаются как пустой раздел, а не как промах"""
+    cached = _read_cached(section, year, event)
+    if not cached and section in EMPTY_SECTIONS:
+        return EMPTY_SECTIONS[section]()
+    return cached
+
+def _compute_from_session(section, year, event, session):
+    """Считает раздел из загруженной сессии и сохраняет его в БД"""
+    if section == 'results':
+        results = build_results_frame(session)
+        # Сохраненный фрагмент совпадает с тем, что потом отдается из кэша
+        table_html = save_race_results_to_db(year, event, session, results)
+        return table_html or build_results_html(session, results)
+    if section == 'positions':
+        data = build_position_data(session)
+        save_position_data_to_db(year, event, data)
+        return data
+    if section == 'tyre_strategy':
+        strategy_data = build_tyre_strategy(session)
+        # Пустой раздел тоже сохраняется: его CacheStatus отмечает, что данные уже заполнены
+        save_tyre_strategy_to_db(year, event, strategy_data)
+        return strategy_data
+    if section == 'pitstop_analysis':
+        pitstop_data = build_pitstop_data(session)
+        save_pitstop_data_to_db(year, event, pitstop_data)
+        return analyze_pitstop_data(pitstop_data)
+
+def _no_progress(stage, state):
+    pass
+
+def _fill_sections(bundle, year, event, sections, progress=_no_progress):
+    """
+    Считает разделы из загруженной сессии и сохраняет их в БД.
+
+    progress(stage, state) получает этапы 'session' и имена разделов
+    с состояниями 'running', 'done' и 'error'.
+    """
+    session_sections = [section for section in sections if section != 'track_stats']
+    if session_sections:
+        progress('session', 'running')
+        try:
+            session = get_session(year, event, 'R', laps=True)
+        except Exception as e:
+            print(f"Ошибка загрузки сессии {event} {year}: {e}")
+            progress('session', 'error')
+            for section in session_sections:
+                bundle['errors'][section] = str(e)
+                progress(section, 'error')
+        else:
+            progress('session', 'done')
+            for section in session_sections:
+                progress(section, 'running')
+                started = time.perf_counter()
+                try:
+                    bundle[section] = _compute_from_session(section, year, event, session)
+                    section_fill_duration.observe(time.perf_counter() - started, data_type=SECTIONS[section])
+                    progress(section, 'done')
+                except Exception as e:
+                    print(f"Ошибка расчета раздела {section} для {event} {year}: {e}")
+                    bundle['errors'][section] = str(e)
+                    progress(section, 'error')
+
+    if 'track_stats' in sections:
+        # Статистике трассы нужна телеметрия, она загружается через тот же реестр сессий
+        progress('track_stats', 'running')
+        started = time.perf_counter()
+        try:
+            stats_data = get_track_stats(year, event)
+            if not stats_data:
+                raise ValueError(f"Не удалось получить статистику трассы {event} {year}")
+            if 'error' not in stats_data:
+                save_track_stats_to_db(year, event, stats_data)
+            bundle['track_stats'] = stats_data
+            section_fill_duration.observe(time.perf_counter() - started, data_type=SECTIONS['track_stats'])
+            progress('track_stats', 'done')
+        except Exception as e:
+            print(f"Ошибка в track_stats: {e}")
+            bundle['errors']['track_stats'] = str(e)
+            progress('track_stats', 'error')
+
+def _serve_stale(bundle, year, event, sections, progress=_no_progress):
+    """Отдает устаревшие копии разделов из БД; возвращает разделы, у которых копии нет"""
+    remaining = []
+    for section in sections:
+        stale = _read_cached(section, year, event)
+        if stale:
+            print(f"/race_bundle: раздел {section} заполняет другой процесс, отдаем устаревшую копию ({event} {year})")
+            bundle[section] = stale
+            fill_locks.record_stale(SECTIONS[section])
+            progress(section, 'done')
+        else:
+            remaining.append(section)
+    return remaining
+
+def _fill_sections_locked(bundle, year, event, sections, progress=_no_progress):
+    """
+    Заполняет кэш разделов под блокировкой (data_type, year, event).
+
+    Если кэш уже заполняет другой процесс, разделы с устаревшей копией
+    отдаются сразу, а для остальных блокировка ожидается до таймаута.
+    После ожидания кэш проверяется заново: его мог заполнить тот процесс.
+    """
+    lock = fill_locks.acquire(year, event, [SECTIONS[section] for section in sections], wait=False)
+    if lock is None:
+        sections = _serve_stale(bundle, year, event, sections, progress)
+        if not sections:
+            return
+        progress('lock', 'running')
+        lock = fill_locks.acquire(year, event, [SECTIONS[section] for section in sections])
+        if lock is None:
+            progress('lock', 'error')
+            for section in sections:
+                bundle['errors'][section] = f"Данные {event} {year} еще загружаются, повторите запрос позже"
+                progress(section, 'error')
+            return
+        progress('lock', 'done')
+
+    try:
+        fresh = get_fresh_data_types(year, event, [SECTIONS[section] for section in sections])
+        remaining = []
+        for section in sections:
+            cached = _read_filled(section, year, event) if SECTIONS[section] in fresh else None
+            if cached:
+                bundle[section] = cached
+                progress(section, 'done')
+            else:
+                remaining.append(section)
+        _fill_sections(bundle, year, event, remaining, progress)
+    finally:
+        lock.release()
+
+def fill_race_sections(year, event, sections, progress=_no_progress):
+    """Заполняет кэш разделов гонки вне запроса (фоновые задачи) и возвращает bundle"""
+    bundle = {'year': year, 'event': event, 'errors': {}}
+    _fill_sections_locked(bundle, year, event, list(sections), progress)
+    return bundle
+
+class Revalidator:
+    """
+    Фоновое обновление устаревших разделов (stale-while-revalidate).
+
+    Запрос получает устаревшую копию из БД сразу, а раздел
+    пересчитывается в пуле потоков под той же блокировкой заполнения.
+    Повторные запросы того же раздела, пока он обновляется, в очередь
+    не добавляются.
+    """
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._app = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0}
+
+    def init_app(self, app, background=True):
+        self._app = app
+        if background and self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='revalidate')
+
+    def submit(self, year, event, sections):
+        """Ставит разделы в очередь обновления; False, если фоновое обновление выключено"""
+        if self._executor is None:
+            return False
+        with self._lock:
+            sections = [section for section in sections if (year, event, section) not in self._pending]
+            self._pending.update((year, event, section) for section in sections)
+            if sections:
+                self._stats['submitted'] += 1
+        if sections:
+            self._executor.submit(self._run, year, event, sections)
+        return True
+
+    def _run(self, year, event, sections):
+        failed = False
+        try:
+            with self._app.app_context():
+                bundle = fill_race_sections(year, event, sections)
+                db.session.remove()
+            failed = bool(bundle['errors'])
+            status = 'ошибки: ' + ', '.join(bundle['errors']) if failed else 'ok'
+            print(f"Фоновое обновление {', '.join(sections)} для {event} {year}: {status}")
+        except Exception as e:
+            failed = True
+            print(f"Ошибка фонового обновления {event} {year}: {e}")
+        finally:
+            with self._lock:
+                self._pending.difference_update((year, event, section) for section in sections)
+                self._stats['failed' if failed else 'completed'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, pending=len(self._pending))
+
+
+revalidator = Revalidator()
+
+def build_race_bundle(year, event, sections=None):
+    """
+    Собирает данные всех разделов панели гонки.
+
+    Разделы, сохраненные в БД, читаются после одной выборки CacheStatus.
+    Устаревшие по политике кэша (см. cache_policy) отдаются сразу и
+    обновляются в фоне; отсутствующие считаются из одной загруженной
+    сессии под блокировкой заполнения (см. fill_locks). Ошибки по
+    разделам собираются в bundle['errors'], чтобы один сломанный раздел
+    не ронял остальные.
+    """
+    sections = list(SECTIONS) if sections is None else list(sections)
+    bundle = {'year': year, 'event': event, 'errors': {}}
+
+    statuses = get_cache_statuses(year, event, [SECTIONS[section] for section in sections])
+
+    missing = []
+    stale = []
+    for section in sections:
+        status = statuses.get(SECTIONS[section])
+        if status:
+            cached = _read_filled(section, year, event)
+            if cached:
+                bundle[section] = cached
+                if is_cache_fresh(status, year, event):
+                    cache_lookups.inc(data_type=SECTIONS[section], result='hit')
+                    print(f"/race_bundle: раздел {section} из кэша БД ({event} {year})")
+                else:
+                    cache_lookups.inc(data_type=SECTIONS[section], result='stale')
+                    stale.append(section)
+                continue
+        cache_lookups.inc(data_type=SECTIONS[section], result='miss')
+        missing.append(section)
+
+    if stale:
+        if revalidator.submit(year, event, stale):
+            print(f"/race_bundle: устаревшие разделы {', '.join(stale)} обновляются в фоне ({event} {year})")
+        else:
+            # Фоновое обновление выключено - обновляем в запросе
+            for section in stale:
+                del bundle[section]
+            missing.extend(stale)
+
+    if missing:
+        _fill_sections_locked(bundle, year, event, missing)
+
+    return bundle
@@ -0,0 +1,156 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import fastf1 as f1
+import pandas as pd
+
+from database import db, EventSchedule
+from fixture_store import fixture_store
+
+# Как часто перечитывать расписание текущего (и будущего) сезона
+CURRENT_SEASON_REFRESH = timedelta(hours=12)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _to_datetime(value):
+    if value is None or pd.isna(value):
+        return None
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert('UTC').tz_localize(None)
+    return timestamp.to_pydatetime()
+
+
+def _to_str(value, default=None):
+    if value is None or pd.isna(value):
+        return default
+    return str(value)
+
+
+class ScheduleStore:
+    """
+    Расписания сезонов в таблице event_schedule с кэшем в памяти процесса.
+
+    Расписание прошедших сезонов загружается из FastF1 один раз и больше
+    не обновляется, текущий сезон перечитывается раз в CURRENT_SEASON_REFRESH.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ingest_lock = threading.Lock()
+        self._cache = {}
+
+    @staticmethod
+    def is_final(year):
+        """Расписание завершенного сезона больше не меняется"""
+        return int(year) < _utcnow().year
+
+    def _is_fresh(self, year, fetched_at):
+        if self.is_final(year):
+            return True
+        return fetched_at is not None and _utcnow() - fetched_at < CURRENT_SEASON_REFRESH
+
+    def _remember(self, year, events, fetched_at):
+        with self._lock:
+            self._cache[year] = (events, fetched_at)
+        return events
+
+    def _from_db(self, year):
+        rows = EventSchedule.query.filter_by(year=year)\
+            .order_by(EventSchedule.round_number, EventSchedule.id).all()
+        if not rows:
+            return None, None
+        return [row.to_dict() for row in rows], min(row.fetched_at for row in rows)
+
+    def get_schedule(self, year):
+        """Возвращает список этапов сезона (словари) в порядке раундов"""
+        year = int(year)
+        with self._lock:
+            cached = self._cache.get(year)
+        if cached and self._is_fresh(year, cached[1]):
+            return cached[0]
+
+        events, fetched_at = self._from_db(year)
+        if events and self._is_fresh(year, fetched_at):
+            return self._remember(year, events, fetched_at)
+
+        with self._ingest_lock:
+            # Пока ждали блокировку, расписание мог загрузить другой поток
+            with self._lock:
+                cached = self._cache.get(year)
+            if cached and self._is_fresh(year, cached[1]):
+                return cached[0]
+            try:
+                return self.ingest(year)
+            except Exception as e:
+                print(f"Не удалось обновить расписание за {year}: {e}")
+                if events:
+                    # Лучше устаревшее расписание, чем никакого
+                    return events
+                raise
+
+    def ingest(self, year):
+        """Загружает расписание сезона из FastF1 (или снимка) и сохраняет в event_schedule"""
+        year = int(year)
+        if fixture_store.replaying:
+            schedule = fixture_store.load_schedule(year)
+        else:
+            schedule = f1.get_event_schedule(year)
+            if fixture_store.recording:
+                fixture_store.record_schedule(year, schedule)
+        fetched_at = _utcnow()
+
+        try:
+            EventSchedule.query.filter_by(year=year).delete()
+            for _, event in schedule.iterrows():
+                db.session.add(EventSchedule(
+                    year=year,
+                    round_number=int(event['RoundNumber']) if pd.notna(event.get('RoundNumber')) else None,
+                    event_name=str(event['EventName']),
+                    official_name=_to_str(event.get('OfficialEventName')),
+                    country=_to_str(event.get('Country')),
+                    location=_to_str(event.get('Location')),
+                    event_format=_to_str(event.get('EventFormat')),
+                    event_date=_to_datetime(event.get('EventDate')),
+                    race_date_utc=_to_datetime(event.get('Session5DateUtc')),
+                    fetched_at=fetched_at
+                ))
+            db.session.commit()
+            print(f"Расписание {year} сохранено в PostgreSQL ({len(schedule)} этапов)")
+        except Exception:
+            db.session.rollback()
+            raise
+
+        events, stored_at = self._from_db(year)
+        return self._remember(year, events or [], stored_at or fetched_at)
+
+    def get_events(self, year):
+        """Названия этапов для выпадающего меню"""
+        return [event['event_name'] for event in self.get_schedule(year)
+                if event['event_name'] != 'Test']
+
+    def get_event(self, year, event_name):
+        """Информация об этапе по названию или None"""
+        for event in self.get_schedule(year):
+            if event['event_name'] == event_name:
+                return event
+        return None
+
+    def invalidate(self, year=None):
+        with self._lock:
+            if year is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(int(year), None)
+
+    def stats(self):
+        """Размер кэша расписаний в памяти процесса"""
+        with self._lock:
+            return {'seasons': len(self._cache),
+                    'events': sum(len(events) for events, _ in self._cache.values())}
+
+
+schedule_store = ScheduleStore()
@@ -0,0 +1,149 @@
+import cProfile
+import io
+import json
+import pstats
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+
+# Сколько функций показывать в сводке cProfile
+PROFILE_TOP = 40
+
+
+def _stages():
+    """Таймеры этапов текущего запроса или None вне запроса (фоновые потоки, CLI)"""
+    if not has_request_context():
+        return None
+    return g.get('server_timing')
+
+
+@contextmanager
+def stage(name):
+    """
+    Замеряет этап обработки запроса.
+
+    Время одноименных этапов складывается (например, все сохранения в БД
+    за запрос попадают в один db_save). Вне запроса ничего не делает.
+    """
+    stages = _stages()
+    if stages is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry = stages.setdefault(name, [0.0, 0])
+        entry[0] += time.perf_counter() - started
+        entry[1] += 1
+
+
+def timed(name):
+    """Декоратор: вызов функции замеряется как этап name"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _header(stages, total):
+    parts = []
+    for name, (seconds, calls) in stages.items():
+        part = f'{name};dur={seconds * 1000:.1f}'
+        if calls > 1:
+            part += f';desc="{calls} calls"'
+        parts.append(part)
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+class ServerTiming:
+    """
+    Разбивка времени запроса по этапам в заголовке Server-Timing.
+
+    Этапы (запрос CacheStatus, загрузка сессии, расчет раздела, запись
+    в БД, сериализация) отмечаются stage()/timed() по месту. Доля
+    запросов log_sample_rate дополнительно пишется в лог одной
+    JSON-строкой. С ?profile=1 запрос выполняется под cProfile, и вместо
+    тела ответа возвращается текстовая сводка по функциям; это работает,
+    только если профилирование включено (profiling) или в режиме отладки.
+    """
+
+    def __init__(self):
+        self.log_sample_rate = 0.0
+        self.profiling = False
+
+    def init_app(self, app, log_sample_rate=0.0, profiling=False):
+        self.log_sample_rate = log_sample_rate
+        self.profiling = profiling
+
+        @app.before_request
+        def _start_timing():
+            g.server_timing = {}
+            g.server_timing_started = time.perf_counter()
+            # Профиль раскрывает внутренние имена функций и файлов и нагружает CPU:
+            # только если включен явно или приложение в режиме отладки
+            if (self.profiling or current_app.debug) and request.args.get('profile') == '1':
+                g.profiler = cProfile.Profile()
+                g.profiler.enable()
+
+        @app.after_request
+        def _finish_timing(response):
+            profiler = g.pop('profiler', None)
+            if profiler is not None:
+                profiler.disable()
+            started = g.pop('server_timing_started', None)
+            stages = g.pop('server_timing', None)
+            if started is None:
+                return response
+
+            total = time.perf_counter() - started
+            response.headers['Server-Timing'] = _header(stages, total)
+            if stages and self.log_sample_rate and random.random() < self.log_sample_rate:
+                self._log(response, stages, total)
+            if profiler is not None:
+                response = self._profile_response(response, profiler, total)
+            return response
+
+    @staticmethod
+    def _log(response, stages, total):
+        record = {
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'status': response.status_code,
+            'year': request.values.get('year'),
+            'event': request.values.get('event'),
+            'total_ms': round(total * 1000, 1),
+            'stages': {name: {'ms': round(seconds * 1000, 1), 'calls': calls}
+                       for name, (seconds, calls) in stages.items()}
+        }
+        print(f"server_timing {json.dumps(record, ensure_ascii=False)}")
+
+    @staticmethod
+    def _profile_response(response, profiler, total):
+        """Заменяет тело ответа сводкой cProfile (заголовки Server-Timing сохраняются)"""
+        output = io.StringIO()
+        output.write(f"{request.method} {request.full_path} -> {response.status_code}, "
+                     f"{total * 1000:.1f} мс\n\n")
+        pstats.Stats(profiler, stream=output).strip_dirs().sort_stats('cumulative').print_stats(PROFILE_TOP)
+
+        response.set_data(output.getvalue())
+        response.status_code = 200
+        response.mimetype = 'text/plain'
+        for header in ('Content-Encoding', 'ETag', 'Last-Modified'):
+            response.headers.pop(header, None)
+        response.vary.discard('Accept-Encoding')
+        response.cache_control.no_store = True
+        response.cache_control.public = False
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = None
+        return response
+
+
+server_timing = ServerTiming()
@@ -0,0 +1,235 @@
+import threading
+import time
+from collections import OrderedDict
+
+import fastf1 as f1
+import pandas as pd
+
+from disk_cache import disk_cache
+from fixture_store import fixture_store
+from metrics import session_load_bytes, session_load_duration, session_load_failures
+from server_timing import timed
+
+# Флаги session.load(), которые учитывает реестр
+LOAD_FLAGS = ('laps', 'telemetry', 'weather', 'messages')
+
+
+def estimate_session_size(session):
+    """Оценивает объем памяти, занимаемый загруженной сессией (в байтах)"""
+    total = 0
+
+    for attr in ('laps', 'results', 'weather_data', 'race_control_messages'):
+        try:
+            frame = getattr(session, attr)
+        except Exception:
+            continue
+        if isinstance(frame, pd.DataFrame):
+            total += int(frame.memory_usage(deep=True).sum())
+
+    # Телеметрия хранится словарями {номер пилота: DataFrame}
+    for attr in ('car_data', 'pos_data'):
+        try:
+            frames = getattr(session, attr)
+        except Exception:
+            continue
+        if isinstance(frames, dict):
+            for frame in frames.values():
+                if isinstance(frame, pd.DataFrame):
+                    total += int(frame.memory_usage(deep=True).sum())
+
+    return total
+
+
+def load_session(year, event, session_type, flags):
+    """
+    Загружает сессию из источника данных: FastF1 или снимков fixture_store.
+
+    В режиме record загруженная из FastF1 сессия дополнительно
+    записывается в хранилище снимков.
+    """
+    if fixture_store.replaying:
+        return fixture_store.load_session(year, event, session_type, flags)
+
+    started = time.perf_counter()
+    session = f1.get_session(year, event, session_type)
+    session.load(**{flag: flag in flags for flag in LOAD_FLAGS})
+    disk_cache.record_use(session)
+    if fixture_store.recording:
+        try:
+            fixture_store.record_session(year, event, session_type, session, flags,
+                                         load_seconds=round(time.perf_counter() - started, 3))
+        except Exception as e:
+            print(f"Не удалось записать снимок {event} {year}: {e}")
+    return session
+
+
+class _InFlightLoad:
+    """Загрузка сессии, которая выполняется прямо сейчас"""
+
+    def __init__(self, flags):
+        self.flags = flags
+        self.done = threading.Event()
+        self.session = None
+        self.error = None
+
+
+class _Entry:
+    """Загруженная сессия в LRU"""
+
+    def __init__(self, session, flags, size):
+        self.session = session
+        self.flags = flags
+        self.size = size
+
+
+class SessionRegistry:
+    """
+    Общий реестр сессий FastF1 внутри процесса.
+
+    Сессии хранятся по ключу (year, event, session_type). Параллельные
+    запросы одной и той же сессии ждут единственную загрузку, а готовые
+    сессии живут в LRU с ограничением по памяти.
+    """
+
+    def __init__(self, max_memory_bytes, loader=None):
+        self.max_memory_bytes = max_memory_bytes
+        self._loader = loader or load_session
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._memory_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._waits = 0
+        self._evictions = 0
+
+    def get(self, year, event, session_type='R', laps=True, telemetry=False,
+            weather=False, messages=False):
+        """
+        Возвращает загруженную сессию, загружая ее не более одного раза.
+
+        Флаги, не запрошенные явно, не загружаются. Если сессия уже есть
+        в реестре, но без нужных данных, она перезагружается с объединением
+        флагов, чтобы следующие запросы обслуживались из памяти.
+        """
+        key = (int(year), str(event), str(session_type))
+        requested = {flag for flag, value in zip(
+            LOAD_FLAGS, (laps, telemetry, weather, messages)) if value}
+
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and requested <= entry.flags:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry.session
+
+                in_flight = self._in_flight.get(key)
+                if in_flight is None:
+                    flags = requested | (entry.flags if entry else set())
+                    in_flight = _InFlightLoad(flags)
+                    self._in_flight[key] = in_flight
+                    self._misses += 1
+                    owner = True
+                else:
+                    self._waits += 1
+                    owner = False
+
+            if not owner:
+                in_flight.done.wait()
+                if in_flight.error is not None:
+                    raise in_flight.error
+                if requested <= in_flight.flags:
+                    return in_flight.session
+                # Текущая загрузка не содержит нужных данных - пробуем еще раз
+                continue
+
+            return self._run_load(key, in_flight)
+
+    def _run_load(self, key, in_flight):
+        """
+        Загружает сессию для ожидающих in_flight. Что бы ни упало (загрузка,
+        оценка размера, метрики), запись in_flight снимается и ожидающие
+        просыпаются: с сессией или с ошибкой.
+        """
+        year, event, session_type = key
+        started = time.perf_counter()
+        try:
+            try:
+                session = self._loader(year, event, session_type, in_flight.flags)
+            except Exception:
+                session_load_failures.inc(session_type=session_type)
+                raise
+
+            size = estimate_session_size(session)
+            session_load_duration.observe(time.perf_counter() - started, session_type=session_type)
+            session_load_bytes.observe(size, session_type=session_type)
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._memory_bytes -= old.size
+                self._entries[key] = _Entry(session, in_flight.flags, size)
+                self._memory_bytes += size
+                self._evict_locked(keep=key)
+            in_flight.session = session
+            return session
+        except Exception as e:
+            in_flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            in_flight.done.set()
+
+    def _evict_locked(self, keep):
+        """Вытесняет самые старые сессии, пока не уложимся в бюджет памяти"""
+        while self._memory_bytes > self.max_memory_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            entry = self._entries.pop(key)
+            self._memory_bytes -= entry.size
+            self._evictions += 1
+
+    def configure(self, max_memory_mb):
+        """Задает бюджет памяти реестра в мегабайтах"""
+        with self._lock:
+            self.max_memory_bytes = int(float(max_memory_mb) * 1024 * 1024)
+            self._evict_locked(keep=None)
+
+    def invalidate(self, year, event, session_type=None):
+        """Удаляет сессии гонки из реестра"""
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == int(year) and key[1] == str(event) and \
+                        (session_type is None or key[2] == session_type):
+                    self._memory_bytes -= self._entries.pop(key).size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+
+    def stats(self):
+        """Статистика реестра для /cache_stats"""
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'waits': self._waits,
+                'evictions': self._evictions,
+                'entries': len(self._entries),
+                'in_flight': len(self._in_flight),
+                'memory_bytes': self._memory_bytes,
+                'max_memory_bytes': self.max_memory_bytes,
+            }
+
+
+# Бюджет памяти по умолчанию - 1 ГБ, приложение переопределяет его из конфига
+session_registry = SessionRegistry(max_memory_bytes=1024 * 1024 * 1024)
+
+
+@timed('session_load')
+def get_session(year, event, session_type='R', **load_kwargs):
+    """Возвращает загруженную сессию из общего реестра"""
+    return session_registry.get(year, event, session_type, **load_kwargs)
@@ -25,9 +25,80 @@ function hideLoading(containerId) {
     const loader = container.querySelector('.loading-overlay');
     if (loader) {
         loader.classList.add('hidden');
+        const label = loader.querySelector('.loading-text');
+        if (label) label.remove();
     }
 }
 
+function setLoadingText(containerId, text) {
+    const container = document.getElementById(containerId);
+    const loader = container && container.querySelector('.loading-overlay');
+    if (!loader) return;
+
+    let label = loader.querySelector('.loading-text');
+    if (!label) {
+        label = document.createElement('div');
+        label.className = 'loading-text';
+        loader.appendChild(label);
+    }
+    label.textContent = text;
+}
+
+const JOB_POLL_INTERVAL = 1000;
+const JOB_STAGE_NAMES = {
+    lock: 'ожидание другого процесса',
+    session: 'загрузка сессии',
+    results: 'результаты',
+    positions: 'позиции',
+    tyre_strategy: 'стратегии',
+    pitstop_analysis: 'пит-стопы',
+    track_stats: 'трасса'
+};
+
+function describeJob(job) {
+    if (job.state === 'queued') return 'В очереди на загрузку данных';
+    const running = Object.keys(job.stages).find(stage => job.stages[stage] === 'running');
+    const stage = running ? ': ' + (JOB_STAGE_NAMES[running] || running) : '';
+    return 'Подготовка данных' + stage + ' (' + Math.round(job.progress * 100) + '%)';
+}
+
+function waitForJob(job, containerIds) {
+    // Опрашивает /jobs/<id>, пока задача заполнения кэша не завершится
+    return new Promise((resolve, reject) => {
+        const poll = () => {
+            fetch(job.status_url)
+            .then(response => response.json())
+            .then(status => {
+                if (status.state === 'failed') {
+                    const errors = Object.values(status.errors || {});
+                    reject(new Error(errors[0] || 'Ошибка загрузки данных'));
+                } else if (status.state === 'done' || status.state === 'unknown') {
+                    // unknown: задача в другом процессе сервера, повторяем исходный запрос
+                    resolve(status);
+                } else {
+                    containerIds.forEach(id => setLoadingText(id, describeJob(status)));
+                    setTimeout(poll, JOB_POLL_INTERVAL);
+                }
+            })
+            .catch(reject);
+        };
+        containerIds.forEach(id => setLoadingText(id, describeJob(job)));
+        setTimeout(poll, JOB_POLL_INTERVAL);
+    });
+}
+
+function fetchRaceData(url, containerIds = [], attempt = 0) {
+    // Холодная гонка отвечает 202 с задачей заполнения кэша: ждем ее и повторяем запрос.
+    // Если данных все еще нет, последний запрос просит сервер собрать их сразу (wait=1).
+    return fetch(attempt > 1 ? url + '&wait=1' : url)
+    .then(response => {
+        if (response.status !== 202) return response;
+        return response.json()
+            .then(job => waitForJob(job, containerIds))
+            .then(() => fetchRaceData(url, containerIds, attempt + 1));
+    });
+}
+
 function updateEvents() {
     const year = document.getElementById('year-select').value;
     const loader = showLoading('event-select', 'small');
@@ -52,9 +123,20 @@ function updateEvents() {
     });
 }
 
+// Разделы панели гонки: все приходят одним запросом /race_bundle вместо пяти
+const RACE_SECTIONS = ['results', 'positions', 'tyre_strategy', 'pitstop_analysis', 'track_stats'];
+const SECTION_CONTAINERS = {
+    results: ['results'],
+    positions: ['position-chart'],
+    tyre_strategy: ['tyre-strategy-chart'],
+    pitstop_analysis: ['pitstop-chart'],
+    track_stats: ['track-stats', 'track-visualization']
+};
+
 function loadResults() {
     const year = document.getElementById('year-select').value;
     const event = document.getElementById('event-select').value;
+    const containerIds = [].concat(...Object.values(SECTION_CONTAINERS));
 
     // Показываем лоадеры для всех секций
     showLoading('results', 'normal');
@@ -64,72 +146,82 @@ function loadResults() {
     showLoading('pitstop-chart', 'normal');
     showLoading('track-visualization', 'normal'); 
 
-    fetch('/results', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/x-www-form-urlencoded',
-        },
-        body: 'year=' + encodeURIComponent(year) + '&event=' + encodeURIComponent(event)
+    fetchRaceData('/race_bundle?year=' + encodeURIComponent(year) + '&event=' + encodeURIComponent(event) +
+                  '&sections=' + RACE_SECTIONS.join(','), containerIds)
+    .then(response => {
+        if (!response.ok) {
+            throw new Error('Ошибка сети');
+        }
+        return response.json();
     })
-    .then(response => response.text())
-    .then(data => {
-        document.getElementById('results').innerHTML = data;
-        hideLoading('results');
-        
-        loadPositionChart(year, event);
-        
-        // Загружаем статистику трассы
-        if (typeof loadTrackStats === 'function') {
-            loadTrackStats(year, event);
-        } else {
-            console.warn('loadTrackStats не определена');
-            if (typeof displayFallbackStats === 'function') {
-                displayFallbackStats(event);
-            }
-            hideLoading('track-stats');
-            hideLoading('track-visualization'); 
+    .then(bundle => {
+        renderRaceBundle(bundle, year, event);
+        containerIds.forEach(id => hideLoading(id));
+    })
+    .catch(error => {
+        console.error('Ошибка загрузки данных гонки:', error);
+        renderRaceBundle({ errors: { results: error.message } }, year, event);
+        // Скрываем все лоадеры в случае ошибки
+        containerIds.forEach(id => hideLoading(id));
+    });
+}
+
+function renderRaceBundle(bundle, year, event) {
+    // Раздел с ошибкой показывает свое сообщение, остальные рисуются как обычно
+    const errors = bundle.errors || {};
+
+    if ('results' in bundle) {
+        document.getElementById('results').innerHTML = bundle.results;
+    } else {
+        console.error('Ошибка загрузки результатов:', errors.results);
+    }
+
+    if ('positions' in bundle) {
+        plotPositions(bundle.positions);
+        subscribeLive(year, event);
+    } else {
+        console.error('Ошибка загрузки позиций:', errors.positions);
+        const container = document.getElementById('position-chart');
+        if (container) {
+            container.innerHTML = '<p style="text-align: center; color: #666; padding: 40px;">Не удалось загрузить график позиций</p>';
         }
+    }
+
+    if (typeof displayTrackStats === 'function' && 'track_stats' in bundle) {
+        displayTrackStats(bundle.track_stats);
+    } else if (typeof displayFallbackStats === 'function') {
+        console.error('Ошибка загрузки статистики:', errors.track_stats);
+        displayFallbackStats(event);
+    }
 
-        // Загружаем стратегию по шинам
-        if (typeof loadTyreStrategy === 'function') {
-            loadTyreStrategy(year, event);
+    if (typeof renderTyreStrategyChart === 'function') {
+        if ('tyre_strategy' in bundle) {
+            renderTyreStrategyChart(bundle.tyre_strategy);
         } else {
-            hideLoading('tyre-strategy-chart');
+            console.error('Ошибка загрузки стратегии:', errors.tyre_strategy);
+            displayStrategyError('Не удалось загрузить данные стратегии');
         }
-        
-        // Загружаем анализ пит-стопов
-        if (typeof loadPitstopAnalysis === 'function') {
-            loadPitstopAnalysis(year, event);
+    }
+
+    if (typeof renderPitstopAnalysisChart === 'function') {
+        if ('pitstop_analysis' in bundle) {
+            renderPitstopAnalysisChart(bundle.pitstop_analysis);
         } else {
-            hideLoading('pitstop-chart');
+            console.error('Ошибка загрузки анализа пит-стопов:', errors.pitstop_analysis);
+            displayPitstopChartError('Не удалось загрузить данные пит-стопов');
         }
-    })
-    .catch(error => {
-        console.error('Ошибка загрузки результатов:', error);
-        // Скрываем все лоадеры в случае ошибки
-        hideLoading('results');
-        hideLoading('track-stats');
-        hideLoading('position-chart');
-        hideLoading('tyre-strategy-chart');
-        hideLoading('pitstop-chart');
-        hideLoading('track-visualization'); 
-    });
+    }
 }
 
 function loadPositionChart(year, event) {
     const loader = showLoading('position-chart', 'normal');
 
-    fetch('/positions', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/x-www-form-urlencoded',
-        },
-        body: 'year=' + encodeURIComponent(year) + '&event=' + encodeURIComponent(event)
-    })
+    fetchRaceData('/positions?year=' + encodeURIComponent(year) + '&event=' + encodeURIComponent(event), ['position-chart'])
     .then(response => response.json())
     .then(data => {
         plotPositions(data);
         hideLoading('position-chart');
+        subscribeLive(year, event);
     })
     .catch(error => {
         console.error('Ошибка загрузки позиций:', error);
@@ -229,6 +321,67 @@ function plotPositions(data) {
     .catch(error => console.error('Ошибка отрисовки графика:', error));
 }
 
+// Живой режим: изменения позиций и стратегий приходят по SSE
+let liveSource = null;
+
+function subscribeLive(year, event) {
+    if (liveSource) liveSource.close();
+    // Для гонки не в живом режиме сервер отвечает 204, и браузер не переподключается
+    liveSource = new EventSource('/live/positions?year=' + encodeURIComponent(year) + '&event=' + encodeURIComponent(event));
+
+    liveSource.addEventListener('snapshot', e => {
+        const data = JSON.parse(e.data);
+        plotPositions(data.positions);
+        if (typeof renderTyreStrategyChart === 'function') renderTyreStrategyChart(data.tyre_strategy);
+    });
+    liveSource.addEventListener('laps', e => {
+        const data = JSON.parse(e.data);
+        applyPositionDelta(data.positions);
+        if (typeof applyStrategyDelta === 'function') applyStrategyDelta(data.stints);
+    });
+    liveSource.addEventListener('end', () => {
+        liveSource.close();
+        liveSource = null;
+    });
+}
+
+function applyPositionDelta(drivers) {
+    const chart = document.getElementById('position-chart');
+    if (!chart || !chart.data) {
+        plotPositions(drivers);
+        return;
+    }
+
+    drivers.forEach(driver => {
+        const index = chart.data.findIndex(trace => trace.name === driver.name);
+        if (index < 0) {
+            Plotly.addTraces(chart, {
+                x: driver.laps,
+                y: driver.positions,
+                mode: 'lines',
+                name: driver.name,
+                line: { color: driver.color, dash: driver.dash || 'solid', width: 2 },
+                type: 'scatter',
+                hovertemplate: '<b>%{fullData.name}</b><br>Круг: %{x}<br>Позиция: %{y}<br><extra></extra>'
+            });
+            return;
+        }
+
+        // После переподключения часть кругов может прийти повторно
+        const trace = chart.data[index];
+        const lastLap = trace.x.length ? trace.x[trace.x.length - 1] : 0;
+        const laps = [];
+        const positions = [];
+        driver.laps.forEach((lap, i) => {
+            if (lap > lastLap) {
+                laps.push(lap);
+                positions.push(driver.positions[i]);
+            }
+        });
+        if (laps.length) Plotly.extendTraces(chart, { x: [laps], y: [positions] }, [index]);
+    });
+}
+
 // Функция для загрузки логотипов команд 
 function loadTeamLogos() {
     const logosContainer = document.getElementById('team-logos');
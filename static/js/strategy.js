@@ -2,13 +2,8 @@ function loadTyreStrategy(year, event) {
     console.log('Загрузка стратегии по шинам:', event, year);
     const loader = showLoading('tyre-strategy-chart', 'normal');
     
-    fetch('/tyre_strategy', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/x-www-form-urlencoded',
-        },
-        body: 'year=' + encodeURIComponent(year) + '&event=' + encodeURIComponent(event)
-    })
+    fetchRaceData('/tyre_strategy?year=' + encodeURIComponent(year) + '&event=' + encodeURIComponent(event),
+                  ['tyre-strategy-chart'])
     .then(response => {
         if (!response.ok) {
             throw new Error('Ошибка сети');
@@ -31,7 +26,23 @@ function loadTyreStrategy(year, event) {
     });
 }
 
+let currentStrategyData = [];
+
+function applyStrategyDelta(drivers) {
+    // Живой режим: стинты затронутых пилотов заменяются целиком
+    drivers.forEach(driver => {
+        const index = currentStrategyData.findIndex(entry => entry.driver === driver.driver);
+        if (index < 0) {
+            currentStrategyData.push(driver);
+        } else {
+            currentStrategyData[index] = driver;
+        }
+    });
+    renderTyreStrategyChart(currentStrategyData);
+}
+
 function renderTyreStrategyChart(strategyData) {
+    currentStrategyData = strategyData || [];
     const container = document.getElementById('tyre-strategy-chart');
     if (!container) {
         console.error('Контейнер tyre-strategy-chart не найден');
@@ -136,13 +147,8 @@ function loadPitstopAnalysis(year, event) {
     console.log('Загрузка анализа пит-стопов:', event, year);
     const loader = showLoading('pitstop-chart', 'normal');
     
-    fetch('/pitstop_analysis', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/x-www-form-urlencoded',
-        },
-        body: 'year=' + encodeURIComponent(year) + '&event=' + encodeURIComponent(event)
-    })
+    fetchRaceData('/pitstop_analysis?year=' + encodeURIComponent(year) + '&event=' + encodeURIComponent(event),
+                  ['pitstop-chart'])
     .then(response => {
         if (!response.ok) {
             throw new Error('Ошибка сети');
@@ -184,11 +190,24 @@ function renderPitstopAnalysisChart(data) {
                     <div class="summary-label">Всего пит-стопов</div>
                     <div class="summary-value">${data.total_pitstops}</div>
                 </div>
+    `;
+    
+    if (data.untimed_pitstops) {
+        html += `
+                <div class="summary-item">
+                    <div class="summary-label">Без данных о времени</div>
+                    <div class="summary-value">${data.untimed_pitstops}</div>
+                </div>
+        `;
+    }
+    
+    html += `
             </div>
     `;
     
-    // Сортируем команды по среднему времени пит-стопа
+    // Сортируем команды по среднему времени пит-стопа (команды без данных о времени не показываем)
     const teams = Object.entries(data.teams)
+        .filter(([, team]) => team.avg_time !== null && team.avg_time !== undefined)
         .sort(([, a], [, b]) => a.avg_time - b.avg_time);
     
     // Отображаем топ-5 команд
@@ -228,6 +247,9 @@ function renderPitstopAnalysisChart(data) {
                 // Группируем остановки по гонщикам
                 const driverTimes = {};
                 teamData.stops.forEach(stop => {
+                    if (stop.time === null || stop.time === undefined) {
+                        return;
+                    }
                     if (!driverTimes[stop.driver]) {
                         driverTimes[stop.driver] = [];
                     }
@@ -3,13 +3,8 @@ function loadTrackStats(year, event) {
     const loaderTrackStats = showLoading('track-stats', 'normal');
     const loaderTrackVis = showLoading('track-visualization', 'large'); // Большой лоадер для трассы
 
-    fetch('/track_stats', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/x-www-form-urlencoded',
-        },
-        body: 'year=' + encodeURIComponent(year) + '&event=' + encodeURIComponent(event)
-    })
+    fetchRaceData('/track_stats?year=' + encodeURIComponent(year) + '&event=' + encodeURIComponent(event),
+                  ['track-stats', 'track-visualization'])
     .then(response => {
         if (!response.ok) {
             throw new Error('Ошибка сети');
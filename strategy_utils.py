@@ -1,40 +1,36 @@
 import fastf1 as f1
 import pandas as pd
-import json
 from datetime import datetime
 from database import TyreStrategy, CacheStatus, db, PitstopData
+from cache_utils import update_cache_status
+from bulk_write import mark_cache_status, replace_race_rows
+from packed_arrays import pack_stints
+from server_timing import timed
 
+def tyre_strategy_rows(strategy_data):
+    """Строки TyreStrategy из данных стратегии (без year/event)"""
+    return [{'driver_code': driver_data['driver'], 'stints_packed': pack_stints(driver_data['stints'] or []),
+             'stints_json': None}
+            for driver_data in strategy_data]
+
+@timed('db_save')
 def save_tyre_strategy_to_db(year, event, strategy_data):
     """Сохраняет данные стратегии по шинам"""
     try:
         print(f"Сохраняем стратегию {event} {year} в PostgreSQL...")
         
-        # Удаляем старые данные
-        TyreStrategy.query.filter_by(year=year, event=event).delete()
-        
-        # Сохраняем новые данные
-        for driver_data in strategy_data:
-            tyre_strategy = TyreStrategy(
-                year=year,
-                event=event,
-                driver_code=driver_data['driver'],
-                stints=driver_data['stints']
-            )
-            db.session.add(tyre_strategy)
-        
-        # Обновляем статус кэша
-        from app import update_cache_status
-        update_cache_status('tyre_strategy', year, event, True)
-        
+        # Строки и статус кэша пишутся одной транзакцией
+        replace_race_rows(TyreStrategy, year, event, tyre_strategy_rows(strategy_data))
+        mark_cache_status(['tyre_strategy'], year, event)
         db.session.commit()
         print(f"Стратегия {event} {year} сохранена в PostgreSQL")
         
     except Exception as e:
         db.session.rollback()
         print(f"Ошибка сохранения стратегии: {e}")
-        from app import update_cache_status
         update_cache_status('tyre_strategy', year, event, False)
 
+@timed('db_read')
 def get_tyre_strategy_from_db(year, event):
     """Получает данные стратегии из БД"""
     strategy_data = TyreStrategy.query.filter_by(year=year, event=event).all()
@@ -52,292 +48,239 @@ def get_tyre_strategy_from_db(year, event):
     
     return data
 
+def stint_runs(laps):
+    """
+    Разбивает круги на непрерывные отрезки на одном составе шин.
+
+    Круги один раз сортируются по гонщику (в порядке первого появления)
+    и номеру круга, границы отрезков находятся сравнением со сдвинутыми
+    столбцами, а начало и длина каждого отрезка считаются одним groupby.
+    Пропуски состава считаются 'UNKNOWN', пропуски номера стенда - 1.
+    """
+    frame = pd.DataFrame({
+        'Driver': laps['Driver'].to_numpy(),
+        'DriverNumber': laps['DriverNumber'].to_numpy() if 'DriverNumber' in laps.columns else None,
+        'LapNumber': laps['LapNumber'].to_numpy(),
+        'Compound': laps['Compound'].fillna('UNKNOWN').to_numpy(),
+        'Stint': laps['Stint'].fillna(1).to_numpy()
+    })
+    frame['DriverOrder'] = pd.factorize(frame['Driver'])[0]
+    frame = frame.sort_values(['DriverOrder', 'LapNumber'], kind='mergesort')
+
+    boundary = ((frame['DriverOrder'] != frame['DriverOrder'].shift())
+                | (frame['Stint'] != frame['Stint'].shift())
+                | (frame['Compound'] != frame['Compound'].shift()))
+
+    runs = frame.groupby(boundary.cumsum(), sort=False).agg(
+        driver=('Driver', 'first'),
+        driver_number=('DriverNumber', 'first'),
+        compound=('Compound', 'first'),
+        start_lap=('LapNumber', 'first'),
+        stint_length=('LapNumber', 'size')
+    )
+    runs['end_lap'] = runs['start_lap'] + runs['stint_length'] - 1
+    return runs.reset_index(drop=True)
+
+def _driver_abbreviations(session):
+    """Аббревиатуры гонщиков сессии по номеру (один проход по результатам)"""
+    try:
+        results = session.results
+        return dict(zip(results['DriverNumber'].tolist(), results['Abbreviation'].tolist()))
+    except Exception:
+        return {}
+
+@timed('tyre_strategy')
+def build_tyre_strategy(session):
+    """
+    Стратегии по шинам из сессии FastF1 [{'driver', 'stints', 'total_laps'}].
+
+    Ошибки не перехватывает: конвейер загрузки и заполнение кэша
+    отличают сбой от гонки без данных.
+    """
+    if session.laps is None or session.laps.empty:
+        print("Нет данных кругов для стратегии")
+        return []
+
+    laps = session.laps
+
+    # Проверяем наличие нужных колонок
+    if 'Compound' not in laps.columns or 'Stint' not in laps.columns:
+        print("Нет колонок Compound или Stint")
+        return []
+
+    runs = stint_runs(laps)
+
+    abbreviations = _driver_abbreviations(session)
+
+    # Собираем данные стратегии для каждого гонщика (отрезки уже идут по гонщикам подряд)
+    strategy_data = []
+    current_driver = None
+    for driver, driver_number, compound, start_lap, stint_length, end_lap in zip(
+            runs['driver'].tolist(), runs['driver_number'].tolist(), runs['compound'].tolist(),
+            runs['start_lap'].tolist(), runs['stint_length'].tolist(), runs['end_lap'].tolist()):
+        if driver != current_driver:
+            current_driver = driver
+            strategy_data.append({
+                'driver': abbreviations.get(driver_number, driver) if driver_number else driver,
+                'stints': [],
+                'total_laps': 0
+            })
+        strategy_data[-1]['stints'].append({
+            'compound': compound,
+            'stint_length': stint_length,
+            'start_lap': start_lap,
+            'end_lap': end_lap
+        })
+        strategy_data[-1]['total_laps'] += stint_length
+
+    print(f"Собрано стратегий: {len(strategy_data)}, стендов: {len(runs)}")
+    return strategy_data
+
 def extract_tyre_strategy(session):
-    """Извлекает данные стратегии по шинам из сессии FastF1"""
+    """Извлекает данные стратегии по шинам из сессии FastF1; при ошибке возвращает []"""
     try:
-        print(f"DEBUG: Извлечение стратегии из FastF1")
-        
-        if session.laps is None or session.laps.empty:
-            print("DEBUG: Нет данных кругов")
-            return []
-        
-        laps = session.laps
-        print(f"DEBUG: Всего кругов: {len(laps)}")
-        print(f"DEBUG: Уникальные гонщики: {laps['Driver'].unique()}")
-        
-        # Проверяем наличие нужных колонок
-        if 'Compound' not in laps.columns or 'Stint' not in laps.columns:
-            print("DEBUG: Нет колонок Compound или Stint")
-            return []
-        
-        # Получаем уникальных гонщиков
-        drivers = laps['Driver'].unique()
-        print(f"DEBUG: Найдено гонщиков: {len(drivers)}")
-        
-        # Собираем данные стратегии для каждого гонщика
-        strategy_data = []
-        
-        for driver in drivers:
-            # Получаем круги гонщика
-            driver_laps = laps[laps['Driver'] == driver].copy()
-            
-            if driver_laps.empty:
-                continue
-            
-            # Сортируем по номеру круга
-            driver_laps = driver_laps.sort_values('LapNumber')
-            
-            # Группируем по стендам и составу
-            stints = []
-            current_stint = None
-            current_compound = None
-            stint_start_lap = 0
-            stint_length = 0
-            
-            for idx, lap in driver_laps.iterrows():
-                lap_num = lap['LapNumber']
-                compound = lap['Compound'] if pd.notna(lap['Compound']) else 'UNKNOWN'
-                stint = lap['Stint'] if pd.notna(lap['Stint']) else 1
-                
-                # Если это первый круг или сменился стенд/состав
-                if current_stint is None or stint != current_stint or compound != current_compound:
-                    # Сохраняем предыдущий стенд если он есть
-                    if current_stint is not None and stint_length > 0:
-                        stints.append({
-                            'compound': current_compound,
-                            'stint_length': stint_length,
-                            'start_lap': stint_start_lap,
-                            'end_lap': stint_start_lap + stint_length - 1
-                        })
-                    
-                    # Начинаем новый стенд
-                    current_stint = stint
-                    current_compound = compound
-                    stint_start_lap = lap_num
-                    stint_length = 1
-                else:
-                    # Продолжаем текущий стенд
-                    stint_length += 1
-            
-            # Добавляем последний стенд
-            if current_stint is not None and stint_length > 0:
-                stints.append({
-                    'compound': current_compound,
-                    'stint_length': stint_length,
-                    'start_lap': stint_start_lap,
-                    'end_lap': stint_start_lap + stint_length - 1
-                })
-            
-            # Получаем аббревиатуру гонщика из сессии
-            try:
-                # Ищем номер гонщика
-                driver_number = driver_laps['DriverNumber'].iloc[0] if 'DriverNumber' in driver_laps.columns else None
-                if driver_number:
-                    driver_info = session.get_driver(driver_number)
-                    driver_abbr = driver_info["Abbreviation"]
-                else:
-                    driver_abbr = driver
-            except Exception:
-                driver_abbr = driver
-
-            if stints:
-                total_laps = sum(stint['stint_length'] for stint in stints)
-                print(f"DEBUG: Гонщик {driver_abbr}: {len(stints)} стендов, {total_laps} кругов")
-                
-                strategy_data.append({
-                    'driver': driver_abbr,
-                    'stints': stints,
-                    'total_laps': total_laps
-                })
-        
-        print(f"DEBUG: Собрано стратегий: {len(strategy_data)}")
-        
-        # Отладочный вывод первых 3 стратегий
-        for i, data in enumerate(strategy_data[:3]):
-            print(f"DEBUG: Стратегия {i+1} - {data['driver']}:")
-            for stint in data['stints']:
-                print(f"  - {stint['compound']}: круги {stint['start_lap']}-{stint['end_lap']} ({stint['stint_length']}L)")
-        
-        return strategy_data
-        
+        return build_tyre_strategy(session)
     except Exception as e:
         print(f"Ошибка извлечения стратегии: {e}")
         import traceback
         traceback.print_exc()
         return []
 
+def detect_pitstops(laps, group_by=('Driver',)):
+    """
+    Находит пит-стопы по смене стенда между соседними кругами.
+
+    Круги один раз сортируются по group_by и номеру круга; предыдущий
+    круг того же гонщика берется сдвигом, поэтому круг въезда (PitInTime)
+    сопоставляется с кругом выезда (PitOutTime) без поиска, а время на
+    пит-лейне считается сразу для всех остановок. Если одного из времен
+    нет, pitstop_time остается пустым (NaN), а timing_missing = True.
+    Чтобы обработать сразу несколько гонок, передайте таблицу кругов с
+    дополнительным столбцом и group_by=('EventName', 'Driver').
+    """
+    keys = list(group_by)
+    missing_times = pd.Series(pd.NaT, index=laps.index)
+    frame = pd.DataFrame({key: laps[key] for key in keys})
+    frame['SortLap'] = laps['LapNumber']
+    frame['LapNumber'] = laps['LapNumber'].fillna(0).astype(int)
+    frame['Stint'] = laps['Stint'].fillna(1).astype(int)
+    frame['Team'] = laps['Team'] if 'Team' in laps.columns else None
+    frame['Compound'] = laps['Compound']
+    frame['PitInTime'] = laps['PitInTime'] if 'PitInTime' in laps.columns else missing_times
+    frame['PitOutTime'] = laps['PitOutTime'] if 'PitOutTime' in laps.columns else missing_times
+    frame = frame.sort_values(keys + ['SortLap'], kind='mergesort')
+
+    previous = frame.shift()
+    same_driver = pd.Series(True, index=frame.index)
+    for key in keys:
+        same_driver &= frame[key] == previous[key]
+
+    stops = frame[same_driver & (frame['Stint'] != previous['Stint'])].copy()
+    in_laps = previous.loc[stops.index]
+
+    # Время на пит-лейне: от въезда на предыдущем круге до выезда на круге смены стенда
+    consecutive = in_laps['LapNumber'] == stops['LapNumber'] - 1
+    # Как и Timedelta.total_seconds(), с точностью до микросекунд
+    duration = (stops['PitOutTime'] - in_laps['PitInTime']).dt.floor('us').dt.total_seconds()
+    stops['pitstop_time'] = duration.where(consecutive)
+    stops['timing_missing'] = stops['pitstop_time'].isna()
+    stops['from_stint'] = in_laps['Stint'].astype(int)
+
+    stops['Team'] = stops['Team'].where(stops['Team'].notna(), 'Unknown').astype(str)
+    stops['Compound'] = stops['Compound'].where(stops['Compound'].notna(), 'UNKNOWN').astype(str)
+    return stops.drop(columns=['SortLap', 'PitInTime', 'PitOutTime']).reset_index(drop=True)
+
+def _pitstop_records(stops):
+    """Строки таблицы пит-стопов в формате PitstopData, по возрастанию круга"""
+    records = [
+        {
+            'driver': str(driver),
+            'team': team,
+            'lap': lap,
+            'pitstop_time': None if pd.isna(pitstop_time) else pitstop_time,
+            'compound': compound,
+            'stint': stint
+        }
+        for driver, team, lap, pitstop_time, compound, stint in zip(
+            stops['Driver'].tolist(), stops['Team'].tolist(), stops['LapNumber'].tolist(),
+            stops['pitstop_time'].tolist(), stops['Compound'].tolist(), stops['Stint'].tolist()
+        )
+    ]
+    records.sort(key=lambda x: x['lap'])
+    return records
+
+@timed('pitstops')
+def build_pitstop_data(session):
+    """
+    Пит-стопы из сессии FastF1 без перехвата ошибок (см. build_tyre_strategy).
+
+    У остановок без PitInTime/PitOutTime pitstop_time равно None: такие
+    остановки учитываются в количестве, но не в среднем времени.
+    """
+    if session.laps is None or session.laps.empty or 'Stint' not in session.laps.columns:
+        print("Нет данных кругов для пит-стопов")
+        return []
+
+    stops = detect_pitstops(session.laps)
+    pitstop_data = _pitstop_records(stops)
+
+    print(f"Найдено пит-стопов: {len(pitstop_data)}, "
+          f"без данных о времени: {int(stops['timing_missing'].sum())}")
+    return pitstop_data
+
 def get_pitstop_data(session):
-    """Извлекает данные пит-стопов из сессии FastF1"""
+    """Извлекает данные пит-стопов из сессии FastF1; при ошибке возвращает []"""
     try:
-        print(f"Извлечение пит-стопов для {session.event['EventName']}")
-        
-        if session.laps is None or session.laps.empty:
-            print("Нет данных кругов")
-            return []
-        
-        laps = session.laps
-        pitstop_data = []
-        
-        print(f"Всего кругов в сессии: {len(laps)}")
-        print(f"Уникальные гонщики: {laps['Driver'].unique()}")
-        
-        # Ищем круги с PitOutTime (выезд из пит-лейна)
-        print("\nПоиск пит-стопов по PitOutTime...")
-        if 'PitOutTime' in laps.columns:
-            pit_out_laps = laps[laps['PitOutTime'].notna()].copy()
-            print(f"Найдено кругов с PitOutTime: {len(pit_out_laps)}")
-            
-            if not pit_out_laps.empty:
-                # Покажем несколько примеров
-                print("Примеры кругов с PitOutTime:")
-                for idx, lap in pit_out_laps.head(5).iterrows():
-                    print(f"  Гонщик: {lap['Driver']}, Круг: {lap['LapNumber']}, PitOutTime: {lap['PitOutTime']}")
-        
-        # Ищем круги с PitInTime (въезд в пит-лейн)
-        print("\nПоиск пит-стопов по PitInTime...")
-        if 'PitInTime' in laps.columns:
-            pit_in_laps = laps[laps['PitInTime'].notna()].copy()
-            print(f"Найдено кругов с PitInTime: {len(pit_in_laps)}")
-            
-            if not pit_in_laps.empty:
-                print("Примеры кругов с PitInTime:")
-                for idx, lap in pit_in_laps.head(5).iterrows():
-                    print(f"  Гонщик: {lap['Driver']}, Круг: {lap['LapNumber']}, PitInTime: {lap['PitInTime']}")
-        
-        # Находим пит-стопы по смене стендов (Stint)
-        print("\nПоиск пит-стопов по смене стендов (Stint)...")
-        
-        if 'Stint' in laps.columns:
-            # Для каждого гонщика
-            for driver in sorted(laps['Driver'].unique()):
-                driver_laps = laps[laps['Driver'] == driver].copy()
-                driver_laps = driver_laps.sort_values('LapNumber')
-                
-                print(f"\nГонщик {driver}:")
-                print(f"  Всего кругов: {len(driver_laps)}")
-                print(f"  Стенды: {sorted(driver_laps['Stint'].dropna().unique())}")
-                
-                # Создаем список стендов
-                stints = []
-                for _, lap in driver_laps.iterrows():
-                    stint_num = int(lap['Stint']) if pd.notna(lap['Stint']) else 1
-                    lap_num = int(lap['LapNumber']) if pd.notna(lap['LapNumber']) else 0
-                    stints.append((lap_num, stint_num))
-                
-                # Находим смены стендов (пит-стопы)
-                pitstops_for_driver = []
-                prev_stint = None
-                pitstop_lap = None
-                
-                for lap_num, stint_num in stints:
-                    if prev_stint is not None and stint_num != prev_stint:
-                        # Нашли смену стенда на этом круге
-                        pitstop_lap = lap_num
-                        
-                        pitstop_time_seconds = 2.5  # значение по умолчанию
-                        
-                        # Пробуем найти реальное время
-                        pit_lap_data = driver_laps[driver_laps['LapNumber'] == lap_num]
-                        if not pit_lap_data.empty:
-                            pit_lap = pit_lap_data.iloc[0]
-                            
-                            # Если есть PitInTime и PitOutTime на предыдущем/следующем круге
-                            if pd.notna(pit_lap.get('PitOutTime')):
-                                # Это круг выезда из пит-лейна
-                                # Ищем круг въезда
-                                in_lap_num = lap_num - 1
-                                in_lap_data = driver_laps[driver_laps['LapNumber'] == in_lap_num]
-                                
-                                if not in_lap_data.empty:
-                                    in_lap = in_lap_data.iloc[0]
-                                    if pd.notna(in_lap.get('PitInTime')) and pd.notna(pit_lap.get('PitOutTime')):
-                                        try:
-                                            pitstop_time = pit_lap['PitOutTime'] - in_lap['PitInTime']
-                                            pitstop_time_seconds = pitstop_time.total_seconds()
-                                            print(f"  Найден пит-стоп: круг {in_lap_num}->{lap_num}, время: {pitstop_time_seconds:.2f}с")
-                                        except Exception:
-                                            pass
-
-                        pitstops_for_driver.append({
-                            'lap': pitstop_lap,
-                            'from_stint': prev_stint,
-                            'to_stint': stint_num,
-                            'time': pitstop_time_seconds
-                        })
-                        
-                        print(f"  Пит-стоп: круг {pitstop_lap}, стенд {prev_stint}->{stint_num}")
-                    
-                    prev_stint = stint_num
-                
-                # Сохраняем данные для этого гонщика
-                for pitstop in pitstops_for_driver:
-                    # Находим данные для этого круга
-                    lap_data = driver_laps[driver_laps['LapNumber'] == pitstop['lap']]
-                    if not lap_data.empty:
-                        lap_row = lap_data.iloc[0]
-                        
-                        pitstop_data.append({
-                            'driver': str(driver),
-                            'team': str(lap_row['Team']) if 'Team' in lap_row and pd.notna(lap_row['Team']) else 'Unknown',
-                            'lap': int(pitstop['lap']),
-                            'pitstop_time': pitstop['time'],
-                            'compound': str(lap_row['Compound']) if pd.notna(lap_row['Compound']) else 'UNKNOWN',
-                            'stint': int(pitstop['to_stint'])
-                        })
-        
-        print(f"\nИтого найдено пит-стопов: {len(pitstop_data)}")
-        
-        if pitstop_data:
-            print("\nСписок найденных пит-стопов:")
-            for stop in pitstop_data:
-                print(f"  {stop['driver']} ({stop['team']}): круг {stop['lap']}, {stop['pitstop_time']:.2f}с, стенд {stop['stint']}")
-        
-        # Сортируем по кругу
-        pitstop_data.sort(key=lambda x: x['lap'])
-        
-        return pitstop_data
-        
+        return build_pitstop_data(session)
     except Exception as e:
         print(f"Ошибка извлечения пит-стопов: {e}")
         import traceback
         traceback.print_exc()
         return []
 
+def get_season_pitstop_data(sessions):
+    """Пит-стопы нескольких гонок за один проход: {EventName: [пит-стопы]}"""
+    frames = []
+    for session in sessions:
+        if session.laps is not None and not session.laps.empty and 'Stint' in session.laps.columns:
+            frames.append(pd.DataFrame(session.laps).assign(EventName=session.event['EventName']))
+    if not frames:
+        return {}
+    
+    stops = detect_pitstops(pd.concat(frames, ignore_index=True), group_by=('EventName', 'Driver'))
+    season = {session.event['EventName']: [] for session in sessions}
+    for event, event_stops in stops.groupby('EventName', sort=False):
+        season[event] = _pitstop_records(event_stops)
+    return season
+
+def pitstop_rows(pitstop_data):
+    """Строки PitstopData из списка пит-стопов (без year/event)"""
+    return [{
+        'driver_code': pitstop['driver'],
+        'team': pitstop['team'],
+        'lap': pitstop['lap'],
+        'pitstop_time': pitstop['pitstop_time'],
+        'compound': pitstop['compound'],
+        'stint': pitstop['stint']
+    } for pitstop in pitstop_data]
+
+@timed('db_save')
 def save_pitstop_data_to_db(year, event, pitstop_data):
     """Сохраняет данные пит-стопов в таблицу PitstopData"""
     try:
         print(f"Сохраняем пит-стопы {event} {year} в PostgreSQL...")
         
-        # Удаляем старые данные
-        PitstopData.query.filter_by(year=year, event=event).delete()
-        
-        # Сохраняем новые данные
-        for pitstop in pitstop_data:
-            pitstop_entry = PitstopData(
-                year=year,
-                event=event,
-                driver_code=pitstop['driver'],
-                team=pitstop['team'],
-                lap=pitstop['lap'],
-                pitstop_time=pitstop['pitstop_time'],
-                compound=pitstop['compound'],
-                stint=pitstop['stint']
-            )
-            db.session.add(pitstop_entry)
-        
-        # Обновляем статус кэша
-        from app import update_cache_status
-        update_cache_status('pitstop_data', year, event, True)
-        
+        replace_race_rows(PitstopData, year, event, pitstop_rows(pitstop_data))
+        mark_cache_status(['pitstop_data'], year, event)
         db.session.commit()
         print(f"Пит-стопы {event} {year} сохранены в PostgreSQL")
         
     except Exception as e:
         db.session.rollback()
         print(f"Ошибка сохранения пит-стопов: {e}")
-        from app import update_cache_status
         update_cache_status('pitstop_data', year, event, False)
 
+@timed('db_read')
 def get_pitstop_data_from_db(year, event):
     """Получает данные пит-стопов из БД"""
     pitstop_entries = PitstopData.query.filter_by(year=year, event=event).all()
@@ -358,3 +301,73 @@ def get_pitstop_data_from_db(year, event):
         })
     
     return data
+
+@timed('pitstop_analysis')
+def analyze_pitstop_data(pitstop_data):
+    """
+    Анализирует данные пит-стопов.
+
+    Остановки без данных о времени (pitstop_time = None) входят в
+    total_stops и untimed_stops, но не в total_time и avg_time.
+    """
+    team_analysis = {}
+    driver_analysis = {}
+    untimed = 0
+    
+    for pitstop in pitstop_data:
+        team = pitstop['team']
+        driver = pitstop['driver']
+        pitstop_time = pitstop['pitstop_time']
+        
+        # Анализ по командам
+        if team not in team_analysis:
+            team_analysis[team] = {
+                'total_stops': 0,
+                'timed_stops': 0,
+                'untimed_stops': 0,
+                'total_time': 0,
+                'avg_time': None,
+                'stops': []
+            }
+        
+        team_analysis[team]['total_stops'] += 1
+        if pitstop_time is None:
+            team_analysis[team]['untimed_stops'] += 1
+            untimed += 1
+        else:
+            team_analysis[team]['timed_stops'] += 1
+            team_analysis[team]['total_time'] += pitstop_time
+        team_analysis[team]['stops'].append({
+            'driver': driver,
+            'time': pitstop_time,
+            'lap': pitstop['lap']
+        })
+        
+        # Анализ по гонщикам
+        if driver not in driver_analysis:
+            driver_analysis[driver] = {
+                'team': team,
+                'total_stops': 0,
+                'stops': []
+            }
+        
+        driver_analysis[driver]['total_stops'] += 1
+        driver_analysis[driver]['stops'].append({
+            'time': pitstop_time,
+            'lap': pitstop['lap'],
+            'compound': pitstop['compound']
+        })
+    
+    # Рассчитываем среднее время для команд по остановкам с известным временем
+    for team in team_analysis:
+        if team_analysis[team]['timed_stops'] > 0:
+            team_analysis[team]['avg_time'] = (
+                team_analysis[team]['total_time'] / team_analysis[team]['timed_stops']
+            )
+    
+    return {
+        'teams': team_analysis,
+        'drivers': driver_analysis,
+        'total_pitstops': len(pitstop_data),
+        'untimed_pitstops': untimed
+    }
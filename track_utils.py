@@ -1,88 +1,340 @@
-import fastf1 as f1
+import threading
+import time
+import warnings
+import weakref
 import pandas as pd
 import numpy as np
 import json
 from datetime import datetime
 from collections import Counter
+from fixture_store import FixtureSession
+from session_registry import get_session
+from schedule_store import schedule_store
+from circuit_geometry import circuit_geometry_store
+from server_timing import timed
 
-def get_track_stats(year, event):
-    """Получает статистику трассы"""
+# Режимы загрузки телеметрии для карты трассы:
+# 'fastest_lap' - только позиции машины на опорном круге, 'full' - вся телеметрия сессии
+TELEMETRY_MODES = ('fastest_lap', 'full')
+_telemetry_mode = 'fastest_lap'
+
+def set_telemetry_mode(mode):
+    """Задает режим загрузки телеметрии по умолчанию"""
+    global _telemetry_mode
+    if mode not in TELEMETRY_MODES:
+        raise ValueError(f"Неизвестный режим телеметрии: {mode}")
+    _telemetry_mode = mode
+
+class TelemetryLoadStats:
+    """
+    Сколько времени и памяти уходит на телеметрию трассы в каждом режиме.
+
+    В режиме 'fastest_lap' экономия считается по каждой загрузке: байты -
+    часть потока позиций, которая не попала в срез круга (телеметрия машины
+    не загружается вовсе, так что это нижняя оценка), время - загрузка
+    потока, которой избежали повторные обращения к той же сессии.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes = {}
+
+    def record(self, mode, seconds, telemetry_bytes, skipped_bytes=0, stream_seconds=0.0, stream_reused=False):
+        with self._lock:
+            stats = self._modes.setdefault(mode, {
+                'loads': 0, 'seconds': 0.0, 'telemetry_bytes': 0, 'skipped_bytes': 0,
+                'stream_fetches': 0, 'stream_seconds': 0.0, 'stream_reuses': 0
+            })
+            stats['loads'] += 1
+            stats['seconds'] += seconds
+            stats['telemetry_bytes'] += telemetry_bytes
+            stats['skipped_bytes'] += skipped_bytes
+            if stream_reused:
+                stats['stream_reuses'] += 1
+            elif stream_seconds:
+                stats['stream_fetches'] += 1
+                stats['stream_seconds'] += stream_seconds
+
+    def snapshot(self):
+        """Средние значения по режимам и экономия режима 'fastest_lap'"""
+        with self._lock:
+            result = {}
+            for mode, stats in self._modes.items():
+                loads = stats['loads']
+                result[mode] = dict(stats,
+                                    avg_seconds=stats['seconds'] / loads,
+                                    avg_telemetry_bytes=stats['telemetry_bytes'] / loads)
+        lazy = result.get('fastest_lap')
+        if lazy:
+            fetches = lazy['stream_fetches']
+            avg_fetch = lazy['stream_seconds'] / fetches if fetches else 0.0
+            result['saved'] = {
+                'bytes_per_load': lazy['skipped_bytes'] / lazy['loads'],
+                'seconds_per_load': avg_fetch * lazy['stream_reuses'] / lazy['loads']
+            }
+            if 'full' in result:
+                full = result['full']
+                result['saved']['vs_full'] = {
+                    'seconds_per_load': full['avg_seconds'] - lazy['avg_seconds'],
+                    'bytes_per_load': full['avg_telemetry_bytes'] - lazy['avg_telemetry_bytes']
+                }
+        return result
+
+telemetry_load_stats = TelemetryLoadStats()
+
+@timed('track_stats')
+def get_track_stats(year, event, driver=None, mode=None):
+    """
+    Получает статистику трассы.
+
+    Если геометрия площадки (в той же версии конфигурации) уже
+    сохранена по другому сезону, статистика собирается из нее без
+    загрузки сессии. Иначе в режиме 'fastest_lap' сессия загружается
+    без телеметрии (ее обычно уже держит реестр для других разделов),
+    а для карты читаются только позиции машины на опорном круге:
+    самом быстром или лучшем круге пилота driver.
+    """
+    mode = mode or _telemetry_mode
+    full = mode == 'full'
     try:
         print(f"Загрузка статистики трассы для {event} {year}...")
+        start = time.perf_counter()
+        
+        # Получаем информацию о трассе из расписания (без него статистика строится по сессии)
+        try:
+            event_info = schedule_store.get_event(year, event)
+        except Exception as e:
+            print(f"Не удалось получить расписание для {event} {year}: {e}")
+            event_info = None
+        
+        # Карта конкретного пилота зависит от его круга, общая геометрия для нее не подходит
+        if driver is None:
+            geometry = circuit_geometry_store.lookup(year, event_info)
+            if geometry:
+                print(f"Геометрия трассы {event} {year} взята из "
+                      f"{geometry['source_event']} {geometry['source_year']}")
+                return build_track_stats_from_geometry(year, event, event_info, geometry)
         
         # Загружаем данные текущей гонки
         try:
-            session = f1.get_session(year, event, 'R')
-            session.load(telemetry=True, laps=True, weather=False)
+            session = get_session(year, event, 'R', laps=True, telemetry=full)
         except Exception:
             try:
-                session = f1.get_session(year, event, 'Q')
-                session.load(telemetry=True, laps=True, weather=False)
+                session = get_session(year, event, 'Q', laps=True, telemetry=full)
             except Exception:
-                session = f1.get_session(year, event, 'FP3')
-                session.load(telemetry=True, laps=True, weather=False)
-        
-        # Получаем информацию о трассе из расписания
-        schedule = f1.get_event_schedule(year)
-        event_info = schedule[schedule['EventName'] == event]
-        
-        if not event_info.empty:
-            event_info = event_info.iloc[0]
-            track_info = {
-                'name': str(event_info.get('OfficialEventName', event)),
-                'country': str(event_info.get('Country', 'Unknown')),
-                'location': str(event_info.get('Location', 'Unknown')),
-                'event_name': str(event)
-            }
-        else:
-            track_info = {
-                'name': str(event),
-                'country': 'Unknown',
-                'location': 'Unknown',
-                'event_name': str(event)
-            }
-        
-        
-        # Получаем длину трассы
-        circuit_length = get_circuit_length(session)
+                session = get_session(year, event, 'FP3', laps=True, telemetry=full)
         
-        # Получаем количество поворотов
-        turns_count = estimate_turns_count(session)
-        
-        # Получаем координаты трассы
-        coordinates = get_track_coordinates(session)
-        
-        # Собираем всю статистику
-        stats = {
-            'track_info': track_info,
-            'circuit_length': circuit_length,
-            'turns_count': turns_count,
-            'coordinates': coordinates,  
-            'year': year
-        }
-        
-        return convert_to_serializable(stats)
+        report = {}
+        stats = build_track_stats(session, year, event, event_info, driver=driver, mode=mode, report=report)
+        telemetry_load_stats.record(mode, time.perf_counter() - start,
+                                    report.get('telemetry_bytes', 0), report.get('skipped_bytes', 0),
+                                    report.get('stream_seconds', 0.0), report.get('stream_reused', False))
+        if driver is None:
+            circuit_geometry_store.save(year, event, event_info, stats)
+        return stats
         
     except Exception as e:
         print(f"Ошибка в get_track_stats: {e}")
         import traceback
         traceback.print_exc()
 
-def get_track_coordinates(session):
+def _track_info(event, event_info=None):
+    """Описание трассы из записи расписания"""
+    if event_info is not None:
+        return {
+            'name': str(event_info['official_name'] or event),
+            'country': str(event_info['country'] or 'Unknown'),
+            'location': str(event_info['location'] or 'Unknown'),
+            'event_name': str(event)
+        }
+    return {
+        'name': str(event),
+        'country': 'Unknown',
+        'location': 'Unknown',
+        'event_name': str(event)
+    }
+
+def build_track_stats_from_geometry(year, event, event_info, geometry):
+    """Собирает статистику трассы из сохраненной геометрии площадки"""
+    return {
+        'track_info': _track_info(event, event_info),
+        'circuit_length': geometry['circuit_length'] or "Нет данных",
+        'turns_count': geometry['turns_count'] if geometry['turns_count'] is not None else "Нет данных",
+        'coordinates': geometry['coordinates'],
+        'year': year
+    }
+
+def build_track_stats(session, year, event, event_info=None, driver=None, mode=None, report=None):
+    """Считает статистику трассы по загруженной сессии и записи расписания"""
+    track_info = _track_info(event, event_info)
+    
+    # Получаем длину трассы
+    circuit_length = get_circuit_length(session)
+    
+    # Получаем количество поворотов
+    turns_count = estimate_turns_count(session)
+    
+    # Получаем координаты трассы
+    coordinates = get_track_coordinates(session, driver=driver, mode=mode, report=report)
+    
+    # Собираем всю статистику
+    stats = {
+        'track_info': track_info,
+        'circuit_length': circuit_length,
+        'turns_count': turns_count,
+        'coordinates': coordinates,  
+        'year': year
+    }
+    
+    return convert_to_serializable(stats)
+
+def pick_reference_lap(laps, driver=None):
+    """Самый быстрый круг сессии или пилота driver (аббревиатура или номер)"""
+    if driver:
+        laps = laps[(laps['Driver'] == driver) | (laps['DriverNumber'] == str(driver))]
+        if laps.empty:
+            return None
+    return laps.pick_fastest()
+
+def _frames_bytes(frames):
+    return int(sum(frame.memory_usage(deep=True).sum() for frame in frames
+                   if isinstance(frame, pd.DataFrame)))
+
+# Потоки позиций загруженных сессий: живут, пока сессия в памяти (в реестре)
+_position_streams = weakref.WeakKeyDictionary()
+# Загрузки потоков, идущие прямо сейчас: остальные запросы той же сессии ждут их
+_position_stream_loads = weakref.WeakKeyDictionary()
+_position_streams_lock = threading.Lock()
+
+class _StreamLoad:
+    """Загрузка потока позиций одной сессии, которую ждут параллельные запросы"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+def _session_t0_date(session, raw):
+    """
+    Момент нулевого времени сессии. Без телеметрии FastF1 его не
+    считает, поэтому он вычисляется так же, как Session._calculate_t0_date:
+    по самой поздней оценке Date - Time среди пилотов.
+    """
+    try:
+        t0_date = session.t0_date
+    except Exception:
+        t0_date = None
+    if t0_date is not None and pd.notna(t0_date):
+        return t0_date
+    offsets = [(frame['Date'] - frame['Time']).max() for frame in raw.values() if not frame.empty]
+    return max(offsets).round('ms') if offsets else None
+
+def _fetch_position_stream(session):
+    """Загружает и разбирает поток позиций сессии; возвращает (поток, байт в исходном потоке)"""
+    if isinstance(session, FixtureSession):
+        raw = session.position_data()
+    else:
+        from fastf1 import api as f1_api
+        # position_data помечен в FastF1 устаревшим: предупреждение глушится на сам вызов
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            raw = f1_api.position_data(session.api_path)
+
+    t0_date = _session_t0_date(session, raw)
+    stream = {}
+    for number, frame in raw.items():
+        session_time = frame['Date'] - t0_date if t0_date is not None else frame['Time']
+        stream[number] = pd.DataFrame({'SessionTime': session_time.to_numpy(),
+                                       'X': frame['X'].to_numpy(), 'Y': frame['Y'].to_numpy()})
+    return stream, _frames_bytes(raw.values())
+
+def _position_stream(session):
+    """
+    Поток позиций сессии {номер пилота: DataFrame SessionTime, X, Y}.
+
+    Загружается и разбирается один раз на объект сессии: повторные карты
+    (другой пилот, другой круг) берут срез из памяти. Время приводится к
+    времени сессии (Date - t0_date), в котором заданы LapStartTime и Time
+    кругов. Загрузка идет вне общей блокировки: параллельные запросы той же
+    сессии ждут ее, другие сессии не ждут. Возвращает (поток, байт в
+    исходном потоке, секунд на загрузку, взят ли поток из памяти).
+    """
+    with _position_streams_lock:
+        cached = _position_streams.get(session)
+        if cached is not None:
+            return cached[0], cached[1], 0.0, True
+        load = _position_stream_loads.get(session)
+        owner = load is None
+        if owner:
+            load = _position_stream_loads[session] = _StreamLoad()
+
+    if not owner:
+        load.done.wait()
+        if load.error is not None:
+            raise load.error
+        return load.result[0], load.result[1], 0.0, True
+
+    start = time.perf_counter()
+    try:
+        load.result = _fetch_position_stream(session)
+        with _position_streams_lock:
+            _position_streams[session] = load.result
+    except Exception as e:
+        load.error = e
+        raise
+    finally:
+        with _position_streams_lock:
+            _position_stream_loads.pop(session, None)
+        load.done.set()
+    return load.result[0], load.result[1], time.perf_counter() - start, False
+
+def load_lap_positions(session, lap, report=None):
+    """
+    Загружает только позиции машины на одном круге.
+
+    Поток позиций FastF1 загружается один раз на сессию (см.
+    _position_stream), карта берет из него срез одного пилота в окне
+    круга, а поток телеметрии машины (скорость, обороты и т.д.) не
+    загружается вовсе.
+    """
+    stream, raw_bytes, stream_seconds, reused = _position_stream(session)
+    frame = stream.get(str(lap['DriverNumber']))
+    if frame is None:
+        return None
+
+    in_lap = (frame['SessionTime'] >= lap['LapStartTime']) & (frame['SessionTime'] <= lap['Time'])
+    positions = frame.loc[in_lap, ['X', 'Y']].copy()
+
+    if report is not None:
+        report['telemetry_bytes'] = _frames_bytes([positions])
+        report['skipped_bytes'] = raw_bytes - report['telemetry_bytes']
+        report['stream_seconds'] = stream_seconds
+        report['stream_reused'] = reused
+    return positions
+
+@timed('track_telemetry')
+def get_track_coordinates(session, driver=None, mode=None, report=None):
     """Получает координаты трассы из сессии"""
+    mode = mode or _telemetry_mode
     try:
         if session.laps is None or session.laps.empty:
             print("Нет данных кругов для получения координат")
             return []
         
-        # Берем самый быстрый круг
-        fastest_lap = session.laps.pick_fastest()
+        # Берем самый быстрый круг (или лучший круг выбранного пилота)
+        fastest_lap = pick_reference_lap(session.laps, driver)
         if fastest_lap is None:
             print("Не удалось найти самый быстрый круг")
             return []
         
         # Получаем телеметрию
-        telemetry = fastest_lap.get_telemetry()
+        if mode == 'full':
+            telemetry = fastest_lap.get_telemetry()
+            if report is not None:
+                report['telemetry_bytes'] = _frames_bytes(
+                    list(session.car_data.values()) + list(session.pos_data.values()))
+        else:
+            telemetry = load_lap_positions(session, fastest_lap, report)
         if telemetry is None or len(telemetry) < 10:
             print("Недостаточно телеметрии")
             return []
@@ -1,25 +1,32 @@
-import fastf1 as f1
+import numpy as np
 import pandas as pd
 import re
+from datetime import datetime, timezone
+from session_registry import get_session
+from schedule_store import schedule_store
+from server_timing import timed
 
 def get_latest_race():
     """Находит самую последнюю гонку, по которой есть реальные результаты"""
-    for year in range(2025, 2017, -1):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for year in range(now.year, 2017, -1):
         try:
-            schedule = f1.get_event_schedule(year)
-            for i in range(len(schedule)-1, -1, -1):
-                event = schedule.iloc[i]
-                if event['EventName'] == 'Test':
+            schedule = schedule_store.get_schedule(year)
+            for event in reversed(schedule):
+                event_name = event['event_name']
+                if event_name == 'Test':
+                    continue
+                # Гонки, которые еще не состоялись, не загружаем
+                if event['event_date'] is not None and event['event_date'] > now:
                     continue
                 try:
-                    session = f1.get_session(year, event['EventName'], 'R')
-                    session.load(laps=False, telemetry=False, weather=False, messages=False)
+                    session = get_session(year, event_name, 'R', laps=False)
                     if not session.results.empty:
-                        return year, event['EventName']
+                        return year, event_name
                     else:
-                        print(f"Нет результатов для {event['EventName']} {year}")
+                        print(f"Нет результатов для {event_name} {year}")
                 except Exception as e:
-                    print(f"Не удалось загрузить {event['EventName']} {year}: {e}")
+                    print(f"Не удалось загрузить {event_name} {year}: {e}")
                     continue
         except Exception as e:
             print(f"Не удалось получить расписание за {year}: {e}")
@@ -158,12 +165,15 @@ def format_laps_behind(laps):
     else:
         return "DNF" 
 
+# Очки за позиции в гонке
+POINTS_SYSTEM = {
+    1: 25, 2: 18, 3: 15, 4: 12, 5: 10,
+    6: 8, 7: 6, 8: 4, 9: 2, 10: 1
+}
+
 def calculate_points(position, fastest_lap=False, sprint=False):
     """Рассчитывает очки по позиции в гонке"""
-    points_system = {
-        1: 25, 2: 18, 3: 15, 4: 12, 5: 10,
-        6: 8, 7: 6, 8: 4, 9: 2, 10: 1
-    }
+    points_system = POINTS_SYSTEM
     
     # Проверяем, что позиция - число
     if pd.isna(position) or not isinstance(position, (int, float)):
@@ -253,4 +263,65 @@ def get_formatted_time_for_driver(session, position, time_value, driver_number):
         if time_str != 'нет информации':
             return '+' + time_str
         else:
-            return time_str
\ No newline at end of file
+            return time_str
+
+def _results_column(results, name):
+    """Столбец результатов или пустой столбец, если его нет"""
+    if name in results.columns:
+        return results[name]
+    return pd.Series(np.nan, index=results.index, dtype=object)
+
+@timed('results_frame')
+def build_results_frame(session):
+    """
+    Считает таблицу результатов гонки за один проход.
+
+    Максимальный круг каждого пилота берется одним groupby по кругам
+    сессии, а пилот с быстрым кругом, очки и отставание считаются
+    целыми столбцами, поэтому сборка не зависит от числа пилотов
+    умноженного на число кругов. Результат используют и HTML-таблица,
+    и запись в RaceResult.
+    """
+    results = session.results
+    frame = pd.DataFrame({
+        'position': pd.to_numeric(_results_column(results, 'Position'), errors='coerce'),
+        'full_name': _results_column(results, 'FullName'),
+        'driver_number': _results_column(results, 'DriverNumber'),
+        'abbreviation': _results_column(results, 'Abbreviation'),
+        'team': _results_column(results, 'TeamName'),
+        'time': _results_column(results, 'Time')
+    }, index=results.index)
+    
+    # Быстрый круг
+    fastest_driver = get_fastest_lap_driver(session)
+    frame['fastest_lap'] = (frame['abbreviation'] == fastest_driver) & frame['abbreviation'].notna() \
+        if fastest_driver else False
+    
+    # Очки: по позиции и +1 за быстрый круг в топ-10
+    position = frame['position']
+    in_points = position.between(1, 10)
+    frame['points'] = (np.trunc(position).map(POINTS_SYSTEM).fillna(0).astype(int)
+                       + (frame['fastest_lap'] & in_points).astype(int))
+    
+    # Отставание в кругах: лучший круг гонки минус последний круг пилота
+    laps = session.laps
+    if laps is not None and not laps.empty:
+        driver_max_lap = laps.groupby('DriverNumber')['LapNumber'].max()
+        laps_behind = (laps['LapNumber'].max() - frame['driver_number'].map(driver_max_lap)).fillna(0)
+    else:
+        laps_behind = pd.Series(0, index=frame.index)
+    frame['laps_behind'] = laps_behind.where(laps_behind > 0, 0)
+    
+    # Время победителя, круги отставания или отставание по времени
+    gaps = []
+    for place, time_value, behind in zip(position.tolist(), frame['time'].tolist(), frame['laps_behind'].tolist()):
+        if place == 1:
+            gaps.append(format_time(time_value))
+        elif behind > 0:
+            gaps.append(format_laps_behind(behind))
+        else:
+            time_str = format_time(time_value)
+            gaps.append('+' + time_str if time_str != 'нет информации' else time_str)
+    frame['formatted_time'] = gaps
+    
+    return frame
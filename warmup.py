@@ -0,0 +1,131 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+from cache_utils import get_cache_statuses
+from database import db
+from latest_race import get_race_end_times
+from race_bundle import SECTIONS, build_race_bundle
+from schedule_store import schedule_store
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def get_past_events(year):
+    """Этапы сезона, которые уже состоялись"""
+    now = _utcnow()
+    return [event['event_name'] for event in schedule_store.get_schedule(year)
+            if event['event_name'] != 'Test' and event['round_number'] != 0
+            and (event['race_date_utc'] or event['event_date'] or now) <= now]
+
+
+def is_event_warm(year, event):
+    """Все разделы гонки уже есть в кэше БД (без учета срока годности)"""
+    cached = get_cache_statuses(year, event, SECTIONS.values())
+    return set(cached) >= set(SECTIONS.values())
+
+
+def warm_event(app, year, event):
+    """Заполняет кэш всех разделов одной гонки"""
+    with app.app_context():
+        try:
+            start = time.perf_counter()
+            bundle = build_race_bundle(year, event)
+            return {
+                'event': event,
+                'errors': bundle['errors'],
+                'seconds': time.perf_counter() - start
+            }
+        finally:
+            db.session.remove()
+
+
+def warm_season(app, year, events=None, workers=2, force=False):
+    """
+    Прогревает кэш сезона с ограниченным параллелизмом.
+
+    Гонки, у которых все разделы уже сохранены, пропускаются, поэтому
+    прерванный прогрев можно просто запустить заново.
+    """
+    with app.app_context():
+        events = list(events) if events else get_past_events(year)
+        if not force:
+            events = [event for event in events if not is_event_warm(year, event)]
+
+    total = len(events)
+    print(f"Прогрев {year}: {total} гонок, потоков: {workers}")
+    if not total:
+        return []
+
+    reports = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(warm_event, app, year, event): event for event in events}
+        for done, future in enumerate(as_completed(futures), start=1):
+            event = futures[future]
+            try:
+                report = future.result()
+            except Exception as e:
+                report = {'event': event, 'errors': {'bundle': str(e)}, 'seconds': 0}
+            reports.append(report)
+
+            status = 'ошибки: ' + ', '.join(report['errors']) if report['errors'] else 'ok'
+            print(f"[{done}/{total}] {event} {year}: {status} ({report['seconds']:.1f} с)")
+
+    return reports
+
+
+class PrefetchWorker:
+    """
+    Фоновый поток, который прогревает кэш гонки сразу после ее окончания,
+    чтобы пользовательские запросы попадали в готовые данные.
+    """
+
+    def __init__(self, poll_interval=timedelta(minutes=30)):
+        self.poll_interval = poll_interval
+        self._app = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def init_app(self, app, background=True):
+        self._app = app
+        if background and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='prefetch-worker', daemon=True)
+            self._thread.start()
+
+    def _pending_events(self, now):
+        """Недавно закончившиеся гонки, для которых кэш еще не заполнен"""
+        ends = get_race_end_times([now.year - 1, now.year])
+        recent = [(year, event) for year, event, end in ends
+                  if end <= now and now - end < timedelta(days=7)]
+        return [(year, event) for year, event in recent if not is_event_warm(year, event)], ends
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self.poll_interval.total_seconds()
+            try:
+                with self._app.app_context():
+                    now = _utcnow()
+                    pending, ends = self._pending_events(now)
+                    upcoming = [end for _, _, end in ends if end > now]
+                    if upcoming:
+                        wait = min(wait, (upcoming[0] - now).total_seconds())
+                    db.session.remove()
+
+                for year, event in pending:
+                    report = warm_event(self._app, year, event)
+                    status = 'ошибки: ' + ', '.join(report['errors']) if report['errors'] else 'ok'
+                    # Если данные еще не опубликованы, гонка попадет в следующий проход
+                    print(f"Фоновый прогрев {event} {year}: {status} ({report['seconds']:.1f} с)")
+            except Exception as e:
+                print(f"Ошибка фонового прогрева: {e}")
+
+            self._stop.wait(max(wait, 60))
+
+    def stop(self):
+        self._stop.set()
+
+
+prefetch_worker = PrefetchWorker()